@@ -1,27 +1,39 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_socketio import SocketIO, emit, join_room, leave_room
 from flask_cors import CORS
-from flask_jwt_extended import JWTManager, jwt_required, create_access_token, get_jwt_identity
+from flask_jwt_extended import JWTManager
 import os
+import signal
+import sys
 from datetime import datetime, timedelta
-import bcrypt
-import json
-from bson import ObjectId, json_util
 from dotenv import load_dotenv
 
-from database.connection import db
-from models.user import User
-from models.product import Product
-from models.order import Order
-from models.inventory_log import InventoryLog
+from database.connection import db, pool_metrics
+from database.sessions import causal_tokens
+from models.product import Product, product_cache, catalog_cache, category_cache
 from routes.auth import create_auth_blueprint
 from routes.products import create_products_blueprint
 from routes.orders import create_orders_blueprint
 from routes.admin import create_admin_blueprint
-from utils.decorators import role_required
+from realtime.events import EVENT_HANDLERS
+from realtime.emitter import emitter
+from realtime.stock_updates import stock_updates
+from realtime.message_queue import create_client_manager
+from models.inventory_log import log_writer
+from models.order import order_transactions
+from models.idempotency import idempotency_keys, response_cache
+from models.search import search_index
+from utils.metrics import metrics, instrument_flask, metrics_authorized
+from utils.compression import init_compression
+from utils.passwords import password_hasher
 
 load_dotenv()
 
+# 'eventlet' serves Flask-SocketIO under eventlet, 'asgi' serves asgi.py under uvicorn
+SERVER_MODE = os.getenv('SERVER_MODE', 'eventlet')
+# Per-packet Socket.IO/Engine.IO logging, off unless debugging the transport
+SOCKETIO_LOGGING = os.getenv('SOCKETIO_LOGGING', 'false').lower() == 'true'
+
 app = Flask(__name__)
 app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'your-secret-key-change-in-production')
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=24)
@@ -35,19 +47,28 @@ ALLOWED_ORIGINS = os.getenv('ALLOWED_ORIGINS', 'http://localhost:5173').split(',
 CORS(app,
     origins=ALLOWED_ORIGINS,
     supports_credentials=True,
-    allow_headers=["Content-Type", "Authorization"],
+    allow_headers=["Content-Type", "Authorization", "X-Profile", "Idempotency-Key"],
+    expose_headers=["X-Profile-Id", "Idempotent-Replayed"],
     methods=["GET", "POST", "PUT", "DELETE"]
     )
 socketio = SocketIO(
     app,
     cors_allowed_origins=ALLOWED_ORIGINS,
-    async_mode='eventlet',
+    async_mode='eventlet' if SERVER_MODE == 'eventlet' else 'threading',
     ping_timeout=60,
     ping_interval=25,
     max_http_buffer_size=1e8,
-    logger=True,
-    engineio_logger=True
+    logger=SOCKETIO_LOGGING,
+    engineio_logger=SOCKETIO_LOGGING,
+    # Relays emits to clients connected to the other nodes
+    client_manager=create_client_manager()
 )
+emitter.bind(socketio.emit, socketio.start_background_task, socketio.sleep)
+
+# Per-route latency, MongoDB commands per request and on-demand profiling
+instrument_flask(app)
+# gzip/brotli negotiated per request, after the metrics hook so it is timed too
+init_compression(app)
 
 # Register blueprints
 app.register_blueprint(create_auth_blueprint(), url_prefix='/api/auth')
@@ -55,8 +76,10 @@ app.register_blueprint(create_products_blueprint(), url_prefix='/api/products')
 app.register_blueprint(create_orders_blueprint(), url_prefix='/api/orders')
 app.register_blueprint(create_admin_blueprint(), url_prefix='/api/admin')
 
-# Store connected users for real-time updates
-connected_users = {}
+# Keep product caches coherent with writes made on other nodes
+Product.start_cache_invalidation()
+# Catalog search index, refreshed by the same change events
+search_index.start()
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
@@ -77,54 +100,58 @@ def health_check():
             'timestamp': datetime.utcnow().isoformat()
         }), 500
 
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus scrape endpoint, disabled until METRICS_TOKEN is set"""
+    if not metrics_authorized(request.headers.get('Authorization')):
+        return jsonify({'error': 'Unauthorized'}), 401
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+metrics.register_gauges('password_pool', password_hasher.stats)
+metrics.register_gauges('stock_updates', stock_updates.stats)
+metrics.register_gauges('inventory_log_writer', log_writer.stats)
+metrics.register_gauges('search_index', search_index.stats)
+metrics.register_gauges('order_transactions', order_transactions.stats)
+metrics.register_gauges('idempotency_keys', idempotency_keys.stats)
+for profile, pool in pool_metrics.items():
+    metrics.register_gauges(f'mongodb_pool_{profile}', pool.stats)
+for cache in (product_cache, catalog_cache, category_cache, response_cache, causal_tokens):
+    metrics.register_gauges(f'{cache.name}_cache', cache.stats)
+
 @socketio.on_error()
 def error_handler(e):
     print(f'Socket.IO error: {e}')
     return {'error': str(e)}
 
-@socketio.on('connect')
-def handle_connect():
-    try:
-        print(f'Client connected: {request.sid}')
-        emit('connection_response', {'status': 'Connected to server'})
-    except Exception as e:
-        print(f'Connection error: {e}')
-        return False
-
-@socketio.on('disconnect')
-def handle_disconnect():
-    print(f'Client disconnected: {request.sid}')
-    # Remove user from connected users
-    if request.sid in connected_users:
-        del connected_users[request.sid]
-
-@socketio.on('join_user_room')
-def handle_join_user_room(data):
-    """Join user to their personal room for targeted notifications"""
-    user_id = data.get('user_id')
-    if user_id:
-        join_room(f"user_{user_id}")
-        connected_users[request.sid] = user_id
-        print(f'User {user_id} joined their room')
-
-@socketio.on('join_sellers_room')
-def handle_join_sellers_room():
-    """Join sellers to a common room for inventory updates"""
-    join_room('sellers')
-    print('User joined sellers room')
+class FlaskSocketClient:
+    """Client adapter for the shared event handlers under Flask-SocketIO"""
+    def __init__(self):
+        self.sid = request.sid
+    
+    def join_room(self, room):
+        join_room(room)
+    
+    def leave_room(self, room):
+        leave_room(room)
+    
+    def emit(self, event, data):
+        emit(event, data)
+
+def register_socket_event(event, handler):
+    def on_event(data=None, *args):
+        return handler(FlaskSocketClient(), data if isinstance(data, dict) else None)
+    socketio.on_event(event, on_event)
+
+for event, handler in EVENT_HANDLERS.items():
+    register_socket_event(event, handler)
 
 def emit_stock_update(product_id, new_stock, product_name):
-    """Emit stock update to all connected clients"""
-    socketio.emit('stock_update', {
-        'product_id': str(product_id),
-        'new_stock': new_stock,
-        'product_name': product_name,
-        'timestamp': datetime.utcnow().isoformat()
-    })
+    """Queue stock update for the clients viewing the product, sent in the next stock_updates batch"""
+    stock_updates.add(product_id, new_stock, product_name)
 
 def emit_low_stock_alert(seller_id, product_id, product_name, current_stock):
     """Emit low stock alert to specific seller"""
-    socketio.emit('low_stock_alert', {
+    emitter.emit('low_stock_alert', {
         'product_id': str(product_id),
         'product_name': product_name,
         'current_stock': current_stock,
@@ -133,7 +160,7 @@ def emit_low_stock_alert(seller_id, product_id, product_name, current_stock):
 
 def emit_order_notification(seller_id, order_data):
     """Emit new order notification to seller"""
-    socketio.emit('new_order', order_data, room=f"user_{seller_id}")
+    emitter.emit('new_order', order_data, room=f"user_{seller_id}")
 
 # Make these functions available to other modules
 app.emit_stock_update = emit_stock_update
@@ -141,8 +168,18 @@ app.emit_low_stock_alert = emit_low_stock_alert
 app.emit_order_notification = emit_order_notification
 
 if __name__ == '__main__':
+    # Exit through atexit on SIGTERM so write-behind buffers are flushed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    
     port = int(os.getenv('PORT', 10000))
     node_id = os.getenv('NODE_ID', 'node-1')
     
-    print(f"Starting {node_id} on port {port}")
-    socketio.run(app, host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
+    print(f"Starting {node_id} on port {port} ({SERVER_MODE} mode)")
+    if SERVER_MODE == 'asgi':
+        # asgi.py imports this module as 'app', reuse it instead of loading it twice
+        sys.modules.setdefault('app', sys.modules[__name__])
+        import uvicorn
+        from asgi import application
+        uvicorn.run(application, host='0.0.0.0', port=port)
+    else:
+        socketio.run(app, host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
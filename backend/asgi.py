@@ -0,0 +1,214 @@
+"""ASGI entry point, selected with SERVER_MODE=asgi.
+
+Serves the Flask blueprints through a thread-pooled WSGI bridge, the shared
+Socket.IO events on python-socketio's AsyncServer, and the hottest read
+endpoints (health and catalog reads) natively on the event loop through the
+Motor-backed models. Run with `SERVER_MODE=asgi python app.py` or
+`SERVER_MODE=asgi uvicorn asgi:application`.
+"""
+import asyncio
+import os
+import time
+from datetime import datetime
+from urllib.parse import parse_qs
+
+import socketio
+from a2wsgi import WSGIMiddleware
+
+from app import app, ALLOWED_ORIGINS
+from database.async_connection import async_db
+from models.async_models import AsyncProduct
+from models.product import DEFAULT_PAGE_SIZE
+from realtime.events import EVENT_HANDLERS
+from realtime.emitter import emitter
+from realtime.message_queue import create_client_manager
+from utils.serialization import dumps, JSON_MIMETYPE
+from utils.metrics import metrics
+from utils.http_cache import compute_etag, document_versions, etag_matches, cache_headers
+from utils.compression import maybe_compress
+
+WSGI_WORKERS = int(os.getenv('ASGI_WSGI_WORKERS', 32))
+
+sio = socketio.AsyncServer(
+    async_mode='asgi',
+    cors_allowed_origins=ALLOWED_ORIGINS,
+    ping_timeout=60,
+    ping_interval=25,
+    max_http_buffer_size=1e8,
+    client_manager=create_client_manager(asynchronous=True)
+)
+
+class AsyncSocketClient:
+    """Client adapter for the shared event handlers under python-socketio"""
+    def __init__(self, sid):
+        self.sid = sid
+        self.pending = []
+    
+    def join_room(self, room):
+        self.pending.append(sio.enter_room(self.sid, room))
+    
+    def leave_room(self, room):
+        self.pending.append(sio.leave_room(self.sid, room))
+    
+    def emit(self, event, data):
+        self.pending.append(sio.emit(event, data, to=self.sid))
+
+def register_socket_event(event, handler):
+    async def on_event(sid, *args):
+        data = args[0] if event not in ('connect', 'disconnect') and args else None
+        client = AsyncSocketClient(sid)
+        result = handler(client, data if isinstance(data, dict) else None)
+        for operation in client.pending:
+            await operation
+        return result
+    sio.on(event, on_event)
+
+for event, handler in EVENT_HANDLERS.items():
+    register_socket_event(event, handler)
+
+# Blueprint handlers run in worker threads and hand their emits to the loop
+_loop = None
+
+def _emit_from_thread(event, data, room=None):
+    if _loop is not None:
+        asyncio.run_coroutine_threadsafe(sio.emit(event, data, room=room), _loop)
+
+async def _on_startup():
+    global _loop
+    _loop = asyncio.get_running_loop()
+    emitter.bind(_emit_from_thread)
+
+async def _send(send, status, payload, origin=None, extra_headers=None, accept_encoding=None):
+    extra_headers = dict(extra_headers or {})
+    if status == 304:
+        body, headers = b'', []
+    else:
+        body = payload if isinstance(payload, bytes) else dumps(payload).encode('utf-8')
+        body, encoding = maybe_compress(body, JSON_MIMETYPE, accept_encoding)
+        headers = [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+            (b'vary', b'Accept-Encoding')
+        ]
+        if encoding is not None:
+            headers.append((b'content-encoding', encoding.encode()))
+            if 'ETag' in extra_headers:
+                extra_headers['ETag'] = f'{extra_headers["ETag"][:-1]}-{encoding}"'
+    headers += [(name.lower().encode(), value.encode()) for name, value in extra_headers.items()]
+    if origin and origin in ALLOWED_ORIGINS:
+        headers += [
+            (b'access-control-allow-origin', origin.encode()),
+            (b'access-control-allow-credentials', b'true'),
+            (b'vary', b'Origin')
+        ]
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+async def health_check(params):
+    """Health check endpoint for distributed systems monitoring"""
+    try:
+        await async_db.command('ping')
+        return 200, None, {
+            'status': 'healthy',
+            'timestamp': datetime.utcnow().isoformat(),
+            'database': 'connected',
+            'node_id': os.getenv('NODE_ID', 'node-1')
+        }
+    except Exception as e:
+        return 500, None, {
+            'status': 'unhealthy',
+            'error': str(e),
+            'timestamp': datetime.utcnow().isoformat()
+        }
+
+async def get_products(params):
+    filters = {
+        'category': params.get('category'),
+        'search': params.get('search'),
+        'min_price': params.get('min_price'),
+        'max_price': params.get('max_price'),
+        'in_stock': params.get('in_stock') == 'true'
+    }
+    fields = params.get('fields')
+    try:
+        products, next_cursor = await AsyncProduct.get_products_page(
+            filters,
+            sort=params.get('sort', '-created_at'),
+            cursor=params.get('cursor'),
+            limit=int(params.get('limit', DEFAULT_PAGE_SIZE)),
+            fields=[field.strip() for field in fields.split(',') if field.strip()] if fields else None
+        )
+    except ValueError as e:
+        return 400, None, {'error': str(e)}
+    etag = compute_etag('products', JSON_MIMETYPE, sorted(params.items()), document_versions(products), next_cursor)
+    return 200, etag, {'products': products, 'next_cursor': next_cursor}
+
+async def get_categories(params):
+    categories = await AsyncProduct.get_categories()
+    return 200, compute_etag('categories', categories), {'categories': categories}
+
+async def get_product(params, product_id):
+    product = await AsyncProduct.find_by_id(product_id)
+    if not product:
+        return 404, None, {'error': 'Product not found'}
+    etag = compute_etag('product', JSON_MIMETYPE, 'compact', document_versions([product]))
+    return 200, etag, {'product': product}
+
+# Paths served natively; everything else falls through to Flask
+NATIVE_ROUTES = {
+    '/api/health': health_check,
+    '/api/products/': get_products,
+    '/api/products/categories': get_categories
+}
+# Product detail ids are 24 hex characters, which keeps other product routes on Flask
+PRODUCT_DETAIL_PREFIX = '/api/products/'
+
+def _native_handler(path):
+    if path in NATIVE_ROUTES:
+        return NATIVE_ROUTES[path], ()
+    product_id = path[len(PRODUCT_DETAIL_PREFIX):]
+    if path.startswith(PRODUCT_DETAIL_PREFIX) and len(product_id) == 24 and all(
+        char in '0123456789abcdef' for char in product_id.lower()
+    ):
+        return get_product, (product_id,)
+    return None, ()
+
+flask_app = WSGIMiddleware(app, workers=WSGI_WORKERS)
+
+async def http_app(scope, receive, send):
+    handler, args = (None, ())
+    # Extended JSON, columnar and MessagePack responses keep going through Flask
+    params = {key: values[0] for key, values in parse_qs(scope.get('query_string', b'').decode()).items()}
+    native_format = (
+        params.get('wire') != 'extended' and 'layout' not in params
+        and b'msgpack' not in dict(scope.get('headers', [])).get(b'accept', b'')
+    )
+    if scope['type'] == 'http' and scope['method'] == 'GET' and native_format:
+        handler, args = _native_handler(scope['path'])
+    
+    if handler is None:
+        await flask_app(scope, receive, send)
+        return
+    
+    request_headers = dict(scope['headers'])
+    origin = request_headers.get(b'origin', b'').decode() or None
+    started = time.perf_counter()
+    try:
+        status, etag, payload = await handler(params, *args)
+    except Exception as e:
+        status, etag, payload = 500, None, {'error': str(e)}
+    
+    # Handlers return a validator for cacheable catalog responses
+    extra_headers = None
+    if etag is not None:
+        extra_headers = cache_headers(etag)
+        matched = etag_matches(request_headers.get(b'if-none-match', b'').decode(), etag)
+        if matched is not None:
+            status, extra_headers = 304, cache_headers(matched)
+    await _send(send, status, payload, origin, extra_headers,
+                request_headers.get(b'accept-encoding', b'').decode())
+    # Motor runs commands off the task's context, so only latency is recorded for native routes
+    route = '/api/products/<product_id>' if handler is get_product else scope['path']
+    metrics.observe('http_request_duration_seconds', ('GET', route, str(status)), time.perf_counter() - started)
+
+application = socketio.ASGIApp(sio, other_asgi_app=http_app, on_startup=_on_startup)
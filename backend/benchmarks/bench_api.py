@@ -0,0 +1,177 @@
+"""End-to-end API benchmark over a seeded synthetic data set.
+
+Seeds users, products and order history (see benchmarks.seed), logs in as
+the seeded users and runs each scenario as a closed loop:
+
+- browse: catalog pages and product detail
+- search: catalog text search
+- order: buyers placing orders
+- seller_dashboard: seller orders and product listing
+- admin_dashboard: the admin dashboard
+
+The target is either 'inprocess' (Flask test client, no server), 'spawn'
+(starts app.py in --mode) or the base URL of a running backend. Seeding
+writes straight to the database the backend uses, so point MONGO_URI and a
+DATABASE_NAME containing 'bench' at a throwaway database:
+
+    DATABASE_NAME=ecommerce_bench python -m benchmarks.bench_api --target spawn --mode asgi
+
+For a quick run without MongoDB use the in-memory store (needs mongomock
+and mongomock-motor, text search is not supported there):
+
+    MONGO_URI=mongomock:// DATABASE_NAME=bench python -m benchmarks.bench_api --target inprocess
+"""
+import argparse
+import json
+import os
+import random
+import threading
+from urllib.parse import quote
+
+from benchmarks.common import HttpClient, InProcessClient, closed_loop, serve
+
+SCENARIOS = ['browse', 'search', 'order', 'seller_dashboard', 'admin_dashboard']
+SEARCH_TERMS = ['lamp', 'speaker', 'premium', 'wireless', 'vintage', 'chair']
+
+
+class Session:
+    """Seeded ids and access tokens shared by the scenarios"""
+    def __init__(self, client, seeded, users_per_role):
+        self.client = client
+        self.product_ids = seeded['product_ids']
+        self.tokens = {
+            'buyer': [self.login(f'buyer{i}@bench.local') for i in range(min(users_per_role, len(seeded['buyer_ids'])))],
+            'seller': [self.login(f'seller{i}@bench.local') for i in range(min(users_per_role, len(seeded['seller_ids'])))],
+            'admin': [self.login('admin0@bench.local')]
+        }
+        self._local = threading.local()
+
+    def login(self, email):
+        from benchmarks.seed import SEED_PASSWORD
+        status, body = self.client.request(
+            'POST', '/api/auth/login',
+            body=json.dumps({'email': email, 'password': SEED_PASSWORD}),
+            headers={'Content-Type': 'application/json'}
+        )
+        if status != 200:
+            raise RuntimeError(f'Login as {email} failed with {status}')
+        return json.loads(body)['access_token']
+
+    @property
+    def rng(self):
+        # One generator per worker thread
+        if not hasattr(self._local, 'rng'):
+            self._local.rng = random.Random()
+        return self._local.rng
+
+    def get(self, path, role=None):
+        headers = {'Authorization': f'Bearer {self.rng.choice(self.tokens[role])}'} if role else {}
+        status, _ = self.client.request('GET', path, headers=headers)
+        return status
+
+    def post(self, path, data, role):
+        status, _ = self.client.request('POST', path, body=json.dumps(data), headers={
+            'Authorization': f'Bearer {self.rng.choice(self.tokens[role])}',
+            'Content-Type': 'application/json'
+        })
+        return status
+
+
+def browse(session):
+    if session.rng.random() < 0.5:
+        return session.get('/api/products/?limit=20')
+    return session.get(f'/api/products/{session.rng.choice(session.product_ids)}')
+
+
+def search(session):
+    return session.get(f'/api/products/?search={quote(session.rng.choice(SEARCH_TERMS))}&limit=20')
+
+
+def order(session):
+    products = [
+        {'product_id': product_id, 'quantity': session.rng.randint(1, 3)}
+        for product_id in session.rng.sample(session.product_ids, session.rng.randint(1, 3))
+    ]
+    return session.post('/api/orders/', {'products': products}, 'buyer')
+
+
+def seller_dashboard(session):
+    if session.rng.random() < 0.5:
+        return session.get('/api/orders/seller-orders?limit=20', 'seller')
+    return session.get('/api/products/my-products', 'seller')
+
+
+def admin_dashboard(session):
+    return session.get('/api/admin/dashboard', 'admin')
+
+
+def run(session, scenarios, concurrency, duration):
+    results = {}
+    for name in scenarios:
+        scenario = globals()[name]
+        results[name] = closed_loop(lambda: scenario(session), concurrency=concurrency, duration=duration)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--target', default='inprocess', help="'inprocess', 'spawn' or a base URL")
+    parser.add_argument('--mode', default='eventlet', help='Serving mode with --target spawn')
+    parser.add_argument('--port', type=int, default=5057)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--sellers', type=int, default=20)
+    parser.add_argument('--buyers', type=int, default=100)
+    parser.add_argument('--orders', type=int, default=5000)
+    parser.add_argument('--users-per-role', type=int, default=10, help='Seeded users to log in as per role')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--force', action='store_true', help="Seed a database whose name lacks 'bench'")
+    parser.add_argument('--output', help='Also write the JSON report to this file')
+    args = parser.parse_args()
+
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    if args.target == 'inprocess':
+        # The test client has no Socket.IO server thread, and an in-memory
+        # store cannot be shared with another process for cache invalidation
+        os.environ.setdefault('SERVER_MODE', 'asgi')
+        if os.getenv('MONGO_URI', '').startswith('mongomock://'):
+            os.environ.setdefault('PRODUCT_CACHE_INVALIDATION', 'local')
+
+    from database.connection import db
+    from benchmarks.seed import seed
+    seeded = seed(db, args.products, args.sellers, args.buyers, args.orders, args.seed, args.force)
+
+    report = {
+        'target': args.target,
+        'mode': args.mode if args.target == 'spawn' else None,
+        'concurrency': args.concurrency,
+        'duration': args.duration,
+        'seeded': seeded['counts']
+    }
+    if args.target == 'inprocess':
+        from app import app
+        session = Session(InProcessClient(app), seeded, args.users_per_role)
+        report['scenarios'] = run(session, scenarios, args.concurrency, args.duration)
+    elif args.target == 'spawn':
+        with serve(args.mode, args.port) as base_url:
+            session = Session(HttpClient(base_url), seeded, args.users_per_role)
+            report['scenarios'] = run(session, scenarios, args.concurrency, args.duration)
+    else:
+        session = Session(HttpClient(args.target), seeded, args.users_per_role)
+        report['scenarios'] = run(session, scenarios, args.concurrency, args.duration)
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Orders per second on a single SKU as its stock is split over more shards.
+
+Fires single-item orders at one hot product from many threads through
+Product.reserve_stock, first with the stock on the product document and then
+split over a growing number of stock shards, and checks that no unit is lost
+or oversold. Run from the backend directory against a disposable database:
+
+    DATABASE_NAME=ecommerce_bench python -m benchmarks.bench_hot_sku --shards 1 2 4 8 16 32
+"""
+import argparse
+import json
+from datetime import datetime
+
+from bson import ObjectId
+from benchmarks.common import closed_loop
+from database.connection import db
+from models.product import Product, StockReservationError
+from models.stock_shards import StockShards
+
+
+def run(shards, concurrency, duration, stock, quantity):
+    product_id = db.products.insert_one({
+        'seller_id': ObjectId(),
+        'name': 'Benchmark hot SKU',
+        'description': 'Created by bench_hot_sku',
+        'price': 1.0,
+        'stock': stock,
+        'category': 'Benchmark',
+        'version': 1,
+        'created_at': datetime.utcnow()
+    }).inserted_id
+    if shards:
+        Product.set_stock_shards(product_id, shards)
+
+    def call():
+        try:
+            Product.reserve_stock([{'product_id': product_id, 'quantity': quantity}])
+            return 201
+        except StockReservationError as e:
+            return e.status_code
+
+    try:
+        report = closed_loop(call, concurrency=concurrency, duration=duration)
+        left = StockShards.totals([product_id]).get(product_id, 0) if shards \
+            else db.products.find_one({'_id': product_id})['stock']
+        report['orders_per_second'] = report.pop('throughput')
+        report['stock_left'] = left
+        report['stock_drift'] = stock - report['requests'] * quantity - left
+        return report
+    finally:
+        db.products.delete_one({'_id': product_id})
+        db.product_stock_shards.delete_many({'product_id': product_id})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--stock', type=int, default=10 ** 7)
+    parser.add_argument('--quantity', type=int, default=1)
+    args = parser.parse_args()
+
+    report = {'unsharded': run(0, args.concurrency, args.duration, args.stock, args.quantity)}
+    for shards in args.shards:
+        report[f'{shards}_shards'] = run(shards, args.concurrency, args.duration, args.stock, args.quantity)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
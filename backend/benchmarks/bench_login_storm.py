@@ -0,0 +1,93 @@
+"""Login storm benchmark for the bcrypt password pool.
+
+Starts the backend, registers a benchmark user, then measures:
+
+- baseline: latency of non-auth requests with no login traffic
+- storm: login throughput (and 503 rejections) while the same non-auth
+  load runs alongside it, plus the p99 of those non-auth requests
+
+With hashing on the request thread the non-auth p99 during the storm grows
+to the bcrypt cost times the queue of logins; with the pool it should stay
+close to the baseline. Run from the backend directory with MONGO_URI set:
+
+    python -m benchmarks.bench_login_storm --logins 64 --duration 20
+"""
+import argparse
+import http.client
+import json
+import threading
+import uuid
+from urllib.parse import urlsplit
+
+from benchmarks.common import http_load, serve
+
+NON_AUTH_PATHS = [
+    '/api/health',
+    '/api/products/categories'
+]
+
+
+def register_user(base_url):
+    target = urlsplit(base_url)
+    credentials = {'email': f'bench-{uuid.uuid4().hex[:12]}@example.com', 'password': 'bench-password'}
+    connection = http.client.HTTPConnection(target.hostname, target.port, timeout=30)
+    connection.request(
+        'POST', '/api/auth/register',
+        body=json.dumps(dict(credentials, name='Benchmark User', role='buyer')),
+        headers={'Content-Type': 'application/json'}
+    )
+    response = connection.getresponse()
+    response.read()
+    if response.status != 201:
+        raise RuntimeError(f'Registering benchmark user failed with {response.status}')
+    return credentials
+
+
+def run_storm(base_url, credentials, logins, readers, duration):
+    results = {}
+    body = json.dumps(credentials)
+
+    def login_load():
+        results['login'] = http_load(
+            base_url, ['/api/auth/login'],
+            concurrency=logins, duration=duration, method='POST', body=body,
+            headers={'Content-Type': 'application/json'}
+        )
+
+    storm = threading.Thread(target=login_load)
+    storm.start()
+    results['non_auth'] = http_load(base_url, NON_AUTH_PATHS, concurrency=readers, duration=duration)
+    storm.join()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mode', default='eventlet')
+    parser.add_argument('--port', type=int, default=5056)
+    parser.add_argument('--logins', type=int, default=64, help='Concurrent login clients')
+    parser.add_argument('--readers', type=int, default=16, help='Concurrent non-auth clients')
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--rounds', type=int, help='Override BCRYPT_ROUNDS for the server')
+    parser.add_argument('--workers', type=int, help='Override PASSWORD_POOL_WORKERS for the server')
+    parser.add_argument('--queue', type=int, help='Override PASSWORD_POOL_QUEUE for the server')
+    args = parser.parse_args()
+
+    env = {}
+    for name, value in (('BCRYPT_ROUNDS', args.rounds), ('PASSWORD_POOL_WORKERS', args.workers),
+                        ('PASSWORD_POOL_QUEUE', args.queue)):
+        if value is not None:
+            env[name] = str(value)
+
+    with serve(args.mode, args.port, **env) as base_url:
+        credentials = register_user(base_url)
+        report = {
+            'mode': args.mode,
+            'baseline_non_auth': http_load(base_url, NON_AUTH_PATHS, concurrency=args.readers, duration=args.duration),
+            'storm': run_storm(base_url, credentials, args.logins, args.readers, args.duration)
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""Contention benchmark for transactional and compensating order placement.
+
+Places multi-line orders over a handful of hot products from many threads,
+once through Order.place (one multi-document transaction per order, retried
+on write conflicts) and once through the compensating path (conditional
+reservation, order insert, stock released again if the insert fails).
+Reports throughput, latency and the transaction abort rate. Transactions
+need a replica set; run from the backend directory against a disposable
+database:
+
+    DATABASE_NAME=ecommerce_bench python -m benchmarks.bench_order_contention
+"""
+import argparse
+import json
+import random
+from datetime import datetime
+
+from bson import ObjectId
+from benchmarks.common import closed_loop
+from database.connection import db
+from models.inventory_log import InventoryLog, log_writer
+from models.order import Order, order_transactions
+from models.product import Product, StockReservationError
+
+
+def compensating_order(buyer_id, items):
+    """Path taken by create_order when transactions are off"""
+    reservations = Product.reserve_stock(items)
+    order = Order.from_reservations(buyer_id, items, reservations)
+    try:
+        order_id = order.save()
+    except Exception:
+        Product.release_stock(reservations)
+        raise
+    InventoryLog.save_many(InventoryLog.for_purchase(order_id, reservations))
+
+
+def transactional_order(buyer_id, items):
+    Order.place(buyer_id, items)
+
+
+def run(strategy, products, lines, concurrency, duration, stock):
+    buyer_id = ObjectId()
+    product_ids = db.products.insert_many([{
+        'seller_id': ObjectId(),
+        'name': f'Benchmark hot product {i}',
+        'description': 'Created by bench_order_contention',
+        'price': 1.0,
+        'stock': stock,
+        'category': 'Benchmark',
+        'version': 1,
+        'created_at': datetime.utcnow()
+    } for i in range(products)]).inserted_ids
+
+    def call():
+        items = [{'product_id': str(product_id), 'quantity': 1}
+                 for product_id in random.sample(product_ids, min(lines, len(product_ids)))]
+        try:
+            strategy(buyer_id, items)
+            return 201
+        except StockReservationError as e:
+            return e.status_code
+
+    before = order_transactions.stats()
+    try:
+        report = closed_loop(call, concurrency=concurrency, duration=duration)
+        log_writer.flush()
+
+        after = order_transactions.stats()
+        aborts = after['aborts'] - before['aborts']
+        commits = after['commits'] - before['commits']
+        report.update({
+            'commits': commits,
+            'aborts': aborts,
+            'transient_retries': after['transient_retries'] - before['transient_retries'],
+            'abort_rate': round(aborts / (aborts + commits), 4) if aborts + commits else 0.0
+        })
+
+        # Every accepted order must show up exactly once in the stock left
+        sold = sum(stock - product['stock'] for product in db.products.find({'_id': {'$in': product_ids}}))
+        ordered = sum(
+            item['quantity']
+            for order in db.orders.find({'buyer_id': buyer_id}, {'product_list': 1})
+            for item in order['product_list']
+        )
+        report['stock_drift'] = sold - ordered
+        return report
+    finally:
+        db.products.delete_many({'_id': {'$in': product_ids}})
+        db.orders.delete_many({'buyer_id': buyer_id})
+        db.inventory_logs.delete_many({'product_id': {'$in': product_ids}})
+        db.inventory_history.delete_many({'product_id': {'$in': product_ids}})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=5, help='hot products shared by every order')
+    parser.add_argument('--lines', type=int, default=2, help='distinct products per order')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--stock', type=int, default=10 ** 7)
+    args = parser.parse_args()
+
+    report = {
+        name: run(strategy, args.products, args.lines, args.concurrency, args.duration, args.stock)
+        for name, strategy in (('compensating', compensating_order), ('transactional', transactional_order))
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
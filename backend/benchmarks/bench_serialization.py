@@ -0,0 +1,64 @@
+"""Micro-benchmark of the JSON response encoders.
+
+Compares the json.loads(json_util.dumps(...)) + jsonify round trip the
+routes used to do with utils.serialization on a synthetic catalog payload.
+Needs no database:
+
+    python -m benchmarks.bench_serialization --products 10000
+"""
+import argparse
+import json
+import random
+import timeit
+from datetime import datetime, timedelta
+
+from bson import ObjectId, json_util
+from utils.serialization import dumps
+
+
+def make_products(count):
+    sellers = [ObjectId() for _ in range(50)]
+    now = datetime.utcnow()
+    return [{
+        '_id': ObjectId(),
+        'seller_id': random.choice(sellers),
+        'name': f'Product {i}',
+        'description': 'Synthetic product used to benchmark response serialization.',
+        'price': round(random.uniform(1, 500), 2),
+        'stock': random.randint(0, 100),
+        'category': random.choice(['Electronics', 'Books', 'Home & Office', 'Sports & Fitness']),
+        'created_at': now - timedelta(minutes=i)
+    } for i in range(count)]
+
+
+def legacy(products):
+    """Encode, decode and re-encode as the routes used to"""
+    return json.dumps({'products': json.loads(json_util.dumps(products))}).encode('utf-8')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    
+    products = make_products(args.products)
+    candidates = {
+        'json_util_roundtrip': lambda: legacy(products),
+        'compact': lambda: dumps({'products': products}).encode('utf-8'),
+        'extended': lambda: dumps({'products': products}, 'extended').encode('utf-8')
+    }
+    
+    report = {}
+    for name, encode in candidates.items():
+        best = min(timeit.repeat(encode, number=1, repeat=args.repeat))
+        report[name] = {
+            'ms': round(best * 1000, 2),
+            'bytes': len(encode())
+        }
+    report['speedup'] = round(report['json_util_roundtrip']['ms'] / report['compact']['ms'], 1)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""Load-test comparison of the eventlet and ASGI serving modes.
+
+Starts the backend once per mode on a local port, waits for /api/health,
+drives the catalog read endpoints at a fixed concurrency and prints the
+throughput and latency percentiles of each mode. Run from the backend
+directory with MONGO_URI pointing at a seeded database:
+
+    python -m benchmarks.bench_serving_modes --concurrency 64 --duration 20
+"""
+import argparse
+import json
+
+from benchmarks.common import http_load, serve
+
+DEFAULT_PATHS = [
+    '/api/products/?limit=20',
+    '/api/products/?limit=20&sort=price',
+    '/api/products/categories',
+    '/api/health'
+]
+
+
+def run_mode(mode, port, paths, concurrency, duration):
+    with serve(mode, port) as base_url:
+        return http_load(base_url, paths, concurrency=concurrency, duration=duration)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modes', default='eventlet,asgi')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--path', action='append', dest='paths', help='Endpoint to request, repeatable')
+    args = parser.parse_args()
+    
+    report = {
+        mode: run_mode(mode, args.port, args.paths or DEFAULT_PATHS, args.concurrency, args.duration)
+        for mode in args.modes.split(',')
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Cross-node Socket.IO fan-out latency benchmark.
+
+Builds several in-process Socket.IO servers joined by a message queue
+transport, attaches thousands of simulated clients spread across them and
+times each broadcast from the moment it is emitted on the first node until
+every client's packet has been handed to its transport. Reports the
+per-delivery latency and the time for a whole broadcast to complete.
+
+    python -m benchmarks.bench_socketio_fanout --nodes 2 --clients 5000 --messages 200
+    python -m benchmarks.bench_socketio_fanout --transport mongo   # needs MONGO_URI
+"""
+import argparse
+import json
+import threading
+import time
+
+import socketio
+
+from benchmarks.common import summarize
+from realtime.message_queue import QueueManager, LocalTransport
+
+ROOM = 'sellers'
+
+
+class Node:
+    """Socket.IO server whose clients are counters instead of sockets"""
+    def __init__(self, transport, on_delivery):
+        self.server = socketio.Server(async_mode='threading', client_manager=QueueManager(transport))
+        self.server._send_eio_packet = lambda eio_sid, packet: on_delivery()
+        self.server.manager_initialized = True
+        self.server.manager.initialize()
+
+    def attach_clients(self, count, prefix):
+        manager = self.server.manager
+        for i in range(count):
+            sid = manager.connect(f'{prefix}-{i}', '/')
+            manager.enter_room(sid, '/', ROOM)
+
+
+def make_transport(name):
+    if name == 'local':
+        return LocalTransport()
+    from database.connection import db
+    from realtime.message_queue import MongoTransport
+    return MongoTransport(db, 'socketio_messages_bench')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--transport', choices=['local', 'mongo'], default='local')
+    parser.add_argument('--nodes', type=int, default=2)
+    parser.add_argument('--clients', type=int, default=5000, help='Simulated clients across all nodes')
+    parser.add_argument('--messages', type=int, default=200)
+    parser.add_argument('--timeout', type=float, default=10)
+    args = parser.parse_args()
+
+    lock = threading.Lock()
+    state = {'expected': args.clients, 'delivered': 0, 'started': 0.0, 'done': threading.Event()}
+    deliveries = []
+
+    def on_delivery():
+        now = time.perf_counter()
+        with lock:
+            deliveries.append(now - state['started'])
+            state['delivered'] += 1
+            if state['delivered'] == state['expected']:
+                state['done'].set()
+
+    transport = make_transport(args.transport)
+    nodes = [Node(transport, on_delivery) for _ in range(args.nodes)]
+    per_node = args.clients // args.nodes
+    for index, node in enumerate(nodes):
+        node.attach_clients(per_node + (args.clients % args.nodes if index == 0 else 0), f'node{index}')
+    # Let every node's listener subscribe before publishing
+    time.sleep(1)
+
+    completions, lost = [], 0
+    started = time.perf_counter()
+    for seq in range(args.messages):
+        with lock:
+            state['delivered'] = 0
+            state['done'] = threading.Event()
+            state['started'] = time.perf_counter()
+        nodes[0].server.emit('stock_update', {'seq': seq}, room=ROOM)
+        if state['done'].wait(args.timeout):
+            completions.append(time.perf_counter() - state['started'])
+        else:
+            lost += 1
+    elapsed = time.perf_counter() - started
+
+    report = {
+        'transport': args.transport,
+        'nodes': args.nodes,
+        'clients': args.clients,
+        'messages': args.messages,
+        'incomplete_broadcasts': lost,
+        'deliveries_per_second': round(len(deliveries) / elapsed, 1) if elapsed else 0.0,
+        'delivery': summarize(deliveries, elapsed),
+        'broadcast_complete': summarize(completions, elapsed)
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
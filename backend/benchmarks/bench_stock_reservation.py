@@ -0,0 +1,89 @@
+"""Concurrency benchmark for order stock reservation.
+
+Fires many parallel single-item orders at one hot product and compares the
+legacy read-then-$set path with Product.reserve_stock. Run from the backend
+directory against a disposable database:
+
+    DATABASE_NAME=ecommerce_bench python -m benchmarks.bench_stock_reservation
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from bson import ObjectId
+from database.connection import db
+from models.product import Product, StockReservationError
+
+
+def legacy_order(product_id, quantity):
+    """Read-then-write path used by create_order before stock reservations"""
+    product = Product.find_by_id(product_id)
+    if product['stock'] < quantity:
+        return False
+    product = Product.find_by_id(product_id)
+    Product.update_stock(product_id, product['stock'] - quantity)
+    return True
+
+
+def reservation_order(product_id, quantity):
+    """Conditional bulk reservation path"""
+    try:
+        Product.reserve_stock([{'product_id': product_id, 'quantity': quantity}])
+        return True
+    except StockReservationError:
+        return False
+
+
+def run(strategy, orders, concurrency, stock, quantity):
+    product_id = db.products.insert_one({
+        'seller_id': ObjectId(),
+        'name': 'Benchmark hot product',
+        'description': 'Created by bench_stock_reservation',
+        'price': 1.0,
+        'stock': stock,
+        'category': 'Benchmark',
+        'created_at': datetime.utcnow()
+    }).inserted_id
+    
+    try:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(lambda _: strategy(product_id, quantity), range(orders)))
+        elapsed = time.perf_counter() - started
+        
+        final_stock = db.products.find_one({'_id': product_id})['stock']
+        accepted = sum(results)
+        return {
+            'orders': orders,
+            'accepted': accepted,
+            'initial_stock': stock,
+            'final_stock': final_stock,
+            # Units handed out beyond what was in stock, or lost to overwrites
+            'oversold': max(0, accepted * quantity - stock),
+            'stock_drift': (stock - accepted * quantity) - final_stock,
+            'seconds': round(elapsed, 3),
+            'orders_per_second': round(orders / elapsed, 1)
+        }
+    finally:
+        db.products.delete_one({'_id': product_id})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--orders', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--stock', type=int, default=500)
+    parser.add_argument('--quantity', type=int, default=1)
+    args = parser.parse_args()
+    
+    report = {
+        name: run(strategy, args.orders, args.concurrency, args.stock, args.quantity)
+        for name, strategy in (('legacy', legacy_order), ('reservation', reservation_order))
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
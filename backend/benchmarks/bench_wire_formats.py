@@ -0,0 +1,79 @@
+"""Bytes on the wire and client parse time of the response formats.
+
+Encodes a synthetic catalog payload in every format the API negotiates
+(compact and extended JSON, columnar JSON, MessagePack), each uncompressed,
+gzip and brotli compressed, and times what a client spends decompressing
+and parsing it. Needs no database:
+
+    python -m benchmarks.bench_wire_formats --products 10000
+"""
+import argparse
+import gzip
+import json
+import timeit
+
+from benchmarks.bench_serialization import make_products
+from utils.compression import GZIP_LEVEL, BROTLI_QUALITY
+from utils.serialization import dumps, to_columnar, _compact_default
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def encodings():
+    codecs = {
+        'identity': (lambda body: body, lambda body: body),
+        'gzip': (lambda body: gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0), gzip.decompress)
+    }
+    if brotli is not None:
+        codecs['br'] = (lambda body: brotli.compress(body, quality=BROTLI_QUALITY), brotli.decompress)
+    return codecs
+
+
+def formats(products):
+    candidates = {
+        'json_compact': (dumps({'products': products}).encode('utf-8'), json.loads),
+        'json_extended': (dumps({'products': products}, 'extended').encode('utf-8'), json.loads),
+        'json_columnar': (dumps({'products': to_columnar(products)}).encode('utf-8'), json.loads)
+    }
+    if msgpack is not None:
+        body = msgpack.packb({'products': products}, default=_compact_default, datetime=False)
+        candidates['msgpack'] = (body, msgpack.unpackb)
+    return candidates
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    products = make_products(args.products)
+    baseline = None
+    report = {}
+    for name, (body, parse) in formats(products).items():
+        for encoding, (compress, decompress) in encodings().items():
+            wire = compress(body)
+            encode_ms = min(timeit.repeat(lambda: compress(body), number=1, repeat=args.repeat)) * 1000
+            parse_ms = min(timeit.repeat(lambda: parse(decompress(wire)), number=1, repeat=args.repeat)) * 1000
+            if baseline is None:
+                baseline = len(wire)
+            report[f'{name}+{encoding}'] = {
+                'bytes': len(wire),
+                'ratio': round(len(wire) / baseline, 3),
+                'compress_ms': round(encode_ms, 2) if encoding != 'identity' else 0.0,
+                'client_parse_ms': round(parse_ms, 2)
+            }
+    if brotli is None or msgpack is None:
+        report['skipped'] = [name for name, module in (('br', brotli), ('msgpack', msgpack)) if module is None]
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+"""Helpers shared by the benchmark scripts."""
+import http.client
+import os
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, elapsed, errors=0, rejected=0):
+    """Throughput and latency percentiles, latencies given in seconds"""
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rejected': rejected,
+        'seconds': round(elapsed, 3),
+        'throughput': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'max_ms': round(latencies[-1] * 1000, 2) if latencies else 0.0
+    }
+
+
+def http_load(base_url, paths, concurrency=32, duration=10, method='GET', body=None, headers=None):
+    """Hammer base_url with keep-alive connections, cycling through paths, for duration seconds.
+
+    503 answers are counted as rejected, other 5xx and connection failures as errors.
+    """
+    target = urlsplit(base_url)
+    latencies, errors, rejected = [], [0], [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+    
+    def worker(offset):
+        connection = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=30)
+        local, failed, shed, i = [], 0, 0, offset
+        while time.perf_counter() < deadline:
+            path = paths[i % len(paths)]
+            i += 1
+            started = time.perf_counter()
+            try:
+                connection.request(method, path, body=body, headers=headers or {})
+                response = connection.getresponse()
+                response.read()
+                if response.status == 503:
+                    shed += 1
+                    continue
+                if response.status >= 500:
+                    failed += 1
+                    continue
+                local.append(time.perf_counter() - started)
+            except (OSError, http.client.HTTPException):
+                failed += 1
+                connection.close()
+                connection = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=30)
+        connection.close()
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+            rejected[0] += shed
+    
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, time.perf_counter() - started, errors[0], rejected[0])
+
+
+def closed_loop(call, concurrency=16, duration=10):
+    """Run call() from concurrency threads for duration seconds and summarize its latency.
+
+    call returns the HTTP status of one request; 503 counts as rejected,
+    other 4xx/5xx statuses and exceptions as errors.
+    """
+    latencies, errors, rejected = [], [0], [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+    
+    def worker():
+        local, failed, shed = [], 0, 0
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                status = call()
+            except Exception:
+                failed += 1
+                continue
+            if status == 503:
+                shed += 1
+            elif status >= 400:
+                failed += 1
+            else:
+                local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+            rejected[0] += shed
+    
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, time.perf_counter() - started, errors[0], rejected[0])
+
+
+class HttpClient:
+    """Keep-alive HTTP client with one connection per thread"""
+    def __init__(self, base_url):
+        self.target = urlsplit(base_url)
+        self._local = threading.local()
+    
+    def request(self, method, path, body=None, headers=None):
+        """Send a request, returns (status, body bytes)"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = http.client.HTTPConnection(self.target.hostname, self.target.port or 80, timeout=30)
+            self._local.connection = connection
+        try:
+            connection.request(method, path, body=body, headers=headers or {})
+            response = connection.getresponse()
+            return response.status, response.read()
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            self._local.connection = None
+            raise
+
+
+class InProcessClient:
+    """Same interface as HttpClient, backed by the Flask test client"""
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+    
+    def request(self, method, path, body=None, headers=None):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.open(path, method=method, data=body, headers=headers or {})
+        return response.status_code, response.get_data()
+
+
+def wait_for(url, timeout=60):
+    """Poll url until it answers with a non-5xx status"""
+    target = urlsplit(url)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            connection = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=2)
+            connection.request('GET', target.path or '/')
+            if connection.getresponse().status < 500:
+                return True
+        except OSError:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+@contextmanager
+def serve(mode, port, **env):
+    """Run app.py in the given serving mode until the block exits, yields its base URL"""
+    env = dict(os.environ, SERVER_MODE=mode, PORT=str(port), **env)
+    server = subprocess.Popen(
+        [sys.executable, 'app.py'],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    try:
+        base_url = f'http://127.0.0.1:{port}'
+        if not wait_for(f'{base_url}/api/health'):
+            raise RuntimeError(f'{mode} server did not become healthy')
+        yield base_url
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
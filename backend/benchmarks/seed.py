@@ -0,0 +1,137 @@
+"""Synthetic catalog, users and order history for the API benchmarks.
+
+Every seeded user has the password SEED_PASSWORD. Seeding drops the
+collections it fills, so it refuses to run against a database whose name
+does not contain 'bench' unless forced.
+"""
+import random
+from datetime import datetime, timedelta
+
+import bcrypt
+from bson import ObjectId
+
+SEED_PASSWORD = 'bench-password'
+SEEDED_COLLECTIONS = [
+    'users', 'products', 'orders', 'product_sales', 'product_sales_daily',
+    'inventory_logs', 'inventory_history', 'inventory_daily', 'statistics'
+]
+CATEGORIES = [
+    'Electronics', 'Books', 'Clothing', 'Home', 'Garden', 'Toys',
+    'Sports', 'Beauty', 'Grocery', 'Automotive', 'Music', 'Office'
+]
+ADJECTIVES = ['Classic', 'Compact', 'Deluxe', 'Eco', 'Premium', 'Portable', 'Smart', 'Vintage', 'Wireless', 'Rugged']
+NOUNS = ['Lamp', 'Speaker', 'Backpack', 'Notebook', 'Jacket', 'Kettle', 'Drone', 'Chair', 'Watch', 'Blender']
+ORDER_STATUSES = ['placed', 'placed', 'shipped', 'delivered', 'delivered', 'cancelled']
+
+
+def _users(role, count, password_hash, now):
+    return [{
+        '_id': ObjectId(),
+        'name': f'Bench {role.title()} {i}',
+        'email': f'{role}{i}@bench.local',
+        'password_hash': password_hash,
+        'role': role,
+        'created_at': now
+    } for i in range(count)]
+
+
+def _sales(orders):
+    """product_sales and product_sales_daily documents for the seeded orders"""
+    totals, daily = {}, {}
+    for order in orders:
+        if order['status'] == 'cancelled':
+            continue
+        day = order['timestamp'].strftime('%Y-%m-%d')
+        for item in order['product_list']:
+            for key, target, extra in (
+                (item['product_id'], totals, {}),
+                (f"{item['product_id']}:{day}", daily, {'product_id': item['product_id'], 'day': day})
+            ):
+                entry = target.setdefault(key, dict(
+                    _id=key, seller_id=item['seller_id'], total_sold=0, revenue=0.0, order_count=0, **extra
+                ))
+                entry['total_sold'] += item['quantity']
+                entry['revenue'] += item['quantity'] * item['price']
+                entry['order_count'] += 1
+    return list(totals.values()), list(daily.values())
+
+
+def seed(db, products=2000, sellers=20, buyers=100, orders=5000, seed=42, force=False):
+    """Replace the benchmark collections with a synthetic data set, returns the seeded ids and counts"""
+    if 'bench' not in db.name and not force:
+        raise RuntimeError(f"Refusing to seed database '{db.name}', use a name containing 'bench' or force")
+
+    # Imported here so DATABASE_NAME and MONGO_URI are read after the caller set them
+    from models.inventory_log import InventoryLog, log_writer
+    from models.statistics import Statistics
+
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    for name in SEEDED_COLLECTIONS:
+        db[name].delete_many({})
+
+    # A low bcrypt cost keeps seeding fast, logins upgrade it to the configured cost
+    password_hash = bcrypt.hashpw(SEED_PASSWORD.encode('utf-8'), bcrypt.gensalt(4))
+    seller_docs = _users('seller', sellers, password_hash, now)
+    buyer_docs = _users('buyer', buyers, password_hash, now)
+    admin_docs = _users('admin', 1, password_hash, now)
+    db.users.insert_many(seller_docs + buyer_docs + admin_docs)
+
+    product_docs = []
+    for i in range(products):
+        name = f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {i}'
+        product_docs.append({
+            '_id': ObjectId(),
+            'seller_id': rng.choice(seller_docs)['_id'],
+            'name': name,
+            'description': f'{name} for benchmark shoppers',
+            'price': round(rng.uniform(2, 500), 2),
+            # Deep stock so order scenarios never run out
+            'stock': 1000000,
+            'category': rng.choice(CATEGORIES),
+            'created_at': now - timedelta(minutes=rng.randint(0, 90 * 24 * 60))
+        })
+    db.products.insert_many(product_docs)
+
+    order_docs = []
+    for _ in range(orders):
+        lines = rng.sample(product_docs, rng.randint(1, 4))
+        product_list = [{
+            'product_id': product['_id'],
+            'seller_id': product['seller_id'],
+            'price': product['price'],
+            'quantity': rng.randint(1, 3)
+        } for product in lines]
+        order_docs.append({
+            'buyer_id': rng.choice(buyer_docs)['_id'],
+            'product_list': product_list,
+            'seller_ids': sorted({item['seller_id'] for item in product_list}),
+            'total_amount': round(sum(item['price'] * item['quantity'] for item in product_list), 2),
+            'status': rng.choice(ORDER_STATUSES),
+            'timestamp': now - timedelta(minutes=rng.randint(0, 90 * 24 * 60))
+        })
+    if order_docs:
+        db.orders.insert_many(order_docs)
+
+    sales, sales_daily = _sales(order_docs)
+    if sales:
+        db.product_sales.insert_many(sales)
+        db.product_sales_daily.insert_many(sales_daily)
+
+    InventoryLog.save_many([
+        InventoryLog(product['_id'], 'restock', 0, product['stock'], 'Initial stock')
+        for product in product_docs
+    ])
+    log_writer.flush()
+    Statistics.rebuild()
+
+    return {
+        'seller_ids': [str(user['_id']) for user in seller_docs],
+        'buyer_ids': [str(user['_id']) for user in buyer_docs],
+        'product_ids': [str(product['_id']) for product in product_docs],
+        'counts': {
+            'users': len(seller_docs) + len(buyer_docs) + len(admin_docs),
+            'products': len(product_docs),
+            'orders': len(order_docs)
+        }
+    }
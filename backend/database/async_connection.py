@@ -0,0 +1,14 @@
+from motor.motor_asyncio import AsyncIOMotorClient
+from database.connection import client, MONGO_URI, DATABASE_NAME, mongo_client_options
+
+# Motor binds to the running event loop on first use, so the client can be
+# created at import time like the synchronous one. Indexes are created by
+# database.connection, which the ASGI app imports as well. The ASGI app
+# serves reads only, so it uses the catalog workload profile.
+if MONGO_URI.startswith('mongomock://'):
+    # Share the in-memory data of the synchronous stand-in, needs mongomock-motor
+    from mongomock_motor import AsyncMongoMockClient
+    async_client = AsyncMongoMockClient(mock_mongo_client=client)
+else:
+    async_client = AsyncIOMotorClient(MONGO_URI, **mongo_client_options('catalog'))
+async_db = async_client[DATABASE_NAME]
@@ -1,44 +1,96 @@
 import os
 from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
+from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError, OperationFailure
 from dotenv import load_dotenv
 import time
 
+from utils.metrics import command_metrics, PoolMetrics
+
 load_dotenv()
 
 MONGO_URI = os.getenv('MONGO_URI', 'mongodb://localhost:27017/')
 DATABASE_NAME = os.getenv('DATABASE_NAME', 'distributed_ecommerce')
+# Raw inventory events expire after this many days, 0 keeps them forever
+INVENTORY_LOG_TTL_DAYS = int(os.getenv('INVENTORY_LOG_TTL_DAYS', 90))
+
+# Named workload profiles. Each gets its own client, so its own connection
+# pool, read routing and concerns, and models pick the profile per call.
+# Every setting can be overridden as <PROFILE>_<SETTING>, e.g.
+# ANALYTICS_MAX_POOL_SIZE=5 or CHECKOUT_READ_PREFERENCE=secondaryPreferred.
+WORKLOAD_PROFILES = {
+    # Orders, stock and a buyer's own orders: read what was just written,
+    # writes acknowledged by a majority, causally consistent sessions
+    'checkout': {
+        'max_pool_size': 50, 'min_pool_size': 10, 'wait_queue_timeout_ms': 2000,
+        'read_preference': 'primary', 'max_staleness_seconds': -1,
+        'read_concern': 'local', 'write_concern': 'majority', 'causal_consistency': True
+    },
+    # Public catalog reads: many of them, served by secondaries a little behind
+    'catalog': {
+        'max_pool_size': 100, 'min_pool_size': 10, 'wait_queue_timeout_ms': 5000,
+        'read_preference': 'secondaryPreferred', 'max_staleness_seconds': 90,
+        'read_concern': 'local', 'write_concern': '1', 'causal_consistency': False
+    },
+    # Dashboards, exports and aggregations: a small pool kept off the primary
+    # where possible, so they queue among themselves instead of behind checkout
+    'analytics': {
+        'max_pool_size': 10, 'min_pool_size': 0, 'wait_queue_timeout_ms': 30000,
+        'read_preference': 'secondaryPreferred', 'max_staleness_seconds': 300,
+        'read_concern': 'local', 'write_concern': '1', 'causal_consistency': False
+    }
+}
+
+def workload_setting(profile, setting):
+    """Setting of a workload profile, overridden by the <PROFILE>_<SETTING> environment variable"""
+    default = WORKLOAD_PROFILES[profile][setting]
+    value = os.getenv(f'{profile}_{setting}'.upper())
+    if value is None:
+        return default
+    if isinstance(default, bool):
+        return value.lower() == 'true'
+    return type(default)(value)
+
+def mongo_client_options(profile='checkout'):
+    """Client options of a workload profile, shared by the synchronous and asynchronous drivers"""
+    write_concern = workload_setting(profile, 'write_concern')
+    options = dict(
+        serverSelectionTimeoutMS=10000,
+        maxPoolSize=workload_setting(profile, 'max_pool_size'),
+        minPoolSize=workload_setting(profile, 'min_pool_size'),
+        maxIdleTimeMS=30000,
+        waitQueueTimeoutMS=workload_setting(profile, 'wait_queue_timeout_ms'),
+        readPreference=workload_setting(profile, 'read_preference'),
+        readConcernLevel=workload_setting(profile, 'read_concern'),
+        w=int(write_concern) if write_concern.isdigit() else write_concern,
+        # Times every command and charges it to the request that issued it,
+        # and times how long requests wait for a pooled connection
+        event_listeners=[command_metrics, pool_metrics[profile]]
+    )
+    # Staleness bounds only apply to reads that may go to secondaries
+    max_staleness = workload_setting(profile, 'max_staleness_seconds')
+    if max_staleness > 0 and options['readPreference'] != 'primary':
+        options['maxStalenessSeconds'] = max_staleness
+    
+    # Check if we're using MongoDB Atlas (cloud) or local replica set
+    if not ('mongodb+srv://' in MONGO_URI or 'mongodb.net' in MONGO_URI):
+        options['replicaSet'] = 'rs0'
+    return options
 
-def connect_to_mongo(max_retries=5, retry_delay=5):
+def connect_to_mongo(profile='checkout', max_retries=5, retry_delay=5):
+    if MONGO_URI.startswith('mongomock://'):
+        # In-memory stand-in for benchmarks, needs the optional mongomock package.
+        # Every profile shares one client so that they see the same data.
+        import mongomock
+        if not clients:
+            return mongomock.MongoClient()
+        return next(iter(clients.values()))
+    
     retries = 0
     while retries < max_retries:
         try:
-            # Check if we're using MongoDB Atlas (cloud) or local replica set
-            if 'mongodb+srv://' in MONGO_URI or 'mongodb.net' in MONGO_URI:
-                # MongoDB Atlas connection (cloud)
-                client = MongoClient(
-                    MONGO_URI,
-                    serverSelectionTimeoutMS=10000,
-                    maxPoolSize=50,
-                    minPoolSize=10,
-                    maxIdleTimeMS=30000,
-                    waitQueueTimeoutMS=10000
-                )
-            else:
-                # Local replica set connection
-                client = MongoClient(
-                    MONGO_URI,
-                    serverSelectionTimeoutMS=10000,
-                    replicaSet='rs0',
-                    readPreference='secondaryPreferred',
-                    maxPoolSize=50,
-                    minPoolSize=10,
-                    maxIdleTimeMS=30000,
-                    waitQueueTimeoutMS=10000
-                )
-            
+            client = MongoClient(MONGO_URI, **mongo_client_options(profile))
             client.admin.command('ping')
-            print("Successfully connected to MongoDB")
+            print(f"Successfully connected to MongoDB ({profile})")
             return client
         except (ConnectionFailure, ServerSelectionTimeoutError) as e:
             retries += 1
@@ -48,19 +100,59 @@ def connect_to_mongo(max_retries=5, retry_delay=5):
                 time.sleep(retry_delay)
     raise ConnectionFailure("Failed to connect to MongoDB after multiple attempts")
 
+pool_metrics = {profile: PoolMetrics(profile) for profile in WORKLOAD_PROFILES}
+clients = {}
+
 try:
-    client = connect_to_mongo()
-    db = client[DATABASE_NAME]
+    for profile in WORKLOAD_PROFILES:
+        clients[profile] = connect_to_mongo(profile)
+    databases = {profile: client[DATABASE_NAME] for profile, client in clients.items()}
+    
+    # Checkout is the default profile, writes go to the primary whichever is used
+    client = clients['checkout']
+    db = databases['checkout']
+    catalog_db = databases['catalog']
+    analytics_db = databases['analytics']
     
     # Create indexes
     db.users.create_index("email", unique=True)
     db.products.create_index([("name", "text"), ("description", "text")])
     db.products.create_index("seller_id")
-    db.products.create_index("category")
+    db.products.create_index("stock")
+    # Compound indexes backing keyset pagination of the catalog
+    db.products.create_index([("created_at", -1), ("_id", -1)])
+    db.products.create_index([("price", 1), ("_id", 1)])
+    db.products.create_index([("category", 1), ("created_at", -1), ("_id", -1)])
+    db.products.create_index([("category", 1), ("price", 1), ("_id", 1)])
     db.orders.create_index("buyer_id")
-    db.orders.create_index("timestamp")
+    # (timestamp, _id) also serves the resumable admin exports
+    db.orders.create_index([("timestamp", 1), ("_id", 1)])
+    db.orders.create_index([("seller_ids", 1), ("timestamp", -1), ("_id", -1)])
+    db.product_sales.create_index([("total_sold", -1)])
+    db.product_sales.create_index([("seller_id", 1), ("total_sold", -1)])
+    db.product_sales_daily.create_index([("day", 1)])
+    db.product_sales_daily.create_index([("seller_id", 1), ("day", 1)])
     db.inventory_logs.create_index("product_id")
-    db.inventory_logs.create_index("timestamp")
+    db.inventory_logs.create_index([("timestamp", 1), ("_id", 1)])
+    if INVENTORY_LOG_TTL_DAYS > 0:
+        ttl_seconds = INVENTORY_LOG_TTL_DAYS * 86400
+        try:
+            db.inventory_logs.create_index("timestamp", expireAfterSeconds=ttl_seconds)
+        except OperationFailure:
+            # The TTL index exists with another expiry, update it in place
+            db.command('collMod', 'inventory_logs', index={'keyPattern': {'timestamp': 1}, 'expireAfterSeconds': ttl_seconds})
+    else:
+        # Keeping logs forever: drop the TTL index left by an earlier expiry,
+        # (timestamp, _id) already serves the timestamp queries
+        for name, index in db.inventory_logs.index_information().items():
+            if index['key'] == [('timestamp', 1)] and 'expireAfterSeconds' in index:
+                db.inventory_logs.drop_index(name)
+    db.inventory_history.create_index([("product_id", 1), ("hour", -1)])
+    db.inventory_history.create_index("hour")
+    db.inventory_daily.create_index("day")
+    db.product_stock_shards.create_index([("product_id", 1), ("shard", 1)])
+    # Idempotency keys are looked up by _id and dropped once they expire
+    db.idempotency_keys.create_index("expires_at", expireAfterSeconds=0)
     
     print("Database indexes created successfully")
     
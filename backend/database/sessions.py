@@ -0,0 +1,46 @@
+import os
+from contextlib import contextmanager
+from database.connection import clients, workload_setting, MONGO_URI
+from models.cache import TTLCache
+
+# Cluster and operation time of the latest writes of each scope (a user) made
+# through this process, so their later reads observe them. Tokens are kept
+# per process: across instances, read-your-writes relies on the checkout
+# profile reading from the primary, its default.
+causal_tokens = TTLCache(
+    'causal_tokens',
+    max_entries=int(os.getenv('CAUSAL_TOKEN_CACHE_SIZE', 50000)),
+    ttl=float(os.getenv('CAUSAL_TOKEN_TTL', 300))
+)
+
+@contextmanager
+def causal_session(scope, profile='checkout'):
+    """Causally consistent session of a workload profile for scope, None where unsupported
+
+    Reads in the session see every write made earlier in a session of the
+    same scope, even from a secondary; the session's own writes are
+    remembered for the next one.
+    """
+    if MONGO_URI.startswith('mongomock://') or not workload_setting(profile, 'causal_consistency'):
+        yield None
+        return
+
+    key = f'{profile}:{scope}'
+    with clients[profile].start_session(causal_consistency=True) as session:
+        token = causal_tokens.get(key)
+        if token is not None:
+            session.advance_cluster_time(token[0])
+            session.advance_operation_time(token[1])
+        yield session
+        if session.operation_time is not None:
+            causal_tokens.set(key, (session.cluster_time, session.operation_time))
+
+@contextmanager
+def snapshot_session(profile='checkout'):
+    """Session whose reads all see the data at one point in time, None where unsupported"""
+    if MONGO_URI.startswith('mongomock://'):
+        yield None
+        return
+    
+    with clients[profile].start_session(snapshot=True) as session:
+        yield session
@@ -0,0 +1,124 @@
+import os
+import random
+import threading
+from pymongo import ReadPreference, WriteConcern
+from pymongo.errors import PyMongoError
+from pymongo.read_concern import ReadConcern
+from database.connection import client, MONGO_URI
+from realtime.emitter import emitter
+
+# 'auto' places orders in multi-document transactions unless the database
+# cannot run them (mongomock), 'on' always does, 'off' uses the compensating path
+ORDER_TRANSACTIONS = os.getenv('ORDER_TRANSACTIONS', 'auto')
+# Attempts of a whole transaction after transient errors such as write conflicts
+TRANSACTION_MAX_ATTEMPTS = int(os.getenv('TRANSACTION_MAX_ATTEMPTS', 5))
+# Upper bound of a commit, so a transaction never holds its locks for long
+TRANSACTION_MAX_COMMIT_MS = int(os.getenv('TRANSACTION_MAX_COMMIT_MS', 1000))
+RETRY_BACKOFF_MS = 5
+MAX_RETRY_BACKOFF_MS = 100
+
+def transactions_enabled():
+    """Whether orders are placed in multi-document transactions"""
+    if ORDER_TRANSACTIONS == 'auto':
+        return not MONGO_URI.startswith('mongomock://')
+    return ORDER_TRANSACTIONS == 'on'
+
+class TransactionRunner:
+    """Runs callbacks in multi-document transactions with the driver's retry rules.
+
+    The whole transaction is run again after an error labelled
+    TransientTransactionError (write conflicts, elections), with jittered
+    exponential backoff, up to max_attempts times. A commit failing with
+    UnknownTransactionCommitResult is retried on its own, committing is
+    idempotent. Callbacks must only touch the database through the session
+    they are given and leave side effects for after run() returns.
+    """
+    def __init__(self, name, max_attempts=TRANSACTION_MAX_ATTEMPTS, max_commit_ms=TRANSACTION_MAX_COMMIT_MS):
+        self.name = name
+        self.max_attempts = max_attempts
+        self.max_commit_ms = max_commit_ms
+        self._lock = threading.Lock()
+        self.commits = 0
+        self.aborts = 0
+        self.transient_retries = 0
+        self.commit_retries = 0
+        self.failures = 0
+
+    def run(self, callback, session=None):
+        """Return callback(session) once its transaction has committed, in a new session unless given one"""
+        if session is None:
+            with client.start_session() as session:
+                return self._run(callback, session)
+        return self._run(callback, session)
+
+    def _run(self, callback, session):
+        for attempt in range(1, self.max_attempts + 1):
+            session.start_transaction(
+                read_concern=ReadConcern('snapshot'),
+                write_concern=WriteConcern('majority'),
+                read_preference=ReadPreference.PRIMARY,
+                max_commit_time_ms=self.max_commit_ms
+            )
+            try:
+                result = callback(session)
+            except Exception as e:
+                if session.in_transaction:
+                    session.abort_transaction()
+                self._count('aborts')
+                if self._transient(e) and attempt < self.max_attempts:
+                    self._count('transient_retries')
+                    self._backoff(attempt)
+                    continue
+                self._count('failures')
+                raise
+
+            try:
+                self._commit(session)
+            except PyMongoError as e:
+                self._count('aborts')
+                if self._transient(e) and attempt < self.max_attempts:
+                    self._count('transient_retries')
+                    self._backoff(attempt)
+                    continue
+                self._count('failures')
+                raise
+            self._count('commits')
+            return result
+
+    def _commit(self, session):
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                session.commit_transaction()
+                return
+            except PyMongoError as e:
+                if not e.has_error_label('UnknownTransactionCommitResult') or attempt == self.max_attempts:
+                    raise
+                self._count('commit_retries')
+
+    @staticmethod
+    def _transient(error):
+        return isinstance(error, PyMongoError) and error.has_error_label('TransientTransactionError')
+
+    @staticmethod
+    def _backoff(attempt):
+        # Full jitter keeps conflicting retries from colliding again. The
+        # server's sleep yields to the eventlet hub, which is not monkey patched
+        emitter.sleep(random.uniform(0, min(MAX_RETRY_BACKOFF_MS, RETRY_BACKOFF_MS * 2 ** attempt)) / 1000.0)
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self):
+        """Get commit, abort and retry counters"""
+        with self._lock:
+            started = self.commits + self.aborts
+            return {
+                'name': self.name,
+                'commits': self.commits,
+                'aborts': self.aborts,
+                'transient_retries': self.transient_retries,
+                'commit_retries': self.commit_retries,
+                'failures': self.failures,
+                'abort_rate': round(self.aborts / started, 4) if started else 0.0
+            }
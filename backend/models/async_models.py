@@ -0,0 +1,218 @@
+import asyncio
+from datetime import datetime, timedelta
+from bson import ObjectId
+from database.async_connection import async_db
+from models.user import User
+from models.product import Product, DEFAULT_PAGE_SIZE, product_cache, catalog_cache, category_cache
+from models.order import Order
+from models.inventory_log import InventoryLog
+from models.stock_shards import StockShards
+
+# Motor-backed counterparts of the models with the same API, for the ASGI
+# serving mode. Reads go straight through Motor. Writes reuse the synchronous
+# implementations in a worker thread, so stock reservations, cache
+# invalidation and the sales and dashboard counters keep one implementation.
+
+_MISSING = object()
+
+class AsyncUser(User):
+    async def save(self):
+        """Save user to database"""
+        return await asyncio.to_thread(super().save)
+    
+    @staticmethod
+    async def find_by_email(email):
+        """Find user by email"""
+        return await async_db.users.find_one({'email': email})
+    
+    @staticmethod
+    async def find_by_id(user_id):
+        """Find user by ID"""
+        return await async_db.users.find_one({'_id': ObjectId(user_id)})
+    
+    @staticmethod
+    async def get_all_users():
+        """Get all users (admin only)"""
+        return await async_db.users.find({}, {'password_hash': 0}).to_list(None)
+    
+    @staticmethod
+    async def update_user(user_id, update_data):
+        """Update user information"""
+        return await asyncio.to_thread(User.update_user, user_id, update_data)
+    
+    @staticmethod
+    async def delete_user(user_id):
+        """Delete user, returns the deleted user"""
+        return await asyncio.to_thread(User.delete_user, user_id)
+
+class AsyncProduct(Product):
+    async def save(self):
+        """Save product to database"""
+        return await asyncio.to_thread(super().save)
+    
+    @staticmethod
+    async def find_by_id(product_id):
+        """Find product by ID"""
+        product_id = ObjectId(product_id)
+        product = product_cache.get(str(product_id), _MISSING)
+        if product is _MISSING:
+            product = await async_db.products.find_one({'_id': product_id})
+            if StockShards.is_sharded(product):
+                totals = await async_db.product_stock_shards.aggregate(StockShards.totals_pipeline([product_id])).to_list(None)
+                product['stock'] = totals[0]['stock'] if totals else 0
+            if product is not None:
+                product_cache.set(str(product_id), product)
+        return product
+    
+    @staticmethod
+    async def find_by_seller(seller_id):
+        """Find all products by seller"""
+        return await async_db.products.find({'seller_id': ObjectId(seller_id)}).to_list(None)
+    
+    @staticmethod
+    async def get_all_products(filters=None):
+        """Get all products with optional filters"""
+        return await async_db.products.find(Product._build_query(filters)).to_list(None)
+    
+    @staticmethod
+    async def get_products_page(filters=None, sort='-created_at', cursor=None, limit=DEFAULT_PAGE_SIZE, fields=None):
+        """Get one page of products using keyset pagination on (sort key, _id)"""
+        key = Product._page_cache_key(filters, sort, cursor, limit, fields)
+        page = catalog_cache.get(key, _MISSING)
+        if page is _MISSING:
+            query = Product._page_query(filters, sort, cursor, limit, fields)
+            if 'pipeline' in query:
+                products = await async_db.products.aggregate(query['pipeline']).to_list(None)
+            else:
+                products = await async_db.products.find(**query).to_list(None)
+            page = Product._page_result(products, sort, limit)
+            catalog_cache.set(key, page)
+        return page
+    
+    @staticmethod
+    async def update_product(product_id, update_data):
+        """Update product information"""
+        return await asyncio.to_thread(Product.update_product, product_id, update_data)
+    
+    @staticmethod
+    async def update_stock(product_id, new_stock):
+        """Update product stock"""
+        return await asyncio.to_thread(Product.update_stock, product_id, new_stock)
+    
+    @staticmethod
+    async def reserve_stock(items):
+        """Atomically reserve stock for all line items of an order"""
+        return await asyncio.to_thread(Product.reserve_stock, items)
+    
+    @staticmethod
+    async def release_stock(reservations):
+        """Give reserved stock back, used to compensate a failed order"""
+        return await asyncio.to_thread(Product.release_stock, reservations)
+    
+    @staticmethod
+    async def delete_product(product_id):
+        """Delete product"""
+        return await asyncio.to_thread(Product.delete_product, product_id)
+    
+    @staticmethod
+    async def get_low_stock_products(threshold=5):
+        """Get products with low stock"""
+        return await async_db.products.find({'stock': {'$lte': threshold}}).to_list(None)
+    
+    @staticmethod
+    async def get_categories():
+        """Get all unique categories"""
+        categories = category_cache.get('categories', _MISSING)
+        if categories is _MISSING:
+            categories = await async_db.products.distinct('category')
+            category_cache.set('categories', categories)
+        return categories
+    
+    @staticmethod
+    async def get_top_selling_products(limit=5, seller_id=None, days=None):
+        """Get top selling products from the incrementally maintained sales counters"""
+        return await asyncio.to_thread(Product.get_top_selling_products, limit, seller_id, days)
+
+class AsyncOrder(Order):
+    async def save(self):
+        """Save order to database"""
+        return await asyncio.to_thread(super().save)
+    
+    @staticmethod
+    async def find_by_id(order_id):
+        """Find order by ID"""
+        return await async_db.orders.find_one({'_id': ObjectId(order_id)})
+    
+    @staticmethod
+    async def find_by_buyer(buyer_id):
+        """Find all orders by buyer"""
+        return await async_db.orders.find({'buyer_id': ObjectId(buyer_id)}).to_list(None)
+    
+    @staticmethod
+    async def find_by_seller(seller_id, cursor=None, limit=DEFAULT_PAGE_SIZE):
+        """Find one page of orders containing products from specific seller, newest first"""
+        query = Order._seller_page_query(seller_id, cursor, limit)
+        orders = await async_db.orders.find(**query).to_list(None)
+        return Order._seller_page_result(orders, limit)
+    
+    @staticmethod
+    async def get_recent_orders(days=30):
+        """Get orders from last N days"""
+        cutoff_date = datetime.utcnow() - timedelta(days=days)
+        return await async_db.orders.find({'timestamp': {'$gte': cutoff_date}}).to_list(None)
+    
+    @staticmethod
+    async def update_order_status(order_id, status):
+        """Update order status, returns the order as it was before the update"""
+        return await asyncio.to_thread(Order.update_order_status, order_id, status)
+    
+    @staticmethod
+    async def get_order_statistics():
+        """Get order statistics for admin dashboard"""
+        pipeline = [
+            {'$group': {
+                '_id': '$status',
+                'count': {'$sum': 1},
+                'total_amount': {'$sum': '$total_amount'}
+            }}
+        ]
+        return await async_db.orders.aggregate(pipeline).to_list(None)
+    
+    @staticmethod
+    async def get_buyer_order_history(buyer_id, limit=10):
+        """Get buyer's recent order history"""
+        return await async_db.orders.find(
+            {'buyer_id': ObjectId(buyer_id)},
+            sort=[('timestamp', -1)],
+            limit=limit
+        ).to_list(None)
+
+class AsyncInventoryLog(InventoryLog):
+    async def save(self):
+        """Save inventory log to database"""
+        return await asyncio.to_thread(super().save)
+    
+    @staticmethod
+    async def save_many(logs):
+        """Save several inventory logs with a single insert_many"""
+        return await asyncio.to_thread(InventoryLog.save_many, logs)
+    
+    @staticmethod
+    async def find_by_product(product_id, limit=50):
+        """Find the latest inventory logs of a product from its history buckets"""
+        logs = []
+        async for bucket in async_db.inventory_history.find({'product_id': ObjectId(product_id)}, sort=[('hour', -1)]):
+            logs.extend(InventoryLog._bucket_logs(bucket))
+            if len(logs) >= limit:
+                break
+        return logs[:limit]
+    
+    @staticmethod
+    async def get_recent_logs(days=7):
+        """Get recent inventory logs from the history buckets"""
+        return await async_db.inventory_history.aggregate(InventoryLog._recent_logs_pipeline(days)).to_list(None)
+    
+    @staticmethod
+    async def get_stock_changes_summary(days=None):
+        """Get summary of stock changes by type from the daily rollups"""
+        return await async_db.inventory_daily.aggregate(InventoryLog._summary_pipeline(days)).to_list(None)
\ No newline at end of file
@@ -0,0 +1,187 @@
+import queue
+import threading
+import time
+from collections import OrderedDict
+from pymongo.errors import PyMongoError, OperationFailure
+
+# Server error returned when change streams are used on a standalone mongod
+CHANGE_STREAM_UNSUPPORTED = 40573
+
+_MISSING = object()
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after a time-to-live"""
+    def __init__(self, name, max_entries=1024, ttl=60):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+    
+    def get(self, key, default=None):
+        """Return a cached value, or default when missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, expires_at = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return default
+    
+    def set(self, key, value):
+        """Store a value, evicting the least recently used entries when full"""
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def get_or_load(self, key, loader):
+        """Return a cached value, calling loader and caching its result on a miss"""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = loader()
+            if value is not None:
+                self.set(key, value)
+        return value
+    
+    def invalidate(self, key):
+        """Drop a single entry"""
+        with self._lock:
+            if self._entries.pop(key, _MISSING) is not _MISSING:
+                self.invalidations += 1
+    
+    def invalidate_where(self, predicate):
+        """Drop the entries for which predicate(key, value) is true"""
+        with self._lock:
+            keys = [key for key, (value, _) in self._entries.items() if predicate(key, value)]
+            for key in keys:
+                del self._entries[key]
+            self.invalidations += len(keys)
+    
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+    
+    def stats(self):
+        """Get hit/miss metrics for monitoring"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'name': self.name,
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+class LocalChangeStream:
+    """In-memory stand-in for a MongoDB change stream, used in tests and single-node setups"""
+    def __init__(self):
+        self._subscribers = []
+        self._lock = threading.Lock()
+    
+    def publish(self, change):
+        """Deliver a change event to every open watcher"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber.put(change)
+    
+    def watch(self, resume_after=None):
+        """Open a watcher that yields published change events"""
+        return _LocalWatcher(self)
+
+class _LocalWatcher:
+    def __init__(self, stream):
+        self._stream = stream
+        self._queue = queue.Queue()
+        self.resume_token = None
+        with stream._lock:
+            stream._subscribers.append(self._queue)
+    
+    def put(self, change):
+        self._queue.put(change)
+    
+    def __iter__(self):
+        while True:
+            change = self._queue.get()
+            if change is None:
+                return
+            yield change
+    
+    def close(self):
+        with self._stream._lock:
+            if self._queue in self._stream._subscribers:
+                self._stream._subscribers.remove(self._queue)
+        self._queue.put(None)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
+class ChangeStreamInvalidator:
+    """Background thread feeding change events into cache invalidation handlers"""
+    def __init__(self, watch, handler, on_reset, retry_delay=1):
+        self.watch = watch
+        self.handler = handler
+        self.on_reset = on_reset
+        self.retry_delay = retry_delay
+        self._stream = None
+        self._stopped = threading.Event()
+        self._thread = None
+    
+    def start(self):
+        """Start listening in a daemon thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name='cache-invalidator', daemon=True)
+            self._thread.start()
+        return self
+    
+    def stop(self):
+        """Stop listening and close the open stream"""
+        self._stopped.set()
+        if self._stream is not None:
+            self._stream.close()
+    
+    def run(self):
+        resume_token = None
+        while not self._stopped.is_set():
+            try:
+                with self.watch(resume_after=resume_token) as stream:
+                    self._stream = stream
+                    for change in stream:
+                        self.handler(change)
+                        resume_token = stream.resume_token
+            except OperationFailure as e:
+                if e.code == CHANGE_STREAM_UNSUPPORTED:
+                    print('Change streams unavailable, caches rely on TTL expiry only')
+                    return
+                print(f'Cache invalidation stream error: {e}')
+                resume_token = None
+            except PyMongoError as e:
+                print(f'Cache invalidation stream error: {e}')
+                resume_token = None
+            finally:
+                self._stream = None
+            
+            # Events may have been missed while disconnected
+            self.on_reset()
+            self._stopped.wait(self.retry_delay)
@@ -0,0 +1,197 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from pymongo import ReadPreference
+from pymongo.errors import DuplicateKeyError
+from database.connection import db
+from models.cache import TTLCache
+from realtime.emitter import emitter
+
+# Completed responses are replayed for this long, then the key expires
+IDEMPOTENCY_TTL_HOURS = float(os.getenv('IDEMPOTENCY_TTL_HOURS', 24))
+# A request holding a key longer than this is presumed dead and its key is taken over
+IDEMPOTENCY_LOCK_SECONDS = float(os.getenv('IDEMPOTENCY_LOCK_SECONDS', 30))
+# How long a duplicate waits for the first request before answering 409
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv('IDEMPOTENCY_WAIT_SECONDS', 10))
+# 'memory' also keeps completed responses in process, 'off' always asks MongoDB
+IDEMPOTENCY_CACHE = os.getenv('IDEMPOTENCY_CACHE', 'memory')
+MAX_KEY_LENGTH = 255
+POLL_INTERVAL = 0.05
+
+response_cache = TTLCache(
+    'idempotency',
+    max_entries=int(os.getenv('IDEMPOTENCY_CACHE_SIZE', 10000)),
+    ttl=float(os.getenv('IDEMPOTENCY_CACHE_TTL', 300))
+)
+
+# Keys are claimed and completed on the primary, duplicates must see that at once
+keys_collection = db.idempotency_keys.with_options(read_preference=ReadPreference.PRIMARY)
+
+class IdempotencyError(Exception):
+    """Raised when a request cannot be served under its idempotency key"""
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+class IdempotencyKeys:
+    """Runs a request once per idempotency key and replays its response to repeats.
+
+    The first request claims the key with an insert into idempotency_keys,
+    runs and stores its response there; the key expires IDEMPOTENCY_TTL_HOURS
+    later through a TTL index. Repeats of a completed request get the stored
+    response, from the in-process cache when it holds it. Concurrent
+    duplicates wait for the first request instead of running again: in the
+    same process on an event, across processes by polling the key, both
+    with the green-aware sleep of the Socket.IO server. Server
+    errors release the key so that a retry runs afresh. A key reused for a
+    different request is rejected.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self.executed = 0
+        self.replayed = 0
+        self.waited = 0
+        self.takeovers = 0
+        self.rejected = 0
+
+    def run(self, scope, key, fingerprint, handler):
+        """Return (response, replayed) where response is handler()'s dict or the stored one
+
+        handler returns {'status_code', 'body', 'mimetype'}. Raises
+        IdempotencyError when the key belongs to another request or its
+        first request is still running after IDEMPOTENCY_WAIT_SECONDS.
+        """
+        key_id = f'{scope}:{key}'
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+        while True:
+            response = self._completed(key_id, fingerprint)
+            if response is not None:
+                return response, True
+
+            with self._lock:
+                in_flight = self._in_flight.get(key_id)
+                if in_flight is None:
+                    self._in_flight[key_id] = threading.Event()
+            if in_flight is None:
+                break
+            self._count('waited')
+            if not self._wait(in_flight, deadline):
+                self._reject('A request with this Idempotency-Key is still in progress', 409)
+
+        try:
+            if not self._claim(key_id, fingerprint, deadline):
+                return self._completed(key_id, fingerprint), True
+
+            try:
+                response = handler()
+            except Exception:
+                keys_collection.delete_one({'_id': key_id, 'state': 'pending'})
+                raise
+
+            if response['status_code'] >= 500:
+                keys_collection.delete_one({'_id': key_id, 'state': 'pending'})
+            else:
+                keys_collection.update_one({'_id': key_id}, {'$set': {'state': 'done', 'response': response}})
+                if IDEMPOTENCY_CACHE == 'memory':
+                    response_cache.set(key_id, (fingerprint, response))
+            self._count('executed')
+            return response, False
+        finally:
+            with self._lock:
+                self._in_flight.pop(key_id).set()
+
+    def _completed(self, key_id, fingerprint):
+        """The stored response of a completed key, None when it is unknown or still pending"""
+        cached = response_cache.get(key_id) if IDEMPOTENCY_CACHE == 'memory' else None
+        if cached is None:
+            record = keys_collection.find_one({'_id': key_id, 'state': 'done'})
+            if record is None:
+                return None
+            cached = (record['fingerprint'], record['response'])
+            if IDEMPOTENCY_CACHE == 'memory':
+                response_cache.set(key_id, cached)
+
+        if cached[0] != fingerprint:
+            self._reject('Idempotency-Key was already used for a different request', 422)
+        self._count('replayed')
+        return cached[1]
+
+    def _claim(self, key_id, fingerprint, deadline):
+        """Claim the key for this process, False once another process completed it meanwhile"""
+        now = datetime.utcnow()
+        try:
+            keys_collection.insert_one({
+                '_id': key_id,
+                'fingerprint': fingerprint,
+                'state': 'pending',
+                'locked_until': now + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS),
+                'created_at': now,
+                'expires_at': now + timedelta(hours=IDEMPOTENCY_TTL_HOURS)
+            })
+            return True
+        except DuplicateKeyError:
+            pass
+
+        # Another process holds the key: wait for its response or take over a dead claim
+        while True:
+            record = keys_collection.find_one({'_id': key_id})
+            if record is None:
+                # Released after a server error, try again
+                return self._claim(key_id, fingerprint, deadline)
+            if record['fingerprint'] != fingerprint:
+                self._reject('Idempotency-Key was already used for a different request', 422)
+            if record['state'] == 'done':
+                return False
+
+            now = datetime.utcnow()
+            if record['locked_until'] <= now:
+                taken = keys_collection.update_one(
+                    {'_id': key_id, 'state': 'pending', 'locked_until': record['locked_until']},
+                    {'$set': {'locked_until': now + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS)}}
+                )
+                if taken.modified_count:
+                    self._count('takeovers')
+                    return True
+            if time.monotonic() >= deadline:
+                self._reject('A request with this Idempotency-Key is still in progress', 409)
+            self._count('waited')
+            emitter.sleep(POLL_INTERVAL)
+
+    @staticmethod
+    def _wait(event, deadline):
+        """Wait for event until deadline, False on timeout
+
+        Polls with the serving server's sleep: under eventlet, which is not
+        monkey patched, Event.wait and time.sleep would block the hub and
+        with it the request the duplicate is waiting for.
+        """
+        while not event.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            emitter.sleep(min(POLL_INTERVAL, remaining))
+        return True
+    
+    def _reject(self, message, status_code):
+        self._count('rejected')
+        raise IdempotencyError(message, status_code)
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self):
+        """Get execution, replay and wait counters"""
+        with self._lock:
+            return {
+                'in_flight': len(self._in_flight),
+                'executed': self.executed,
+                'replayed': self.replayed,
+                'waited': self.waited,
+                'takeovers': self.takeovers,
+                'rejected': self.rejected
+            }
+
+idempotency_keys = IdempotencyKeys()
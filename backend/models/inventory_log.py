@@ -1,6 +1,27 @@
+import atexit
+import os
 from datetime import datetime, timedelta
 from bson import ObjectId
-from database.connection import db
+from bson.errors import InvalidId
+from pymongo import UpdateOne, WriteConcern
+from pymongo.errors import BulkWriteError
+from database.connection import db, analytics_db
+from models.statistics import Statistics
+from models.write_behind import WriteBehindWriter, WriteBehindError
+from utils.pagination import keyset_filter, time_range_filter
+
+# 'async' returns as soon as a log is buffered, 'majority' waits until its
+# batch is acknowledged by a majority of the replica set
+INVENTORY_LOG_DURABILITY = os.getenv('INVENTORY_LOG_DURABILITY', 'async')
+
+# Raw events in inventory_logs expire after INVENTORY_LOG_TTL_DAYS. History is
+# kept compact in inventory_history, one bucket per product and UTC hour
+# holding the latest events of that hour, and inventory_daily, one rollup
+# per UTC day and change type. Both are maintained with each written batch.
+MAX_BUCKET_EVENTS = int(os.getenv('INVENTORY_BUCKET_MAX_EVENTS', 200))
+# Ids of the latest batch writes kept on each bucket and rollup, to skip re-runs
+MAX_WRITE_IDS = 50
+DUPLICATE_KEY_ERROR = 11000
 
 class InventoryLog:
     def __init__(self, product_id, change_type, old_stock, new_stock, reason=""):
@@ -10,48 +31,337 @@ class InventoryLog:
         self.new_stock = int(new_stock)
         self.reason = reason
         self.timestamp = datetime.utcnow()
+        # Assigned up front so callers get ids before the batch is written
+        self._id = ObjectId()
+        # Set once the raw log was inserted, in a transaction or a batch
+        self.stored = False
+        # Batch stages done so far ('history', 'daily', 'counted') and the id
+        # guarding the bucket and rollup updates against being applied twice
+        self.stages = set()
+        self.write_id = None
+    
+    @staticmethod
+    def for_purchase(order_id, reservations):
+        """Purchase logs of the stock reservations of an order"""
+        return [
+            InventoryLog(
+                product_id=reservation['product']['_id'],
+                change_type='purchase',
+                old_stock=reservation['old_stock'],
+                new_stock=reservation['new_stock'],
+                reason=f'Order {order_id}'
+            )
+            for reservation in reservations
+        ]
     
     def save(self):
-        """Save inventory log to database"""
-        log_data = {
-            'product_id': self.product_id,
-            'change_type': self.change_type,
-            'old_stock': self.old_stock,
-            'new_stock': self.new_stock,
-            'reason': self.reason,
-            'timestamp': self.timestamp
-        }
-        result = db.inventory_logs.insert_one(log_data)
-        return result.inserted_id
+        """Queue inventory log for the batched writer"""
+        return InventoryLog.save_many([self])[0]
+    
+    @staticmethod
+    def save_many(logs):
+        """Queue several inventory logs for the batched writer, returns their ids"""
+        log_writer.write(logs)
+        return [log._id for log in logs]
+    
+    @staticmethod
+    def insert_many(logs, session):
+        """Insert raw logs as part of a transaction, save_many them after the commit.
+
+        Only the raw inventory_logs documents are written in the transaction,
+        the shared history buckets, rollups and counters are left to the
+        batched writer so concurrent transactions do not conflict on them.
+        """
+        if logs:
+            db.inventory_logs.insert_many([dict(log.to_dict(), _id=log._id) for log in logs], session=session)
+        for log in logs:
+            log.stored = True
+    
+    @staticmethod
+    def _write_batch(logs):
+        """Insert a batch of queued logs, fold it into the history buckets and rollups and count it.
+
+        Each log remembers the stages it went through, so a batch requeued
+        after a failure only runs again the stages that did not finish.
+        Bucket and rollup updates are applied once per write id: a re-run
+        of an update that did reach the server matches no document, its
+        upsert fails with a duplicate key and counts as done.
+        """
+        write_concern = WriteConcern('majority') if INVENTORY_LOG_DURABILITY == 'majority' else None
+        collection = lambda name: db.get_collection(name, write_concern=write_concern)
+        
+        pending = [log for log in logs if not log.stored]
+        if pending:
+            failed = InventoryLog._failed_writes(
+                lambda: collection('inventory_logs').insert_many(
+                    [dict(log.to_dict(), _id=log._id) for log in pending], ordered=False
+                )
+            )
+            for index, log in enumerate(pending):
+                log.stored = index not in failed
+        
+        for stage, name in (('history', 'inventory_history'), ('daily', 'inventory_daily')):
+            updates = InventoryLog._history_updates([log for log in logs if stage not in log.stages], stage)
+            if updates:
+                failed = InventoryLog._failed_writes(
+                    lambda: collection(name).bulk_write([update for update, _ in updates], ordered=False)
+                )
+                for index, (_, group) in enumerate(updates):
+                    if index not in failed:
+                        for log in group:
+                            log.stages.add(stage)
+        
+        unfinished = [log for log in logs if not log.stored or not {'history', 'daily'} <= log.stages]
+        if unfinished:
+            raise WriteBehindError(f'{len(unfinished)} inventory logs were not fully written')
+        
+        uncounted = [log for log in logs if 'counted' not in log.stages]
+        InventoryLog._count(uncounted)
+        for log in uncounted:
+            log.stages.add('counted')
+    
+    @staticmethod
+    def _failed_writes(write):
+        """Run an unordered write, returns the indexes of the operations that failed.
+
+        Duplicate keys mean the operation was applied by an earlier attempt
+        and do not count as failures; anything but a per-operation error is
+        raised.
+        """
+        try:
+            write()
+        except BulkWriteError as e:
+            return {error['index'] for error in e.details['writeErrors'] if error.get('code') != DUPLICATE_KEY_ERROR}
+        return set()
+    
+    @staticmethod
+    def _history_updates(logs, stage):
+        """Build the bucket ('history') or daily rollup ('daily') upserts of logs, with the logs of each"""
+        for log in logs:
+            if log.write_id is None:
+                log.write_id = str(ObjectId())
+        
+        groups = {}
+        for log in sorted(logs, key=lambda log: log.timestamp):
+            if stage == 'history':
+                key = (log.product_id, log.timestamp.strftime('%Y-%m-%dT%H'), log.write_id)
+            else:
+                key = (log.timestamp.strftime('%Y-%m-%d'), log.change_type, log.write_id)
+            groups.setdefault(key, []).append(log)
+        
+        updates = []
+        for key, group in groups.items():
+            write_id = key[-1]
+            if stage == 'history':
+                product_id, hour, _ = key
+                document_id = f'{product_id}:{hour}'
+                update = {
+                    '$setOnInsert': {
+                        'product_id': product_id,
+                        'hour': group[0].timestamp.replace(minute=0, second=0, microsecond=0),
+                        'open_stock': group[0].old_stock
+                    },
+                    '$set': {'close_stock': group[-1].new_stock},
+                    '$min': {'min_stock': min(log.new_stock for log in group)},
+                    '$max': {'max_stock': max(log.new_stock for log in group)},
+                    '$inc': {'count': len(group)},
+                    '$push': {
+                        'events': {'$each': [log.to_event() for log in group], '$slice': -MAX_BUCKET_EVENTS},
+                        'writes': {'$each': [write_id], '$slice': -MAX_WRITE_IDS}
+                    }
+                }
+            else:
+                day, change_type, _ = key
+                document_id = f'{day}:{change_type}'
+                update = {
+                    '$set': {'day': day, 'change_type': change_type},
+                    '$inc': {'count': len(group), 'total_change': sum(log.new_stock - log.old_stock for log in group)},
+                    '$push': {'writes': {'$each': [write_id], '$slice': -MAX_WRITE_IDS}}
+                }
+            updates.append((
+                UpdateOne({'_id': document_id, 'writes': {'$ne': write_id}}, update, upsert=True),
+                group
+            ))
+        return updates
+    
+    @staticmethod
+    def _count(logs):
+        """Add logs to the inventory counters of the dashboard statistics"""
+        counters = {}
+        for log in logs:
+            count_field = f'inventory.{log.change_type}.count'
+            change_field = f'inventory.{log.change_type}.total_change'
+            counters[count_field] = counters.get(count_field, 0) + 1
+            counters[change_field] = counters.get(change_field, 0) + log.new_stock - log.old_stock
+        Statistics.increment(counters)
     
     @staticmethod
     def find_by_product(product_id, limit=50):
-        """Find inventory logs for a specific product"""
-        return list(db.inventory_logs.find(
-            {'product_id': ObjectId(product_id)},
-            sort=[('timestamp', -1)],
-            limit=limit
-        ))
+        """Find the latest inventory logs of a product from its history buckets"""
+        product_id = ObjectId(product_id)
+        logs = []
+        for bucket in analytics_db.inventory_history.find({'product_id': product_id}, sort=[('hour', -1)]):
+            logs.extend(InventoryLog._bucket_logs(bucket))
+            if len(logs) >= limit:
+                break
+        return logs[:limit]
     
     @staticmethod
     def get_recent_logs(days=7):
-        """Get recent inventory logs"""
+        """Get recent inventory logs from the history buckets"""
+        return list(analytics_db.inventory_history.aggregate(InventoryLog._recent_logs_pipeline(days)))
+    
+    @staticmethod
+    def _bucket_logs(bucket):
+        """Expand a history bucket to log documents, newest first"""
+        return [dict(event, product_id=bucket['product_id']) for event in reversed(bucket.get('events', []))]
+    
+    @staticmethod
+    def _recent_logs_pipeline(days):
         cutoff_date = datetime.utcnow() - timedelta(days=days)
-        return list(db.inventory_logs.find(
-            {'timestamp': {'$gte': cutoff_date}},
-            sort=[('timestamp', -1)]
-        ))
+        return [
+            # Buckets are matched by their hour, events by their own timestamp
+            {'$match': {'hour': {'$gte': cutoff_date.replace(minute=0, second=0, microsecond=0)}}},
+            {'$unwind': '$events'},
+            {'$addFields': {'events.product_id': '$product_id'}},
+            {'$replaceRoot': {'newRoot': '$events'}},
+            {'$match': {'timestamp': {'$gte': cutoff_date}}},
+            {'$sort': {'timestamp': -1}}
+        ]
+    
+    @staticmethod
+    def export_cursor(start=None, end=None, change_types=None, product_id=None, after_id=None, limit=0, batch_size=1000):
+        """Cursor over inventory logs in (timestamp, _id) order for streaming exports, resumable after_id"""
+        clauses = [time_range_filter('timestamp', start, end)]
+        if change_types:
+            clauses.append({'change_type': {'$in': change_types}})
+        try:
+            if product_id:
+                clauses.append({'product_id': ObjectId(product_id)})
+            after = analytics_db.inventory_logs.find_one({'_id': ObjectId(after_id)}, {'timestamp': 1}) if after_id else None
+        except InvalidId as e:
+            raise ValueError('Invalid product_id or after_id') from e
+        if after_id:
+            if not after:
+                raise ValueError('Invalid after_id')
+            clauses.append(keyset_filter('timestamp', 1, after['timestamp'], after['_id']))
+        
+        return analytics_db.inventory_logs.find(
+            {'$and': clauses},
+            sort=[('timestamp', 1), ('_id', 1)],
+            limit=limit,
+            batch_size=batch_size
+        )
+    
+    @staticmethod
+    def get_stock_changes_summary(days=None):
+        """Get summary of stock changes by type from the daily rollups, optionally for the last N days"""
+        return list(analytics_db.inventory_daily.aggregate(InventoryLog._summary_pipeline(days)))
     
     @staticmethod
-    def get_stock_changes_summary():
-        """Get summary of stock changes by type"""
-        pipeline = [
+    def _summary_pipeline(days):
+        match = {}
+        if days:
+            match['day'] = {'$gte': (datetime.utcnow() - timedelta(days=days)).strftime('%Y-%m-%d')}
+        return [
+            {'$match': match},
             {'$group': {
                 '_id': '$change_type',
-                'count': {'$sum': 1},
-                'total_change': {
-                    '$sum': {'$subtract': ['$new_stock', '$old_stock']}
-                }
+                'count': {'$sum': '$count'},
+                'total_change': {'$sum': '$total_change'}
             }}
         ]
-        return list(db.inventory_logs.aggregate(pipeline))
\ No newline at end of file
+    
+    @staticmethod
+    def rebuild_history():
+        """Recompute the history buckets and daily rollups from the raw logs still retained"""
+        db.inventory_history.delete_many({})
+        db.inventory_logs.aggregate([
+            {'$sort': {'timestamp': 1}},
+            {'$group': {
+                '_id': {
+                    'product_id': '$product_id',
+                    'hour': {'$dateTrunc': {'date': '$timestamp', 'unit': 'hour'}}
+                },
+                'count': {'$sum': 1},
+                'open_stock': {'$first': '$old_stock'},
+                'close_stock': {'$last': '$new_stock'},
+                'min_stock': {'$min': '$new_stock'},
+                'max_stock': {'$max': '$new_stock'},
+                'events': {'$push': {
+                    '_id': '$_id',
+                    'change_type': '$change_type',
+                    'old_stock': '$old_stock',
+                    'new_stock': '$new_stock',
+                    'reason': '$reason',
+                    'timestamp': '$timestamp'
+                }}
+            }},
+            {'$project': {
+                '_id': {'$concat': [
+                    {'$toString': '$_id.product_id'}, ':',
+                    {'$dateToString': {'format': '%Y-%m-%dT%H', 'date': '$_id.hour'}}
+                ]},
+                'product_id': '$_id.product_id',
+                'hour': '$_id.hour',
+                'count': 1,
+                'open_stock': 1,
+                'close_stock': 1,
+                'min_stock': 1,
+                'max_stock': 1,
+                'events': {'$slice': ['$events', -MAX_BUCKET_EVENTS]}
+            }},
+            {'$merge': {'into': 'inventory_history'}}
+        ])
+        
+        db.inventory_daily.delete_many({})
+        db.inventory_logs.aggregate([
+            {'$group': {
+                '_id': {
+                    'day': {'$dateToString': {'format': '%Y-%m-%d', 'date': '$timestamp'}},
+                    'change_type': '$change_type'
+                },
+                'count': {'$sum': 1},
+                'total_change': {'$sum': {'$subtract': ['$new_stock', '$old_stock']}}
+            }},
+            {'$project': {
+                '_id': {'$concat': ['$_id.day', ':', '$_id.change_type']},
+                'day': '$_id.day',
+                'change_type': '$_id.change_type',
+                'count': 1,
+                'total_change': 1
+            }},
+            {'$merge': {'into': 'inventory_daily'}}
+        ])
+    
+    def to_event(self):
+        """Convert inventory log to the event stored in its history bucket"""
+        return {
+            '_id': self._id,
+            'change_type': self.change_type,
+            'old_stock': self.old_stock,
+            'new_stock': self.new_stock,
+            'reason': self.reason,
+            'timestamp': self.timestamp
+        }
+    
+    def to_dict(self):
+        """Convert inventory log to dictionary"""
+        return {
+            'product_id': self.product_id,
+            'change_type': self.change_type,
+            'old_stock': self.old_stock,
+            'new_stock': self.new_stock,
+            'reason': self.reason,
+            'timestamp': self.timestamp
+        }
+
+log_writer = WriteBehindWriter(
+    'inventory_logs',
+    InventoryLog._write_batch,
+    batch_size=int(os.getenv('INVENTORY_LOG_BATCH_SIZE', 500)),
+    flush_interval=int(os.getenv('INVENTORY_LOG_FLUSH_MS', 100)) / 1000.0,
+    wait_for_flush=INVENTORY_LOG_DURABILITY == 'majority',
+    max_buffer=int(os.getenv('INVENTORY_LOG_MAX_BUFFER', 100000))
+)
+atexit.register(log_writer.close)
\ No newline at end of file
@@ -1,27 +1,131 @@
 from datetime import datetime, timedelta
 from bson import ObjectId
-from database.connection import db
+from bson.errors import InvalidId
+from collections import defaultdict
+from pymongo import UpdateOne, ReturnDocument
+from pymongo.errors import BulkWriteError
+from database.connection import db, analytics_db
+from database.sessions import causal_session
+from database.transactions import TransactionRunner
+from models.inventory_log import InventoryLog
+from models.product import Product
+from models.product_sales import ProductSales
+from models.statistics import Statistics
+from utils.pagination import encode_cursor, decode_cursor, keyset_filter, time_range_filter
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
 
 class Order:
     def __init__(self, buyer_id, product_list, total_amount):
         self.buyer_id = ObjectId(buyer_id)
         self.product_list = product_list
+        # Denormalized so seller queries can use an index instead of a $lookup
+        self.seller_ids = sorted({item['seller_id'] for item in product_list if item.get('seller_id')})
         self.total_amount = float(total_amount)
         self.status = 'placed'
         self.timestamp = datetime.utcnow()
     
-    def save(self):
-        """Save order to database"""
-        order_data = {
+    def to_document(self):
+        """Convert order to the document stored in MongoDB"""
+        return {
             'buyer_id': self.buyer_id,
             'product_list': self.product_list,
+            'seller_ids': self.seller_ids,
             'total_amount': self.total_amount,
             'status': self.status,
             'timestamp': self.timestamp
         }
-        result = db.orders.insert_one(order_data)
+    
+    @staticmethod
+    def from_reservations(buyer_id, items, reservations):
+        """Price the line items from the reserved products"""
+        products = {reservation['product']['_id']: reservation['product'] for reservation in reservations}
+        product_list = []
+        total_amount = 0
+        
+        for item in items:
+            product = products[ObjectId(item['product_id'])]
+            total_amount += product['price'] * item['quantity']
+            
+            product_list.append({
+                'product_id': product['_id'],
+                'seller_id': product['seller_id'],
+                'quantity': item['quantity'],
+                'price': product['price']
+            })
+        
+        return Order(buyer_id=buyer_id, product_list=product_list, total_amount=total_amount)
+    
+    def save(self, session=None):
+        """Save order to database"""
+        result = db.orders.insert_one(self.to_document(), session=session)
+        self._record_counters()
         return result.inserted_id
     
+    def _record_counters(self):
+        """Add the order to the sales and dashboard counters"""
+        ProductSales.record_order(self.product_list, self.timestamp)
+        Statistics.increment({
+            f'orders_by_status.{self.status}.count': 1,
+            f'orders_by_status.{self.status}.total_amount': self.total_amount
+        })
+    
+    @staticmethod
+    def place(buyer_id, items):
+        """Reserve stock and store an order with its purchase logs in one transaction.
+
+        The transaction only touches the ordered products, the new order and
+        its raw inventory logs. Sales counters, dashboard statistics and
+        inventory history are shared by every order and would make
+        concurrent transactions conflict, so they are updated once the
+        commit succeeded. Returns (order_id, order, reservations), raises
+        StockReservationError with nothing written.
+        """
+        def place_order(session):
+            reservations = Product.reserve_stock_in_session(items, session)
+            order = Order.from_reservations(buyer_id, items, reservations)
+            order_id = db.orders.insert_one(order.to_document(), session=session).inserted_id
+            logs = InventoryLog.for_purchase(order_id, reservations)
+            InventoryLog.insert_many(logs, session)
+            return order_id, order, reservations, logs
+        
+        # Causal, so the buyer's next read of their orders includes this one
+        with causal_session(buyer_id) as session:
+            order_id, order, reservations, logs = order_transactions.run(place_order, session)
+        
+        Product.notify_stock_change([reservation['product']['_id'] for reservation in reservations])
+        order._record_counters()
+        InventoryLog.save_many(logs)
+        return order_id, order, reservations
+    
+    @staticmethod
+    def save_many(orders, session=None):
+        """Insert several orders with one unordered insert_many
+
+        Sales and dashboard counters are updated once for the whole batch.
+        Returns the inserted ids aligned with orders, None where the insert failed.
+        """
+        if not orders:
+            return []
+        
+        documents = [order.to_document() for order in orders]
+        failed = set()
+        try:
+            db.orders.insert_many(documents, ordered=False, session=session)
+        except BulkWriteError as e:
+            failed = {error['index'] for error in e.details.get('writeErrors', [])}
+        
+        saved = [order for index, order in enumerate(orders) if index not in failed]
+        ProductSales.record_orders([(order.product_list, order.timestamp) for order in saved])
+        counters = defaultdict(int)
+        for order in saved:
+            counters[f'orders_by_status.{order.status}.count'] += 1
+            counters[f'orders_by_status.{order.status}.total_amount'] += order.total_amount
+        Statistics.increment(counters)
+        
+        return [None if index in failed else document['_id'] for index, document in enumerate(documents)]
+    
     @staticmethod
     def find_by_id(order_id):
         """Find order by ID"""
@@ -29,38 +133,124 @@ class Order:
     
     @staticmethod
     def find_by_buyer(buyer_id):
-        """Find all orders by buyer"""
-        return list(db.orders.find({'buyer_id': ObjectId(buyer_id)}))
+        """Find all orders by buyer, including those they just placed"""
+        with causal_session(buyer_id) as session:
+            return list(db.orders.find({'buyer_id': ObjectId(buyer_id)}, session=session))
     
     @staticmethod
-    def find_by_seller(seller_id):
-        """Find orders containing products from specific seller"""
-        pipeline = [
-            {'$lookup': {
-                'from': 'products',
-                'localField': 'product_list.product_id',
-                'foreignField': '_id',
-                'as': 'product_details'
-            }},
-            {'$match': {
-                'product_details.seller_id': ObjectId(seller_id)
-            }}
-        ]
-        return list(db.orders.aggregate(pipeline))
+    def find_by_seller(seller_id, cursor=None, limit=DEFAULT_PAGE_SIZE):
+        """Find one page of orders containing products from specific seller, newest first"""
+        query = Order._seller_page_query(seller_id, cursor, limit)
+        return Order._seller_page_result(list(db.orders.find(**query)), limit)
+    
+    @staticmethod
+    def _seller_page_query(seller_id, cursor, limit):
+        query = {'seller_ids': ObjectId(seller_id)}
+        if cursor:
+            query = {'$and': [query, keyset_filter('timestamp', -1, *decode_cursor(cursor, 'seller_orders'))]}
+        
+        return {
+            'filter': query,
+            'sort': [('timestamp', -1), ('_id', -1)],
+            'limit': max(1, min(int(limit), MAX_PAGE_SIZE)) + 1
+        }
+    
+    @staticmethod
+    def _seller_page_result(orders, limit):
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        next_cursor = None
+        if len(orders) > limit:
+            orders = orders[:limit]
+            next_cursor = encode_cursor('seller_orders', orders[-1]['timestamp'], orders[-1]['_id'])
+        
+        return orders, next_cursor
+    
+    @staticmethod
+    def backfill_seller_ids(batch_size=500):
+        """Denormalize seller ids onto orders created before they were stored, returns orders updated"""
+        updated = 0
+        while True:
+            orders = list(db.orders.find(
+                {'seller_ids': {'$exists': False}},
+                {'product_list': 1},
+                limit=batch_size
+            ))
+            if not orders:
+                return updated
+            
+            product_ids = {item['product_id'] for order in orders for item in order['product_list']}
+            sellers = {
+                product['_id']: product['seller_id']
+                for product in db.products.find({'_id': {'$in': list(product_ids)}}, {'seller_id': 1})
+            }
+            
+            operations = []
+            for order in orders:
+                product_list = []
+                for item in order['product_list']:
+                    seller_id = sellers.get(item['product_id'])
+                    product_list.append({**item, 'seller_id': seller_id} if seller_id else item)
+                
+                # Products deleted since the order was placed leave no seller to record
+                operations.append(UpdateOne({'_id': order['_id']}, {'$set': {
+                    'product_list': product_list,
+                    'seller_ids': sorted({item['seller_id'] for item in product_list if item.get('seller_id')})
+                }}))
+            
+            db.orders.bulk_write(operations, ordered=False)
+            updated += len(operations)
     
     @staticmethod
     def get_recent_orders(days=30):
         """Get orders from last N days"""
         cutoff_date = datetime.utcnow() - timedelta(days=days)
-        return list(db.orders.find({'timestamp': {'$gte': cutoff_date}}))
+        return list(analytics_db.orders.find({'timestamp': {'$gte': cutoff_date}}))
+    
+    @staticmethod
+    def export_cursor(start=None, end=None, statuses=None, after_id=None, limit=0, batch_size=1000):
+        """Cursor over orders in (timestamp, _id) order for streaming exports, resumable after_id"""
+        clauses = [time_range_filter('timestamp', start, end)]
+        if statuses:
+            clauses.append({'status': {'$in': statuses}})
+        if after_id:
+            try:
+                after = analytics_db.orders.find_one({'_id': ObjectId(after_id)}, {'timestamp': 1})
+            except InvalidId as e:
+                raise ValueError('Invalid after_id') from e
+            if not after:
+                raise ValueError('Invalid after_id')
+            clauses.append(keyset_filter('timestamp', 1, after['timestamp'], after['_id']))
+        
+        return analytics_db.orders.find(
+            {'$and': clauses},
+            sort=[('timestamp', 1), ('_id', 1)],
+            limit=limit,
+            batch_size=batch_size
+        )
     
     @staticmethod
     def update_order_status(order_id, status):
-        """Update order status"""
-        return db.orders.update_one(
+        """Update order status, returns the order as it was before the update"""
+        previous = db.orders.find_one_and_update(
             {'_id': ObjectId(order_id)},
-            {'$set': {'status': status}}
+            {'$set': {'status': status}},
+            return_document=ReturnDocument.BEFORE
         )
+        
+        if previous and previous['status'] != status:
+            Statistics.increment({
+                f'orders_by_status.{previous["status"]}.count': -1,
+                f'orders_by_status.{previous["status"]}.total_amount': -previous['total_amount'],
+                f'orders_by_status.{status}.count': 1,
+                f'orders_by_status.{status}.total_amount': previous['total_amount']
+            })
+        
+        # Cancelled orders do not count towards sales
+        if previous and (previous['status'] == 'cancelled') != (status == 'cancelled'):
+            sign = -1 if status == 'cancelled' else 1
+            ProductSales.record_order(previous['product_list'], previous['timestamp'], sign)
+        
+        return previous
     
     @staticmethod
     def get_order_statistics():
@@ -72,13 +262,17 @@ class Order:
                 'total_amount': {'$sum': '$total_amount'}
             }}
         ]
-        return list(db.orders.aggregate(pipeline))
+        return list(analytics_db.orders.aggregate(pipeline))
     
     @staticmethod
     def get_buyer_order_history(buyer_id, limit=10):
         """Get buyer's recent order history"""
-        return list(db.orders.find(
-            {'buyer_id': ObjectId(buyer_id)},
-            sort=[('timestamp', -1)],
-            limit=limit
-        ))
\ No newline at end of file
+        with causal_session(buyer_id) as session:
+            return list(db.orders.find(
+                {'buyer_id': ObjectId(buyer_id)},
+                sort=[('timestamp', -1)],
+                limit=limit,
+                session=session
+            ))
+
+order_transactions = TransactionRunner('orders')
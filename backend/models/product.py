@@ -1,6 +1,79 @@
+import os
+from collections import defaultdict
 from bson import ObjectId
 from datetime import datetime
-from database.connection import db
+from pymongo import UpdateOne, ReadPreference
+from pymongo.errors import BulkWriteError
+from database.connection import db, catalog_db, analytics_db
+from models.cache import TTLCache, LocalChangeStream, ChangeStreamInvalidator
+from models.product_sales import ProductSales
+from models.search import search_index
+from models.statistics import Statistics
+from models.stock_shards import StockShards, shards_collection
+from utils.pagination import encode_cursor, decode_cursor, keyset_filter
+
+# Error of a guarded stock update whose product is short or sharded
+STOCK_GUARD_ERROR = 241
+
+# Allocation rounds of a batch reservation before orders hit by concurrent writes are given up
+BATCH_RESERVATION_ATTEMPTS = int(os.getenv('BATCH_RESERVATION_ATTEMPTS', 3))
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Catalog sort options mapped to (sort key, direction)
+SORT_OPTIONS = {
+    'price': ('price', 1),
+    '-price': ('price', -1),
+    'created_at': ('created_at', 1),
+    '-created_at': ('created_at', -1),
+    'relevance': ('score', -1)
+}
+
+REQUIRED_FIELDS = ['name', 'description', 'price', 'stock', 'category']
+
+PROJECTABLE_FIELDS = ['seller_id', 'name', 'description', 'price', 'stock', 'category', 'created_at']
+
+# Catalog filters and sorts whose results depend on each product field: an
+# update of the field drops the cached pages using them, other pages only
+# when they show the product
+PAGE_DEPENDENCIES = {
+    'stock': {'in_stock'},
+    'price': {'min_price', 'max_price', 'price', '-price'},
+    'category': {'category'},
+    'name': {'search', 'relevance'},
+    'description': {'search', 'relevance'},
+    'created_at': {'created_at', '-created_at'}
+}
+# Bookkeeping fields no page shows
+UNLISTED_FIELDS = {'version', 'stock_shards', 'stock_shards_lock'}
+
+# Read-through caches, kept coherent across nodes by the change stream of the
+# products and their stock shards.
+# Cached documents are shared between requests and must not be mutated.
+product_cache = TTLCache(
+    'products',
+    max_entries=int(os.getenv('PRODUCT_CACHE_SIZE', 10000)),
+    ttl=float(os.getenv('PRODUCT_CACHE_TTL', 60))
+)
+catalog_cache = TTLCache(
+    'catalog',
+    max_entries=int(os.getenv('CATALOG_CACHE_SIZE', 512)),
+    ttl=float(os.getenv('CATALOG_CACHE_TTL', 10))
+)
+category_cache = TTLCache('categories', max_entries=1, ttl=float(os.getenv('CATEGORY_CACHE_TTL', 300)))
+
+# 'changestream' watches MongoDB, 'local' uses the in-process stand-in, 'off' relies on TTLs
+CACHE_INVALIDATION = os.getenv('PRODUCT_CACHE_INVALIDATION', 'changestream')
+local_change_stream = LocalChangeStream()
+
+class StockReservationError(Exception):
+    """Raised when a line item cannot be reserved"""
+    def __init__(self, message, product_id, available_stock=None, status_code=409):
+        super().__init__(message)
+        self.product_id = str(product_id)
+        self.available_stock = available_stock
+        self.status_code = status_code
 
 class Product:
     def __init__(self, seller_id, name, description, price, stock, category):
@@ -12,33 +85,241 @@ class Product:
         self.category = category
         self.created_at = datetime.utcnow()
     
-    def save(self):
-        """Save product to database"""
-        product_data = {
+    @staticmethod
+    def from_dict(seller_id, data):
+        """Build a product from request data, raising ValueError for missing or invalid fields"""
+        missing = [field for field in REQUIRED_FIELDS if data.get(field) in (None, '')]
+        if missing:
+            raise ValueError(f'Missing required fields: {", ".join(missing)}')
+        
+        try:
+            price = float(data['price'])
+        except (TypeError, ValueError):
+            raise ValueError('Invalid price')
+        try:
+            stock = int(data['stock'])
+        except (TypeError, ValueError):
+            raise ValueError('Invalid stock')
+        if price < 0 or stock < 0:
+            raise ValueError('Price and stock must not be negative')
+        
+        return Product(
+            seller_id=seller_id,
+            name=str(data['name']),
+            description=str(data['description']),
+            price=price,
+            stock=stock,
+            category=str(data['category'])
+        )
+    
+    def to_document(self):
+        """Convert product to the document stored in MongoDB"""
+        return {
             'seller_id': self.seller_id,
             'name': self.name,
             'description': self.description,
             'price': self.price,
             'stock': self.stock,
             'category': self.category,
-            'created_at': self.created_at
+            'created_at': self.created_at,
+            # Bumped by every write, validates HTTP caches of the product
+            'version': 1
         }
-        result = db.products.insert_one(product_data)
+    
+    def save(self):
+        """Save product to database"""
+        result = db.products.insert_one(self.to_document())
+        Statistics.increment({'products.total': 1})
+        Product._notify_change('insert', [result.inserted_id])
         return result.inserted_id
     
+    @staticmethod
+    def save_many(products):
+        """Insert several products with one unordered insert_many
+
+        Returns the inserted ids aligned with products (None where the insert
+        failed) and the error messages by position.
+        """
+        if not products:
+            return [], {}
+        
+        documents = [product.to_document() for product in products]
+        errors = {}
+        try:
+            db.products.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get('writeErrors', []):
+                errors[error['index']] = error.get('errmsg', 'Insert failed')
+        
+        product_ids = [None if index in errors else document['_id'] for index, document in enumerate(documents)]
+        inserted = [product_id for product_id in product_ids if product_id is not None]
+        if inserted:
+            Statistics.increment({'products.total': len(inserted)})
+            Product._notify_change('insert', inserted)
+        return product_ids, errors
+    
     @staticmethod
     def find_by_id(product_id):
         """Find product by ID"""
-        return db.products.find_one({'_id': ObjectId(product_id)})
+        product_id = ObjectId(product_id)
+        return product_cache.get_or_load(
+            str(product_id),
+            lambda: StockShards.overlay([catalog_db.products.find_one({'_id': product_id})])[0]
+        )
+    
+    @staticmethod
+    def find_many_by_ids(product_ids):
+        """Find several products by ID through the product cache, misses are loaded with one $in query"""
+        products, missing = {}, []
+        for product_id in product_ids:
+            product = product_cache.get(str(product_id))
+            if product is None:
+                missing.append(ObjectId(product_id))
+            else:
+                products[product['_id']] = product
+        if missing:
+            for product in StockShards.overlay(list(catalog_db.products.find({'_id': {'$in': missing}}))):
+                product_cache.set(str(product['_id']), product)
+                products[product['_id']] = product
+        return products
     
     @staticmethod
     def find_by_seller(seller_id):
         """Find all products by seller"""
         return list(db.products.find({'seller_id': ObjectId(seller_id)}))
     
+    @staticmethod
+    def export_cursor(seller_id=None, batch_size=1000):
+        """Cursor over the catalog in _id order, fetched from the server in batches"""
+        query = {'seller_id': ObjectId(seller_id)} if seller_id else {}
+        return analytics_db.products.find(query, sort=[('_id', 1)], batch_size=batch_size)
+    
     @staticmethod
     def get_all_products(filters=None):
         """Get all products with optional filters"""
+        return list(catalog_db.products.find(Product._build_query(filters)))
+    
+    @staticmethod
+    def search(query, filters=None, cursor=None, limit=DEFAULT_PAGE_SIZE):
+        """Ranked search over the in-memory index with category and price facets
+
+        Hits are hydrated to full documents through the product cache.
+        Raises SearchUnavailableError while the index is not ready.
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        result = search_index.search(query, filters, cursor, limit)
+        products = Product.find_many_by_ids([entry.id for entry, _ in result['hits']])
+        return {
+            'products': [
+                {**products[entry.id], 'score': round(score, 4)}
+                for entry, score in result['hits'] if entry.id in products
+            ],
+            'total': result['total'],
+            'facets': result['facets'],
+            'next_cursor': result['next_cursor']
+        }
+    
+    @staticmethod
+    def suggest(query, limit=10, category=None):
+        """Typeahead completions served from the index alone, without a database round trip"""
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        result = search_index.search(query, {'category': category}, limit=limit, facets=False)
+        return [entry.to_suggestion(score) for entry, score in result['hits']]
+    
+    @staticmethod
+    def get_products_page(filters=None, sort='-created_at', cursor=None, limit=DEFAULT_PAGE_SIZE, fields=None):
+        """Get one page of products using keyset pagination on (sort key, _id)
+
+        Returns the products and an opaque cursor for the next page, which is
+        None once the last page has been reached.
+        """
+        return catalog_cache.get_or_load(
+            Product._page_cache_key(filters, sort, cursor, limit, fields),
+            lambda: Product._query_products_page(filters, sort, cursor, limit, fields)
+        )
+    
+    @staticmethod
+    def _query_products_page(filters, sort, cursor, limit, fields):
+        """Run the catalog page query against MongoDB"""
+        query = Product._page_query(filters, sort, cursor, limit, fields)
+        if 'pipeline' in query:
+            products = list(catalog_db.products.aggregate(query['pipeline']))
+        else:
+            products = list(catalog_db.products.find(**query))
+        return Product._page_result(products, sort, limit)
+    
+    @staticmethod
+    def _page_cache_key(filters, sort, cursor, limit, fields):
+        return (
+            tuple(sorted((filters or {}).items())),
+            sort,
+            cursor,
+            int(limit),
+            tuple(fields) if fields else None
+        )
+    
+    @staticmethod
+    def _page_query(filters, sort, cursor, limit, fields):
+        """Build the find arguments or aggregation pipeline for a catalog page"""
+        if sort not in SORT_OPTIONS:
+            raise ValueError(f'Invalid sort: {sort}')
+        
+        query = Product._build_query(filters)
+        key, direction = SORT_OPTIONS[sort]
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        
+        projection = None
+        if fields:
+            unknown = set(fields) - set(PROJECTABLE_FIELDS)
+            if unknown:
+                raise ValueError(f'Unknown fields: {", ".join(sorted(unknown))}')
+            projection = {field: 1 for field in fields}
+        
+        if key == 'score':
+            if '$text' not in query:
+                raise ValueError('Sorting by relevance requires a search term')
+            
+            pipeline = [
+                {'$match': query},
+                {'$addFields': {'score': {'$meta': 'textScore'}}}
+            ]
+            if cursor:
+                pipeline.append({'$match': keyset_filter(key, direction, *decode_cursor(cursor, sort))})
+            pipeline += [
+                {'$sort': {key: direction, '_id': direction}},
+                {'$limit': limit + 1}
+            ]
+            if projection:
+                pipeline.append({'$project': {**projection, key: 1, 'version': 1}})
+            return {'pipeline': pipeline}
+        
+        if cursor:
+            query = {'$and': [query, keyset_filter(key, direction, *decode_cursor(cursor, sort))]}
+        if projection:
+            projection[key] = 1
+            projection['version'] = 1
+        return {
+            'filter': query,
+            'projection': projection,
+            'sort': [(key, direction), ('_id', direction)],
+            'limit': limit + 1
+        }
+    
+    @staticmethod
+    def _page_result(products, sort, limit):
+        """Trim the look-ahead document and build the next page cursor"""
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        next_cursor = None
+        if len(products) > limit:
+            products = products[:limit]
+            last = products[-1]
+            next_cursor = encode_cursor(sort, last.get(SORT_OPTIONS[sort][0]), last['_id'])
+        
+        return products, next_cursor
+    
+    @staticmethod
+    def _build_query(filters):
+        """Translate catalog filters into a MongoDB query"""
         query = {}
         
         if filters:
@@ -59,53 +340,572 @@ class Product:
             if 'in_stock' in filters and filters['in_stock']:
                 query['stock'] = {'$gt': 0}
         
-        return list(db.products.find(query))
+        return query
     
     @staticmethod
     def update_product(product_id, update_data):
         """Update product information"""
-        return db.products.update_one(
-            {'_id': ObjectId(product_id)},
-            {'$set': update_data}
-        )
+        query = {'_id': ObjectId(product_id)}
+        if 'stock' in update_data:
+            query.update({'stock_shards': {'$exists': False}, 'stock_shards_lock': {'$exists': False}})
+        result = db.products.update_one(query, {'$set': update_data, '$inc': {'version': 1}})
+        if 'stock' in update_data and not result.matched_count:
+            # Sharded stock, or stock being moved by a transition, is replaced
+            # under the transition lock, the other fields as usual
+            StockShards.set_total(product_id, update_data['stock'])
+            fields = {field: value for field, value in update_data.items() if field != 'stock'}
+            if fields:
+                result = db.products.update_one({'_id': ObjectId(product_id)}, {'$set': fields, '$inc': {'version': 1}})
+        Product._notify_change('update', [product_id], update_data.keys())
+        return result
     
     @staticmethod
     def update_stock(product_id, new_stock):
         """Update product stock"""
-        return db.products.update_one(
-            {'_id': ObjectId(product_id)},
-            {'$set': {'stock': new_stock}}
+        result = db.products.update_one(
+            {'_id': ObjectId(product_id), 'stock_shards': {'$exists': False}, 'stock_shards_lock': {'$exists': False}},
+            {'$set': {'stock': new_stock}, '$inc': {'version': 1}}
+        )
+        if not result.matched_count:
+            StockShards.set_total(product_id, new_stock)
+        Product._notify_change('update', [product_id], ['stock'])
+        return result
+    
+    @staticmethod
+    def set_stock_shards(product_id, shards):
+        """Split a hot product's stock over shards sub-counters, 0 moves it back onto the product
+
+        Returns the stock moved, None if the product does not exist or is not sharded.
+        """
+        if shards:
+            moved = StockShards.enable(product_id, shards)
+        else:
+            moved = StockShards.disable(product_id)
+        Product._notify_change('update', [product_id], ['stock', 'stock_shards'])
+        return moved
+    
+    @staticmethod
+    def reserve_stock(items):
+        """Reserve stock for all line items of an order, all or nothing.
+
+        Products are fetched with one $in query and decremented with guarded
+        updates in one ordered bulk_write. A guard that fails makes its
+        update fail, which stops the batch at the offending line; lines
+        applied before it are released again and the product is re-read to
+        raise the StockReservationError that fits, missing, concurrently
+        sharded or out of stock.
+        """
+        quantities = Product._line_quantities(items)
+        
+        # Stock must be read from the primary, secondaries may lag behind
+        products_collection = db.products.with_options(read_preference=ReadPreference.PRIMARY)
+        products = {
+            product['_id']: product
+            for product in products_collection.find({'_id': {'$in': list(quantities)}})
+        }
+        
+        # Fail fast before writing anything
+        StockShards.overlay(products.values())
+        Product._check_stock(quantities, products)
+        
+        # Sharded products are taken from their stock shards first
+        shard_reservations = []
+        for product_id, quantity in quantities.items():
+            product = products[product_id]
+            if not StockShards.is_sharded(product):
+                continue
+            if not StockShards.reserve(product_id, product['stock_shards'], quantity):
+                Product.release_stock(shard_reservations)
+                available_stock = StockShards.totals([product_id]).get(product_id, 0)
+                raise StockReservationError(
+                    f'Insufficient stock for {product["name"]}. Available: {available_stock}',
+                    product_id,
+                    available_stock=available_stock
+                )
+            shard_reservations.append({'product': product, 'quantity': quantity})
+        
+        lines = [
+            (product_id, quantity) for product_id, quantity in quantities.items()
+            if not StockShards.is_sharded(products[product_id])
+        ]
+        
+        matched = len(lines)
+        failed_index = None
+        try:
+            if lines:
+                matched = products_collection.bulk_write(
+                    [Product._guarded_decrement(product_id, quantity) for product_id, quantity in lines],
+                    ordered=True
+                ).matched_count
+        except BulkWriteError as e:
+            error = e.details['writeErrors'][0]
+            if error.get('code') != STOCK_GUARD_ERROR:
+                Product.release_stock(shard_reservations + [
+                    {'product': products[product_id], 'quantity': quantity}
+                    for product_id, quantity in lines[:error['index']]
+                ])
+                raise StockReservationError(error.get('errmsg', 'Stock update failed'),
+                                            lines[error['index']][0], status_code=500)
+            failed_index = error['index']
+        
+        if failed_index is not None or matched < len(lines):
+            # Released lines of products deleted meanwhile match nothing and are no-ops
+            applied = lines if failed_index is None else lines[:failed_index]
+            Product.release_stock(shard_reservations + [
+                {'product': products[product_id], 'quantity': quantity} for product_id, quantity in applied
+            ])
+            if failed_index is not None:
+                raise Product._guard_failure(lines[failed_index][0], products_collection)
+            existing = {product['_id'] for product in products_collection.find(
+                {'_id': {'$in': [product_id for product_id, _ in lines]}}, {'_id': 1}
+            )}
+            product_id = next(product_id for product_id, _ in lines if product_id not in existing)
+            raise StockReservationError(f'Product {product_id} not found', product_id, status_code=404)
+        
+        Product._notify_change('update', list(quantities), ['stock'])
+        
+        # Read back the stock left after the decrement for logs and broadcasts
+        new_stock = StockShards.totals([reservation['product']['_id'] for reservation in shard_reservations])
+        if lines:
+            new_stock.update(
+                (product['_id'], product['stock'])
+                for product in products_collection.find(
+                    {'_id': {'$in': [product_id for product_id, _ in lines]}}, {'stock': 1}
+                )
+            )
+        
+        reservations = []
+        for product_id, quantity in quantities.items():
+            stock = new_stock.get(product_id, products[product_id]['stock'] - quantity)
+            reservations.append({
+                'product': products[product_id],
+                'quantity': quantity,
+                'old_stock': stock + quantity,
+                'new_stock': stock
+            })
+        return reservations
+    
+    @staticmethod
+    def reserve_stock_in_session(items, session):
+        """Reserve stock for the line items of an order inside a transaction.
+
+        The products are read from the transaction's snapshot and decremented
+        with conditional $inc updates; a concurrent writer makes the
+        transaction abort with a retryable write conflict instead. Nothing
+        needs compensating, aborting the transaction discards the
+        decrements. Caches are left alone until notify_stock_change is called
+        after the commit.
+        """
+        quantities = Product._line_quantities(items)
+        products = {
+            product['_id']: product
+            for product in db.products.find({'_id': {'$in': list(quantities)}}, session=session)
+        }
+        StockShards.overlay(products.values(), session)
+        Product._check_stock(quantities, products)
+        
+        lines = []
+        for product_id, quantity in quantities.items():
+            product = products[product_id]
+            if not StockShards.is_sharded(product):
+                lines.append((product_id, quantity))
+            elif not StockShards.reserve(product_id, product['stock_shards'], quantity, session):
+                raise StockReservationError('Stock changed during the order', product_id)
+        
+        if lines:
+            result = db.products.bulk_write([
+                UpdateOne(
+                    {'_id': product_id, 'stock': {'$gte': quantity}, 'stock_shards': {'$exists': False}},
+                    {'$inc': {'stock': -quantity, 'version': 1}}
+                )
+                for product_id, quantity in lines
+            ], ordered=True, session=session)
+            if result.modified_count != len(lines):
+                # Not expected under snapshot isolation, aborts the transaction all the same
+                raise StockReservationError('Stock changed during the order', lines[0][0])
+        
+        return [{
+            'product': products[product_id],
+            'quantity': quantity,
+            'old_stock': products[product_id]['stock'],
+            'new_stock': products[product_id]['stock'] - quantity
+        } for product_id, quantity in quantities.items()]
+    
+    @staticmethod
+    def notify_stock_change(product_ids):
+        """Invalidate cached products whose stock was changed by a committed transaction"""
+        StockShards.refresh_snapshots(product_ids)
+        Product._notify_change('update', product_ids, ['stock'])
+    
+    @staticmethod
+    def _line_quantities(items):
+        """Total quantity of each product of a line item list, in first-seen order"""
+        quantities = {}
+        for item in items:
+            product_id = ObjectId(item['product_id'])
+            quantities[product_id] = quantities.get(product_id, 0) + int(item['quantity'])
+        return quantities
+    
+    @staticmethod
+    def _check_stock(quantities, products):
+        """Raise StockReservationError for the first line that is missing or out of stock"""
+        for product_id, quantity in quantities.items():
+            product = products.get(product_id)
+            if not product:
+                raise StockReservationError(
+                    f'Product {product_id} not found', product_id, status_code=404
+                )
+            if product['stock'] < quantity:
+                raise StockReservationError(
+                    f'Insufficient stock for {product["name"]}. Available: {product["stock"]}',
+                    product_id,
+                    available_stock=product['stock']
+                )
+    
+    @staticmethod
+    def _guarded_decrement(product_id, quantity):
+        """Update taking quantity from an unsharded product, failing with STOCK_GUARD_ERROR when it falls short
+
+        The guard sits in the update pipeline rather than the filter, so a
+        failed guard is a write error at its index, which stops an ordered
+        bulk_write there, instead of an update that silently matches nothing.
+        """
+        return UpdateOne({'_id': product_id}, [{'$set': {
+            'stock': {'$cond': [
+                {'$and': [
+                    {'$gte': ['$stock', quantity]},
+                    {'$eq': [{'$ifNull': ['$stock_shards', 0]}, 0]}
+                ]},
+                {'$subtract': ['$stock', quantity]},
+                # Cannot be evaluated, fails the update with a ConversionFailure
+                {'$toInt': 'stock guard'}
+            ]},
+            'version': {'$add': [{'$ifNull': ['$version', 0]}, 1]}
+        }}])
+    
+    @staticmethod
+    def _guarded_increment(product_id, quantity):
+        """Update giving quantity back to an unsharded product, failing with STOCK_GUARD_ERROR once it is sharded"""
+        return UpdateOne({'_id': product_id}, [{'$set': {
+            'stock': {'$cond': [
+                {'$eq': [{'$ifNull': ['$stock_shards', 0]}, 0]},
+                {'$add': ['$stock', quantity]},
+                {'$toInt': 'stock guard'}
+            ]},
+            'version': {'$add': [{'$ifNull': ['$version', 0]}, 1]}
+        }}])
+    
+    @staticmethod
+    def _guard_failure(product_id, products_collection):
+        """Tell why the stock guard of a product did not match, re-reading it"""
+        current = products_collection.find_one({'_id': product_id}, {'name': 1, 'stock': 1, 'stock_shards': 1})
+        if current is None:
+            return StockReservationError(f'Product {product_id} not found', product_id, status_code=404)
+        if StockShards.is_sharded(current):
+            return StockReservationError('Stock changed concurrently, please retry the order', product_id)
+        return StockReservationError(
+            f'Insufficient stock for {current["name"]}. Available: {current["stock"]}',
+            product_id,
+            available_stock=current['stock']
         )
     
+    @staticmethod
+    def release_stock(reservations):
+        """Give reserved stock back, used to compensate a failed order
+
+        Stock of a product sharded since it was reserved goes to its shards,
+        the document's stock being a snapshot by then.
+        """
+        lines = []
+        for reservation in reservations:
+            product = reservation['product']
+            if StockShards.is_sharded(product):
+                StockShards.release(product['_id'], product['stock_shards'], reservation['quantity'])
+            else:
+                lines.append((product['_id'], reservation['quantity']))
+        if lines:
+            try:
+                db.products.bulk_write(
+                    [Product._guarded_increment(product_id, quantity) for product_id, quantity in lines],
+                    ordered=False
+                )
+            except BulkWriteError as e:
+                errors = e.details['writeErrors']
+                for error in errors:
+                    if error.get('code') == STOCK_GUARD_ERROR:
+                        product_id, quantity = lines[error['index']]
+                        StockShards.release(product_id, None, quantity)
+                if any(error.get('code') != STOCK_GUARD_ERROR for error in errors):
+                    raise
+        if reservations:
+            Product._notify_change(
+                'update', [reservation['product']['_id'] for reservation in reservations], ['stock']
+            )
+    
+    @staticmethod
+    def reserve_stock_batch(orders, max_attempts=BATCH_RESERVATION_ATTEMPTS):
+        """Reserve stock for many orders at once, each order all-or-nothing.
+
+        orders is a list of line item lists. The products of every order are
+        read with one $in query and stock is allocated in memory, in request
+        order. The allocated quantities are decremented with one guarded
+        update per product, however many orders use it, in a single unordered
+        bulk_write. When stock changed concurrently a product's guard fails:
+        only the orders using it give their other lines back in one more
+        bulk_write and are allocated again, up to max_attempts rounds.
+        
+        Returns one entry per order: its reservations, in the format of
+        reserve_stock, or the StockReservationError that rejected it.
+        """
+        products_collection = db.products.with_options(read_preference=ReadPreference.PRIMARY)
+        quantities = [Product._line_quantities(items) for items in orders]
+        
+        results = [None] * len(orders)
+        snapshots = {}
+        committed = []
+        pending = list(range(len(orders)))
+        
+        for _ in range(max_attempts):
+            if not pending:
+                break
+            product_ids = list({product_id for index in pending for product_id in quantities[index]})
+            products = {
+                product['_id']: product
+                for product in products_collection.find({'_id': {'$in': product_ids}})
+            }
+            StockShards.overlay(products.values())
+            
+            # Allocate against the stock just read, rejecting orders that do not fit
+            remaining = {product_id: product['stock'] for product_id, product in products.items()}
+            allocated = []
+            for index in pending:
+                error = None
+                for product_id, quantity in quantities[index].items():
+                    if product_id not in products:
+                        error = StockReservationError(f'Product {product_id} not found', product_id, status_code=404)
+                        break
+                    if remaining[product_id] < quantity:
+                        error = StockReservationError(
+                            f'Insufficient stock for {products[product_id]["name"]}. Available: {remaining[product_id]}',
+                            product_id,
+                            available_stock=remaining[product_id]
+                        )
+                        break
+                if error is not None:
+                    results[index] = error
+                    continue
+                for product_id, quantity in quantities[index].items():
+                    remaining[product_id] -= quantity
+                allocated.append(index)
+            
+            totals = defaultdict(int)
+            for index in allocated:
+                for product_id, quantity in quantities[index].items():
+                    totals[product_id] += quantity
+            if not totals:
+                pending = []
+                break
+            
+            # Sharded products are taken from their stock shards, one product at a time
+            failed = set()
+            for product_id, quantity in totals.items():
+                product = products[product_id]
+                if StockShards.is_sharded(product) and not StockShards.reserve(product_id, product['stock_shards'], quantity):
+                    failed.add(product_id)
+            
+            # One guarded decrement per product in a single unordered bulk_write; a
+            # product that was deleted, sharded or ran short concurrently fails, which
+            # the next round's read tells apart
+            lines = [
+                (product_id, quantity) for product_id, quantity in totals.items()
+                if not StockShards.is_sharded(products[product_id])
+            ]
+            matched, errors = len(lines), []
+            try:
+                if lines:
+                    matched = products_collection.bulk_write(
+                        [Product._guarded_decrement(product_id, quantity) for product_id, quantity in lines],
+                        ordered=False
+                    ).matched_count
+            except BulkWriteError as e:
+                errors = e.details['writeErrors']
+                matched = e.details['nMatched']
+            failed.update(lines[error['index']][0] for error in errors)
+            if matched < len(lines) - len(errors):
+                # Deleted products match nothing
+                existing = {product['_id'] for product in products_collection.find(
+                    {'_id': {'$in': [product_id for product_id, _ in lines]}}, {'_id': 1}
+                )}
+                failed.update(product_id for product_id, _ in lines if product_id not in existing)
+            
+            # Orders using a failed product give back their other lines and go again
+            retry = [index for index in allocated if failed & quantities[index].keys()]
+            released = defaultdict(int)
+            for index in retry:
+                for product_id, quantity in quantities[index].items():
+                    if product_id not in failed:
+                        released[product_id] += quantity
+            Product.release_stock([
+                {'product': products[product_id], 'quantity': quantity} for product_id, quantity in released.items()
+            ])
+            Product._notify_change('update', [product_id for product_id in totals if product_id not in failed], ['stock'])
+            
+            for index in allocated:
+                if index not in retry:
+                    committed.append(index)
+                    snapshots[index] = products
+            pending = retry
+        
+        for index in pending:
+            product_id = next(iter(quantities[index]))
+            results[index] = StockReservationError(
+                'Stock changed concurrently, please retry the order', product_id, status_code=409
+            )
+        
+        # Read back the stock left and walk it back through the committed orders
+        product_ids = list({product_id for index in committed for product_id in quantities[index]})
+        stock = {
+            product['_id']: product['stock']
+            for product in StockShards.overlay(list(
+                products_collection.find({'_id': {'$in': product_ids}}, {'stock': 1, 'stock_shards': 1})
+            ))
+        }
+        for index in reversed(committed):
+            reservations = []
+            for product_id, quantity in quantities[index].items():
+                product = snapshots[index][product_id]
+                new_stock = stock.get(product_id, product['stock'] - quantity)
+                stock[product_id] = new_stock + quantity
+                reservations.append({
+                    'product': product,
+                    'quantity': quantity,
+                    'old_stock': new_stock + quantity,
+                    'new_stock': new_stock
+                })
+            results[index] = reservations
+        return results
+    
     @staticmethod
     def delete_product(product_id):
         """Delete product"""
-        return db.products.delete_one({'_id': ObjectId(product_id)})
+        result = db.products.delete_one({'_id': ObjectId(product_id)})
+        Statistics.increment({'products.total': -result.deleted_count})
+        Product._notify_change('delete', [product_id])
+        return result
     
     @staticmethod
     def get_low_stock_products(threshold=5):
         """Get products with low stock"""
-        return list(db.products.find({'stock': {'$lte': threshold}}))
+        return list(analytics_db.products.find({'stock': {'$lte': threshold}}))
     
     @staticmethod
     def get_categories():
         """Get all unique categories"""
-        return db.products.distinct('category')
-    
-    @staticmethod
-    def get_top_selling_products(limit=5):
-        """Get top selling products based on order history"""
-        pipeline = [
-            {'$lookup': {
-                'from': 'orders',
-                'localField': '_id',
-                'foreignField': 'product_list.product_id',
-                'as': 'orders'
-            }},
-            {'$addFields': {
-                'total_sold': {'$sum': '$orders.product_list.quantity'}
-            }},
-            {'$sort': {'total_sold': -1}},
-            {'$limit': limit}
+        return category_cache.get_or_load('categories', lambda: catalog_db.products.distinct('category'))
+    
+    @staticmethod
+    def get_top_selling_products(limit=5, seller_id=None, days=None):
+        """Get top selling products from the incrementally maintained sales counters"""
+        ranking = ProductSales.get_top_products(limit, seller_id=seller_id, days=days)
+        products = {
+            product['_id']: product
+            for product in catalog_db.products.find({'_id': {'$in': [product_id for product_id, _ in ranking]}})
+        }
+        return [
+            {**products[product_id], 'total_sold': total_sold}
+            for product_id, total_sold in ranking
+            if product_id in products
         ]
-        return list(db.products.aggregate(pipeline))
\ No newline at end of file
+    
+    @staticmethod
+    def handle_change(change):
+        """Invalidate cached entries affected by a products or stock shards change event"""
+        if change.get('ns', {}).get('coll') == shards_collection.name:
+            change = StockShards.product_change(change)
+        operation = change.get('operationType')
+        if operation in ('drop', 'rename', 'dropDatabase', 'invalidate'):
+            Product.reset_caches()
+            return
+        
+        product_id = change.get('documentKey', {}).get('_id')
+        if product_id is not None:
+            product_cache.invalidate(str(product_id))
+            search_index.refresh(product_id)
+        
+        Product._invalidate_pages(operation, product_id, change)
+        
+        updated_fields = change.get('updateDescription', {}).get('updatedFields', {})
+        if operation != 'update' or 'category' in updated_fields:
+            category_cache.clear()
+    
+    @staticmethod
+    def _invalidate_pages(operation, product_id, change):
+        """Drop the cached catalog pages an update can change, every page after other writes"""
+        update = change.get('updateDescription', {})
+        fields = set(update.get('updatedFields', {})) | set(update.get('removedFields', []))
+        fields = {field.split('.')[0] for field in fields} - UNLISTED_FIELDS
+        if operation != 'update' or product_id is None:
+            # Inserts, replacements and deletes may move any page
+            catalog_cache.clear()
+            return
+        if not fields:
+            return
+        
+        dependencies = set().union(*(PAGE_DEPENDENCIES.get(field, ()) for field in fields))
+        
+        def affected(key, page):
+            filters, sort, _, _, projection = key
+            used = {name for name, value in filters if value not in (None, '', False)} | {sort}
+            if used & dependencies:
+                return True
+            shown = fields if projection is None else fields & set(projection)
+            return bool(shown) and any(product['_id'] == product_id for product in page[0])
+        
+        catalog_cache.invalidate_where(affected)
+    
+    @staticmethod
+    def reset_caches():
+        """Drop every cached product, page and category list and rebuild the search index"""
+        product_cache.clear()
+        catalog_cache.clear()
+        category_cache.clear()
+        search_index.rebuild()
+    
+    @staticmethod
+    def _notify_change(operation, product_ids, fields=()):
+        """Invalidate local caches after a write and publish it to local watchers"""
+        for product_id in product_ids:
+            change = {
+                'operationType': operation,
+                'documentKey': {'_id': ObjectId(product_id)},
+                'updateDescription': {'updatedFields': {field: None for field in fields}}
+            }
+            Product.handle_change(change)
+            if CACHE_INVALIDATION == 'local':
+                local_change_stream.publish(change)
+    
+    @staticmethod
+    def start_cache_invalidation():
+        """Start invalidating caches from the change stream of the products and their stock shards"""
+        if CACHE_INVALIDATION == 'off':
+            return None
+        
+        if CACHE_INVALIDATION == 'local':
+            watch = local_change_stream.watch
+        else:
+            # Orders on sharded products only write their shards
+            pipeline = [
+                {'$match': {'$or': [
+                    {'ns.coll': {'$in': [db.products.name, shards_collection.name]}},
+                    {'operationType': {'$in': ['dropDatabase', 'invalidate']}}
+                ]}},
+                {'$project': {'operationType': 1, 'ns': 1, 'documentKey': 1, 'updateDescription': 1}}
+            ]
+            watch = lambda resume_after=None: db.watch(pipeline, resume_after=resume_after)
+        
+        return ChangeStreamInvalidator(watch, Product.handle_change, Product.reset_caches).start()
+    
+    @staticmethod
+    def cache_stats():
+        """Get hit/miss metrics of the product caches"""
+        return [cache.stats() for cache in (product_cache, catalog_cache, category_cache)]
\ No newline at end of file
@@ -0,0 +1,155 @@
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import UpdateOne
+from database.connection import db, analytics_db
+
+# product_sales holds all-time totals per product and product_sales_daily one
+# document per product and UTC day, both maintained incrementally by Order.
+class ProductSales:
+    @staticmethod
+    def record_order(product_list, timestamp, sign=1):
+        """Add an order's line items to the counters, or remove them with sign=-1"""
+        ProductSales.record_orders([(product_list, timestamp)], sign)
+    
+    @staticmethod
+    def record_orders(orders, sign=1):
+        """Add the line items of several (product_list, timestamp) orders with one bulk write per collection"""
+        totals, daily = {}, {}
+        for product_list, timestamp in orders:
+            day = timestamp.strftime('%Y-%m-%d')
+            ordered = set()
+            for item in product_list:
+                product_id = item['product_id']
+                for counters, key in ((totals, product_id), (daily, (product_id, day))):
+                    line = counters.setdefault(key, {
+                        'seller_id': item.get('seller_id'),
+                        'quantity': 0,
+                        'revenue': 0.0,
+                        'orders': 0
+                    })
+                    line['quantity'] += item['quantity']
+                    line['revenue'] += item['quantity'] * item['price']
+                    # An order counts once per product however many lines it has
+                    if product_id not in ordered:
+                        line['orders'] += 1
+                ordered.add(product_id)
+        
+        if not totals:
+            return
+        
+        def increments(line):
+            return {
+                'total_sold': sign * line['quantity'],
+                'revenue': sign * line['revenue'],
+                'order_count': sign * line['orders']
+            }
+        
+        total_operations = []
+        for product_id, line in totals.items():
+            fields = {'seller_id': line['seller_id']} if line['seller_id'] else {}
+            total_operations.append(UpdateOne(
+                {'_id': product_id},
+                {'$inc': increments(line), '$set': fields} if fields else {'$inc': increments(line)},
+                upsert=True
+            ))
+        
+        daily_operations = []
+        for (product_id, day), line in daily.items():
+            fields = {'seller_id': line['seller_id']} if line['seller_id'] else {}
+            daily_operations.append(UpdateOne(
+                {'_id': f'{product_id}:{day}'},
+                {
+                    '$inc': increments(line),
+                    '$set': {'product_id': product_id, 'day': day, **fields}
+                },
+                upsert=True
+            ))
+        
+        db.product_sales.bulk_write(total_operations, ordered=False)
+        db.product_sales_daily.bulk_write(daily_operations, ordered=False)
+    
+    @staticmethod
+    def get_top_products(limit=5, seller_id=None, days=None):
+        """Get (product_id, total_sold) pairs ranked by units sold
+
+        Without days the all-time counters are read straight from the
+        total_sold index; with days the daily counters in the window are summed.
+        """
+        query = {}
+        if seller_id:
+            query['seller_id'] = ObjectId(seller_id)
+        
+        if not days:
+            query['total_sold'] = {'$gt': 0}
+            return [
+                (sales['_id'], sales['total_sold'])
+                for sales in analytics_db.product_sales.find(
+                    query,
+                    {'total_sold': 1},
+                    sort=[('total_sold', -1)],
+                    limit=limit
+                )
+            ]
+        
+        query['day'] = {'$gte': (datetime.utcnow() - timedelta(days=days)).strftime('%Y-%m-%d')}
+        pipeline = [
+            {'$match': query},
+            {'$group': {'_id': '$product_id', 'total_sold': {'$sum': '$total_sold'}}},
+            {'$match': {'total_sold': {'$gt': 0}}},
+            {'$sort': {'total_sold': -1}},
+            {'$limit': limit}
+        ]
+        return [(sales['_id'], sales['total_sold']) for sales in analytics_db.product_sales_daily.aggregate(pipeline)]
+    
+    @staticmethod
+    def rebuild():
+        """Recompute every counter from the orders collection"""
+        # One document per order and product, so that an order counts once per
+        # product however many lines it has, as in record_orders
+        lines = [
+            {'$match': {'status': {'$ne': 'cancelled'}}},
+            {'$unwind': '$product_list'},
+            {'$group': {
+                '_id': {'order_id': '$_id', 'product_id': '$product_list.product_id'},
+                'timestamp': {'$first': '$timestamp'},
+                'seller_id': {'$max': '$product_list.seller_id'},
+                'quantity': {'$sum': '$product_list.quantity'},
+                'revenue': {'$sum': {'$multiply': ['$product_list.quantity', '$product_list.price']}}
+            }}
+        ]
+        
+        db.product_sales.delete_many({})
+        db.orders.aggregate(lines + [
+            {'$group': {
+                '_id': '$_id.product_id',
+                'seller_id': {'$max': '$seller_id'},
+                'total_sold': {'$sum': '$quantity'},
+                'revenue': {'$sum': '$revenue'},
+                'order_count': {'$sum': 1}
+            }},
+            {'$merge': {'into': 'product_sales'}}
+        ])
+        
+        db.product_sales_daily.delete_many({})
+        db.orders.aggregate(lines + [
+            {'$group': {
+                '_id': {
+                    'product_id': '$_id.product_id',
+                    'day': {'$dateToString': {'format': '%Y-%m-%d', 'date': '$timestamp'}}
+                },
+                'seller_id': {'$max': '$seller_id'},
+                'total_sold': {'$sum': '$quantity'},
+                'revenue': {'$sum': '$revenue'},
+                'order_count': {'$sum': 1}
+            }},
+            {'$project': {
+                '_id': {'$concat': [{'$toString': '$_id.product_id'}, ':', '$_id.day']},
+                'product_id': '$_id.product_id',
+                'day': '$_id.day',
+                'seller_id': 1,
+                'total_sold': 1,
+                'revenue': 1,
+                'order_count': 1
+            }},
+            {'$merge': {'into': 'product_sales_daily'}}
+        ])
@@ -0,0 +1,387 @@
+import bisect
+import heapq
+import math
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from bson import ObjectId
+from database.connection import db, catalog_db
+from models.write_behind import WriteBehindWriter
+from utils.pagination import encode_cursor, decode_cursor
+
+# 'memory' keeps an in-process index on every node, 'off' disables the search endpoints
+SEARCH_INDEX = os.getenv('SEARCH_INDEX', 'memory')
+# Product writes are re-read and applied to the index in batches at this interval
+SEARCH_REFRESH_MS = int(os.getenv('SEARCH_REFRESH_MS', 200))
+# Index terms a single query token may expand to through prefix or fuzzy matching
+SEARCH_MAX_EXPANSIONS = int(os.getenv('SEARCH_MAX_EXPANSIONS', 50))
+# Shorter trailing tokens only match whole terms, their prefix ranges are too wide
+SEARCH_MIN_PREFIX = int(os.getenv('SEARCH_MIN_PREFIX', 2))
+
+# Weight of a term by the field it occurs in, summed over fields
+FIELD_WEIGHTS = (('name', 3.0), ('category', 2.0), ('description', 1.0))
+# Share of the weight kept by prefix and fuzzy (trigram) matches
+PREFIX_FACTOR = 0.7
+FUZZY_FACTOR = 0.4
+# Minimum trigram Jaccard similarity for a fuzzy match
+FUZZY_MIN_SIMILARITY = 0.4
+
+# Upper bounds of the price facet buckets, the last bucket is open-ended
+PRICE_BUCKETS = (10, 25, 50, 100, 250, 500, 1000)
+PRICE_BUCKET_LABELS = [
+    f'{lower}-{upper}' for lower, upper in zip((0,) + PRICE_BUCKETS, PRICE_BUCKETS)
+] + [f'{PRICE_BUCKETS[-1]}+']
+
+INDEXED_PROJECTION = {'name': 1, 'description': 1, 'category': 1, 'price': 1, 'stock': 1, 'seller_id': 1}
+
+SEARCH_SORT = 'search'
+
+_TOKEN = re.compile(r'\w+')
+
+class SearchUnavailableError(Exception):
+    """Raised while the index is disabled or still being built"""
+
+def tokenize(text):
+    """Lowercased word tokens of a field value"""
+    return _TOKEN.findall(str(text).lower()) if text else []
+
+def _trigrams(term):
+    padded = f'  {term} '
+    return {padded[index:index + 3] for index in range(len(padded) - 2)}
+
+def _prefix_end(prefix):
+    """Smallest string sorting after every string starting with prefix"""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+class _Entry:
+    __slots__ = ('id', 'key', 'name', 'category', 'price', 'stock', 'seller_id', 'terms')
+
+    def __init__(self, document, terms):
+        self.id = document['_id']
+        # Tie-breaker compared as bytes, ObjectId comparisons run in Python
+        self.key = document['_id'].binary
+        self.name = document.get('name', '')
+        self.category = document.get('category', '')
+        self.price = float(document.get('price') or 0)
+        self.stock = int(document.get('stock') or 0)
+        self.seller_id = document.get('seller_id')
+        self.terms = terms
+
+    def to_suggestion(self, score):
+        return {
+            '_id': self.id,
+            'name': self.name,
+            'category': self.category,
+            'price': self.price,
+            'stock': self.stock,
+            'score': round(score, 4)
+        }
+
+class _IndexData:
+    """Documents and term dictionaries of one index generation.
+
+    Products are numbered internally so postings are keyed by ints, which
+    hash far faster than ObjectIds in the intersection loops.
+    """
+    def __init__(self):
+        self.entries = {}
+        self.docnos = {}
+        # term -> {docno: weight}
+        self.postings = {}
+        # Sorted vocabulary, prefix matches are a bisected range of it
+        self.terms = []
+        # trigram -> terms containing it
+        self.trigrams = defaultdict(set)
+        self._next_docno = 0
+        self._sorted = True
+
+    def add(self, document, bulk=False):
+        """Index a product document, replacing its previous version"""
+        self.remove(document['_id'])
+        weights = defaultdict(float)
+        for field, weight in FIELD_WEIGHTS:
+            for term in set(tokenize(document.get(field))):
+                weights[term] += weight
+
+        docno = self._next_docno
+        self._next_docno += 1
+        self.entries[docno] = _Entry(document, tuple(weights))
+        self.docnos[document['_id']] = docno
+        for term, weight in weights.items():
+            posting = self.postings.get(term)
+            if posting is None:
+                posting = self.postings[term] = {}
+                # A bulk build sorts the vocabulary once at the end
+                if bulk:
+                    self.terms.append(term)
+                    self._sorted = False
+                else:
+                    bisect.insort(self.terms, term)
+                for trigram in _trigrams(term):
+                    self.trigrams[trigram].add(term)
+            posting[docno] = weight
+
+    def remove(self, product_id):
+        docno = self.docnos.pop(product_id, None)
+        if docno is None:
+            return
+        entry = self.entries.pop(docno)
+        for term in entry.terms:
+            posting = self.postings[term]
+            del posting[docno]
+            if posting:
+                continue
+            del self.postings[term]
+            del self.terms[bisect.bisect_left(self.terms, term)]
+            for trigram in _trigrams(term):
+                terms = self.trigrams[trigram]
+                terms.discard(term)
+                if not terms:
+                    del self.trigrams[trigram]
+
+    def finish_bulk(self):
+        if not self._sorted:
+            self.terms.sort()
+            self._sorted = True
+
+    def expand(self, token, prefix):
+        """Index terms a query token matches, with the factor their weight is scaled by"""
+        expansions = {}
+        if token in self.postings:
+            expansions[token] = 1.0
+
+        if prefix and len(token) >= SEARCH_MIN_PREFIX:
+            start = bisect.bisect_left(self.terms, token)
+            end = bisect.bisect_left(self.terms, _prefix_end(token), start)
+            candidates = self.terms[start:end]
+            if len(candidates) > SEARCH_MAX_EXPANSIONS:
+                # Keep the most common completions
+                candidates = heapq.nlargest(SEARCH_MAX_EXPANSIONS, candidates,
+                                            key=lambda term: len(self.postings[term]))
+            for term in candidates:
+                expansions.setdefault(term, PREFIX_FACTOR)
+
+        if not expansions and len(token) >= 3:
+            # Typo tolerance through terms sharing enough trigrams with the token
+            trigrams = _trigrams(token)
+            shared = defaultdict(int)
+            for trigram in trigrams:
+                for term in self.trigrams.get(trigram, ()):
+                    shared[term] += 1
+            similar = []
+            for term, count in shared.items():
+                similarity = count / (len(trigrams) + len(term) + 2 - count)
+                if similarity >= FUZZY_MIN_SIMILARITY:
+                    similar.append((similarity, term))
+            for similarity, term in heapq.nlargest(SEARCH_MAX_EXPANSIONS, similar):
+                expansions[term] = FUZZY_FACTOR * similarity
+        return expansions
+
+    def match(self, token, prefix):
+        """Score of every product matching a query token, weighted by field and IDF"""
+        scores = {}
+        total = len(self.entries)
+        for term, factor in self.expand(token, prefix).items():
+            posting = self.postings[term]
+            factor *= math.log(1 + total / len(posting))
+            for docno, weight in posting.items():
+                score = weight * factor
+                if score > scores.get(docno, 0.0):
+                    scores[docno] = score
+        return scores
+
+    def candidates(self, tokens, prefix):
+        """Products matching every token, with their summed scores"""
+        if not tokens:
+            return dict.fromkeys(self.entries, 0.0)
+
+        last = len(tokens) - 1
+        matches = sorted(
+            (self.match(token, prefix and index == last) for index, token in enumerate(tokens)),
+            key=len
+        )
+        # Intersect starting from the most selective token
+        scores = {}
+        smallest, others = matches[0], matches[1:]
+        for docno, score in smallest.items():
+            for other in others:
+                other_score = other.get(docno)
+                if other_score is None:
+                    break
+                score += other_score
+            else:
+                scores[docno] = score
+        return scores
+
+class SearchIndex:
+    """In-memory inverted, prefix and trigram index over the product catalog.
+
+    The index is built from MongoDB in a background thread at startup and
+    kept fresh from the same change events that invalidate the product
+    caches: changed products are queued in a write-behind buffer and
+    re-read with one $in query per batch. Searches return ranked keyset
+    pages plus category and price facet counts.
+    """
+    def __init__(self, mode=SEARCH_INDEX, refresh_interval=SEARCH_REFRESH_MS / 1000):
+        self.enabled = mode != 'off'
+        self.ready = False
+        self._data = _IndexData()
+        self._lock = threading.Lock()
+        self._building = False
+        self._changed_during_build = set()
+        self._refresher = WriteBehindWriter(
+            'search_index', self._reload, batch_size=1000, flush_interval=refresh_interval
+        )
+        self.builds = 0
+        self.last_build_ms = 0.0
+        self.searches = 0
+
+    def start(self):
+        """Build the index in a daemon thread"""
+        self.rebuild()
+        return self
+
+    def rebuild(self):
+        """Rebuild from MongoDB in the background, the current index keeps serving meanwhile"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._building:
+                return
+            self._building = True
+        threading.Thread(target=self._build, name='search-index-build', daemon=True).start()
+
+    def _build(self):
+        started = time.perf_counter()
+        data = _IndexData()
+        try:
+            for document in catalog_db.products.find({}, INDEXED_PROJECTION, batch_size=5000):
+                data.add(document, bulk=True)
+            data.finish_bulk()
+        except Exception as e:
+            print(f'Search index build error: {e}')
+            with self._lock:
+                self._building = False
+            return
+
+        with self._lock:
+            self._data = data
+            self._building = False
+            self.ready = True
+            changed, self._changed_during_build = self._changed_during_build, set()
+        self.builds += 1
+        self.last_build_ms = (time.perf_counter() - started) * 1000
+        print(f'Search index built: {len(data.entries)} products in {self.last_build_ms:.0f} ms')
+        # Writes seen while building may predate the snapshot that was read
+        if changed:
+            self._reload(list(changed))
+
+    def refresh(self, product_id):
+        """Queue a changed or deleted product for re-indexing"""
+        if self.enabled:
+            self._refresher.write([product_id])
+
+    def _reload(self, product_ids):
+        product_ids = list({ObjectId(product_id) for product_id in product_ids})
+        documents = {
+            document['_id']: document
+            for document in db.products.find({'_id': {'$in': product_ids}}, INDEXED_PROJECTION)
+        }
+        with self._lock:
+            if self._building:
+                self._changed_during_build.update(product_ids)
+            for product_id in product_ids:
+                if product_id in documents:
+                    self._data.add(documents[product_id])
+                else:
+                    self._data.remove(product_id)
+
+    def search(self, query, filters=None, cursor=None, limit=20, prefix=True, facets=True):
+        """Rank the products matching query and the filters.
+
+        Every token must match; the last one also matches as a prefix when
+        prefix is set. Returns the hits of the requested page as (entry,
+        score) pairs, the total number of matches, the facet counts and the
+        cursor of the next page. The category facet ignores the category
+        filter and the price facet the price filters, so they show what
+        selecting another value would return.
+        """
+        if not self.enabled:
+            raise SearchUnavailableError('Search is disabled on this node')
+        if not self.ready:
+            raise SearchUnavailableError('Search index is still being built')
+
+        filters = filters or {}
+        category = filters.get('category') or None
+        min_price = float(filters['min_price']) if filters.get('min_price') not in (None, '') else None
+        max_price = float(filters['max_price']) if filters.get('max_price') not in (None, '') else None
+        in_stock = bool(filters.get('in_stock'))
+        after = None
+        if cursor:
+            score, last_id = decode_cursor(cursor, SEARCH_SORT)
+            after = (float(score), ObjectId(last_id).binary)
+
+        tokens = tokenize(query)
+        with self._lock:
+            entries = self._data.entries
+            candidates = self._data.candidates(tokens, prefix)
+
+            category_counts = defaultdict(int)
+            price_counts = [0] * len(PRICE_BUCKET_LABELS)
+            hits = []
+            for docno, score in candidates.items():
+                entry = entries[docno]
+                if in_stock and entry.stock <= 0:
+                    continue
+                price_matches = (min_price is None or entry.price >= min_price) and \
+                    (max_price is None or entry.price <= max_price)
+                category_matches = category is None or entry.category == category
+                if facets:
+                    if price_matches:
+                        category_counts[entry.category] += 1
+                    if category_matches:
+                        price_counts[bisect.bisect_right(PRICE_BUCKETS, entry.price)] += 1
+                if price_matches and category_matches:
+                    hits.append((score, entry.key, entry))
+        self.searches += 1
+
+        total = len(hits)
+        if after is not None:
+            hits = [hit for hit in hits if (hit[0], hit[1]) < after]
+        page = heapq.nlargest(limit + 1, hits, key=lambda hit: (hit[0], hit[1]))
+        next_cursor = None
+        if len(page) > limit:
+            page = page[:limit]
+            next_cursor = encode_cursor(SEARCH_SORT, page[-1][0], page[-1][2].id)
+
+        result = {
+            'hits': [(entry, score) for score, _, entry in page],
+            'total': total,
+            'next_cursor': next_cursor
+        }
+        if facets:
+            result['facets'] = {
+                'category': dict(sorted(category_counts.items(), key=lambda item: (-item[1], item[0]))),
+                'price': {label: count for label, count in zip(PRICE_BUCKET_LABELS, price_counts) if count}
+            }
+        return result
+
+    def stats(self):
+        """Index size and freshness for monitoring"""
+        with self._lock:
+            products = len(self._data.entries)
+            terms = len(self._data.postings)
+        return {
+            'enabled': self.enabled,
+            'ready': self.ready,
+            'products': products,
+            'terms': terms,
+            'builds': self.builds,
+            'last_build_ms': round(self.last_build_ms, 3),
+            'searches': self.searches,
+            'pending_refreshes': self._refresher.stats()['queue_depth']
+        }
+
+search_index = SearchIndex()
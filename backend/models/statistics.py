@@ -0,0 +1,137 @@
+import os
+import random
+from datetime import datetime
+from database.connection import db, analytics_db
+from database.sessions import snapshot_session
+from models.cache import TTLCache
+
+LOW_STOCK_THRESHOLD = 5
+
+# Counters are spread over several documents so that concurrent writes do not
+# all contend on a single hot document; reads sum the shards and the baseline
+# stored by the last rebuild.
+COUNTER_SHARDS = int(os.getenv('STATISTICS_COUNTER_SHARDS', 8))
+
+statistics_cache = TTLCache('statistics', max_entries=8, ttl=float(os.getenv('STATISTICS_CACHE_TTL', 5)))
+
+class Statistics:
+    @staticmethod
+    def increment(counters):
+        """Apply counter deltas such as {'users_by_role.buyer': 1} to a random shard"""
+        counters = {field: delta for field, delta in counters.items() if delta}
+        if not counters:
+            return
+        
+        db.statistics.update_one(
+            {'_id': f'counters:{random.randrange(COUNTER_SHARDS)}'},
+            {'$inc': counters},
+            upsert=True
+        )
+    
+    @staticmethod
+    def is_initialized():
+        """Check whether a baseline has been seeded by a rebuild"""
+        return statistics_cache.get_or_load(
+            'initialized',
+            lambda: db.statistics.count_documents({'_id': 'meta', 'initialized': True}) > 0
+        )
+    
+    @staticmethod
+    def get_dashboard():
+        """Get admin dashboard statistics from the counters, seeding them on first use"""
+        return statistics_cache.get_or_load('dashboard', Statistics._load_dashboard)
+    
+    @staticmethod
+    def _load_dashboard():
+        if Statistics.is_initialized():
+            counters = {}
+            for shard in db.statistics.find({'_id': {'$regex': '^(counters:|baseline$)'}}):
+                shard.pop('_id')
+                _add(counters, shard)
+        else:
+            counters = Statistics.rebuild()
+        
+        users_by_role = counters.get('users_by_role', {})
+        return {
+            'total_users': sum(users_by_role.values()),
+            'users_by_role': users_by_role,
+            'total_products': counters.get('products', {}).get('total', 0),
+            'low_stock_products': analytics_db.products.count_documents({'stock': {'$lte': LOW_STOCK_THRESHOLD}}),
+            'order_statistics': [
+                {'_id': status, 'count': values.get('count', 0), 'total_amount': values.get('total_amount', 0)}
+                for status, values in counters.get('orders_by_status', {}).items()
+                if values.get('count')
+            ],
+            'inventory_statistics': [
+                {'_id': change_type, 'count': values.get('count', 0), 'total_change': values.get('total_change', 0)}
+                for change_type, values in counters.get('inventory', {}).items()
+                if values.get('count')
+            ]
+        }
+    
+    @staticmethod
+    def rebuild():
+        """Recompute every counter with aggregations and store them as the new baseline
+
+        Shards keep counting during the rebuild and are never reset. They and
+        the aggregations are read from the primary in one snapshot session,
+        so they see the same writes, and the baseline is stored as the
+        aggregations minus the shards in a single write; later increments add
+        on top of it.
+        """
+        with snapshot_session() as session:
+            shards, counters = Statistics._aggregate(session)
+        
+        baseline = {}
+        _add(baseline, counters)
+        _add(baseline, shards, sign=-1)
+        db.statistics.replace_one({'_id': 'baseline'}, baseline, upsert=True)
+        db.statistics.update_one(
+            {'_id': 'meta'},
+            {'$set': {'initialized': True, 'rebuilt_at': datetime.utcnow()}},
+            upsert=True
+        )
+        statistics_cache.set('initialized', True)
+        return counters
+    
+    @staticmethod
+    def _aggregate(session=None):
+        """Sum the counter shards and recompute every counter, both read in session"""
+        shards = {}
+        for shard in db.statistics.find({'_id': {'$regex': '^counters:'}}, session=session):
+            shard.pop('_id')
+            _add(shards, shard)
+        
+        counters = {
+            'users_by_role': {
+                group['_id']: group['count']
+                for group in db.users.aggregate([{'$group': {'_id': '$role', 'count': {'$sum': 1}}}], session=session)
+            },
+            'products': {'total': db.products.count_documents({}, session=session)},
+            'orders_by_status': {
+                group['_id']: {'count': group['count'], 'total_amount': group['total_amount']}
+                for group in db.orders.aggregate([{'$group': {
+                    '_id': '$status',
+                    'count': {'$sum': 1},
+                    'total_amount': {'$sum': '$total_amount'}
+                }}], session=session)
+            },
+            'inventory': {
+                group['_id']: {'count': group['count'], 'total_change': group['total_change']}
+                # From the daily rollups, raw inventory logs expire
+                for group in db.inventory_daily.aggregate([{'$group': {
+                    '_id': '$change_type',
+                    'count': {'$sum': '$count'},
+                    'total_change': {'$sum': '$total_change'}
+                }}], session=session)
+            }
+        }
+        return shards, counters
+
+def _add(target, source, sign=1):
+    """Recursively add the numeric leaves of source into target, or subtract them with sign=-1"""
+    for key, value in source.items():
+        if isinstance(value, dict):
+            _add(target.setdefault(key, {}), value, sign)
+        else:
+            target[key] = target.get(key, 0) + sign * value
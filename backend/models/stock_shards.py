@@ -0,0 +1,393 @@
+import os
+import random
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import UpdateOne, ReadPreference, ReturnDocument
+from database.connection import db
+from realtime.emitter import emitter
+
+# Upper bound of the sub-counters one product's stock can be split into
+MAX_STOCK_SHARDS = int(os.getenv('MAX_STOCK_SHARDS', 64))
+# Rounds of taking stock from several shards before concurrent buyers win
+SHARD_RESERVATION_ATTEMPTS = int(os.getenv('SHARD_RESERVATION_ATTEMPTS', 3))
+# Seconds after which the transition lock of a node that died mid-transition is taken over
+STOCK_SHARDS_LOCK_SECONDS = int(os.getenv('STOCK_SHARDS_LOCK_SECONDS', 30))
+# Pause between attempts to take a product's transition lock
+STOCK_SHARDS_LOCK_RETRY = 0.02
+# Attempts to find where released stock belongs before it goes into the picked shard regardless
+STOCK_RELEASE_ATTEMPTS = 10
+
+# Shard counters must be read from the primary, secondaries may lag behind
+shards_collection = db.product_stock_shards.with_options(read_preference=ReadPreference.PRIMARY)
+
+class StockShards:
+    """Stock of hot products split over sub-counter documents.
+
+    A flagged product (stock_shards: N on its document) keeps its stock in N
+    product_stock_shards documents {_id: '<product_id>:<i>', product_id,
+    shard, stock}. Buyers decrement one shard picked at random with a
+    conditional $inc, so concurrent orders of the product spread their
+    writes over N documents instead of serializing on one. When the picked
+    shard cannot cover an order, stock is taken from the fullest shards and
+    what is left is spread evenly again. The stock field of the product
+    document is a snapshot of the total, refreshed on rebalances outside
+    transactions and when it crosses zero after one, for listings and
+    filters; overlay() replaces it with the exact total.
+
+    enable, disable and set_total of a product run one at a time under a
+    lock on its document (stock_shards_lock). Shards are created before
+    the product is flagged and deleted only once empty, and stock given
+    back to a shard that no longer exists goes to the product's current
+    layout, so stock moved concurrently with a transition is never lost.
+    """
+    @staticmethod
+    def shard_id(product_id, index):
+        return f'{product_id}:{index}'
+
+    @staticmethod
+    def is_sharded(product):
+        return bool(product and product.get('stock_shards'))
+
+    @staticmethod
+    def split(total, shards):
+        """Spread total over shards as evenly as integers allow"""
+        return [total // shards + (1 if index < total % shards else 0) for index in range(shards)]
+
+    @staticmethod
+    def enable(product_id, shards):
+        """Split a product's stock over shards sub-counters, or re-split it, returns the stock moved"""
+        product_id = ObjectId(product_id)
+        if not 1 <= shards <= MAX_STOCK_SHARDS:
+            raise ValueError(f'Shard count must be between 1 and {MAX_STOCK_SHARDS}')
+
+        with StockShards._transition(product_id) as product:
+            if product is None:
+                return None
+
+            # Every shard exists before orders and releases can see the new layout
+            StockShards._fill(product_id, shards, 0)
+            # From here on the stock guards of unsharded orders no longer match the product
+            previous = db.products.find_one_and_update(
+                {'_id': product_id},
+                {'$set': {'stock_shards': shards}, '$inc': {'version': 1}},
+                return_document=ReturnDocument.BEFORE
+            )
+            if previous is None:
+                return None
+
+            if previous.get('stock_shards'):
+                total = StockShards._drain(product_id) + StockShards._remove(product_id, shards)
+            else:
+                total = previous['stock']
+            StockShards._fill(product_id, shards, total)
+            db.products.update_one({'_id': product_id}, {'$set': {'stock': total}})
+            return total
+
+    @staticmethod
+    def disable(product_id):
+        """Move the stock of a sharded product back onto its document, returns the stock moved"""
+        product_id = ObjectId(product_id)
+        with StockShards._transition(product_id) as product:
+            if not StockShards.is_sharded(product):
+                return None
+
+            # Stock released from here on goes to the document, on top of what the shards held
+            db.products.update_one(
+                {'_id': product_id},
+                {'$unset': {'stock_shards': ''}, '$set': {'stock': 0}, '$inc': {'version': 1}}
+            )
+            total = StockShards._remove(product_id)
+            db.products.update_one({'_id': product_id}, {'$inc': {'stock': total}})
+            return total
+
+    @staticmethod
+    def set_total(product_id, total):
+        """Replace the stock of a product, across its shards when it is sharded
+
+        Returns the previous stock, None if the product does not exist.
+        """
+        product_id = ObjectId(product_id)
+        with StockShards._transition(product_id) as product:
+            if product is None:
+                return None
+            if not StockShards.is_sharded(product):
+                previous = db.products.find_one_and_update(
+                    {'_id': product_id}, {'$set': {'stock': total}, '$inc': {'version': 1}}
+                )
+                return previous['stock'] if previous else None
+
+            previous = StockShards._drain(product_id)
+            StockShards._fill(product_id, product['stock_shards'], total)
+            db.products.update_one({'_id': product_id}, {'$set': {'stock': total}, '$inc': {'version': 1}})
+            return previous
+
+    @staticmethod
+    def reserve(product_id, shards, quantity, session=None):
+        """Take quantity from a product's shards, returns False when they do not hold enough"""
+        product_id = ObjectId(product_id)
+        result = shards_collection.update_one(
+            {'_id': StockShards.shard_id(product_id, random.randrange(shards)), 'stock': {'$gte': quantity}},
+            {'$inc': {'stock': -quantity}},
+            session=session
+        )
+        if result.modified_count:
+            return True
+
+        # The picked shard is exhausted: take from the fullest shards instead
+        for _ in range(SHARD_RESERVATION_ATTEMPTS):
+            stock = StockShards._shard_stock(product_id, session)
+            if sum(stock.values()) < quantity:
+                return False
+
+            takes, needed = [], quantity
+            for shard_id, available in sorted(stock.items(), key=lambda item: -item[1]):
+                if needed == 0:
+                    break
+                take = min(available, needed)
+                if take > 0:
+                    takes.append((shard_id, take))
+                    needed -= take
+
+            taken = []
+            for shard_id, take in takes:
+                result = shards_collection.update_one(
+                    {'_id': shard_id, 'stock': {'$gte': take}}, {'$inc': {'stock': -take}}, session=session
+                )
+                if not result.modified_count:
+                    break
+                taken.append((shard_id, take))
+
+            if len(taken) == len(takes):
+                StockShards.rebalance(product_id, shards, session)
+                return True
+            # A concurrent buyer got there first, give back and plan again
+            for shard_id, take in taken:
+                StockShards._credit(product_id, shard_id, take, session)
+        return False
+
+    @staticmethod
+    def release(product_id, shards, quantity, session=None):
+        """Give quantity back to a random shard, or to the product document once it is no longer sharded
+
+        shards is the shard count the stock was reserved under, None when the
+        product has been sharded since.
+        """
+        product_id = ObjectId(product_id)
+        shard_id = StockShards.shard_id(product_id, random.randrange(shards)) if shards else None
+        StockShards._credit(product_id, shard_id, quantity, session)
+
+    @staticmethod
+    def rebalance(product_id, shards, session=None):
+        """Spread a product's stock evenly over its shards again, returns the total
+
+        Excess stock is taken from shards above their share with conditional
+        $inc updates, so buyers decrementing concurrently are never
+        overdrawn, and handed to the shards below it. Outside a transaction
+        the product document's stock snapshot is refreshed with the total;
+        inside one it is left alone, order transactions only write shards.
+        """
+        product_id = ObjectId(product_id)
+        stock = StockShards._shard_stock(product_id, session)
+        total = sum(stock.values())
+        targets = dict(zip(
+            [StockShards.shard_id(product_id, index) for index in range(shards)],
+            StockShards.split(total, shards)
+        ))
+
+        moved = 0
+        for shard_id, available in stock.items():
+            excess = available - targets.get(shard_id, 0)
+            if excess > 0 and shards_collection.update_one(
+                {'_id': shard_id, 'stock': {'$gte': excess}}, {'$inc': {'stock': -excess}}, session=session
+            ).modified_count:
+                moved += excess
+
+        for shard_id, target in targets.items():
+            deficit = min(target - stock.get(shard_id, 0), moved)
+            if deficit > 0:
+                StockShards._credit(product_id, shard_id, deficit, session)
+                moved -= deficit
+
+        if session is None:
+            StockShards._set_snapshot(product_id, total)
+        return total
+
+    @staticmethod
+    def refresh_snapshots(product_ids):
+        """Correct the stock snapshot of sharded products whose total crossed zero
+
+        Called after order transactions, which leave the product documents
+        alone. Only a snapshot on the wrong side of zero is written, which
+        keeps in-stock filters right without a write per order.
+        """
+        for product_id, total in StockShards.totals(product_ids).items():
+            db.products.update_one(
+                {
+                    '_id': product_id,
+                    'stock_shards': {'$exists': True},
+                    'stock_shards_lock': {'$exists': False},
+                    'stock': {'$gt': 0} if total <= 0 else {'$lte': 0}
+                },
+                {'$set': {'stock': total}}
+            )
+
+    @staticmethod
+    def product_change(change):
+        """Products change event for a change event of the shards collection
+
+        Shard writes leave the product document alone, so caches of the
+        product would not see its stock change otherwise.
+        """
+        if change.get('operationType') not in ('insert', 'update', 'replace', 'delete'):
+            return change
+        product_id = change['documentKey']['_id'].rsplit(':', 1)[0]
+        return {
+            'operationType': 'update',
+            'documentKey': {'_id': ObjectId(product_id)},
+            'updateDescription': {'updatedFields': {'stock': None}}
+        }
+
+    @staticmethod
+    def totals(product_ids, session=None):
+        """Exact stock of sharded products, summed over their shards"""
+        if not product_ids:
+            return {}
+        return {
+            total['_id']: total['stock']
+            for total in shards_collection.aggregate(StockShards.totals_pipeline(product_ids), session=session)
+        }
+
+    @staticmethod
+    def totals_pipeline(product_ids):
+        return [
+            {'$match': {'product_id': {'$in': [ObjectId(product_id) for product_id in product_ids]}}},
+            {'$group': {'_id': '$product_id', 'stock': {'$sum': '$stock'}}}
+        ]
+
+    @staticmethod
+    def overlay(products, session=None):
+        """Replace the stock snapshot of sharded products with their exact total, in place"""
+        sharded = [product for product in products if StockShards.is_sharded(product)]
+        if sharded:
+            totals = StockShards.totals([product['_id'] for product in sharded], session)
+            for product in sharded:
+                product['stock'] = totals.get(product['_id'], 0)
+        return products
+
+    @staticmethod
+    def stats(product_id):
+        """Shard counters of a product, in shard order"""
+        return list(shards_collection.find(
+            {'product_id': ObjectId(product_id)}, {'_id': 0, 'shard': 1, 'stock': 1}, sort=[('shard', 1)]
+        ))
+
+    @staticmethod
+    def _shard_stock(product_id, session=None):
+        return {
+            shard['_id']: shard['stock']
+            for shard in shards_collection.find({'product_id': product_id}, {'stock': 1}, session=session)
+        }
+
+    @staticmethod
+    @contextmanager
+    def _transition(product_id):
+        """Hold the product's transition lock, yields the product document or None if it does not exist"""
+        while True:
+            now = datetime.utcnow()
+            product = db.products.find_one_and_update(
+                {'_id': product_id, '$or': [
+                    {'stock_shards_lock': {'$exists': False}},
+                    {'stock_shards_lock': {'$lt': now - timedelta(seconds=STOCK_SHARDS_LOCK_SECONDS)}}
+                ]},
+                {'$set': {'stock_shards_lock': now}},
+                return_document=ReturnDocument.AFTER
+            )
+            if product is not None or not db.products.count_documents({'_id': product_id}, limit=1):
+                break
+            emitter.sleep(STOCK_SHARDS_LOCK_RETRY)
+        try:
+            yield product
+        finally:
+            if product is not None:
+                db.products.update_one(
+                    {'_id': product_id, 'stock_shards_lock': now}, {'$unset': {'stock_shards_lock': ''}}
+                )
+
+    @staticmethod
+    def _credit(product_id, shard_id, quantity, session=None):
+        """Add quantity to a shard, or wherever the product's stock lives if the shard was removed"""
+        for _ in range(STOCK_RELEASE_ATTEMPTS):
+            if shard_id is not None and shards_collection.update_one(
+                {'_id': shard_id}, {'$inc': {'stock': quantity}}, session=session
+            ).matched_count:
+                return
+            # Removed by a concurrent disable or re-split: the document if no longer sharded
+            if db.products.update_one(
+                {'_id': product_id, 'stock_shards': {'$exists': False}},
+                {'$inc': {'stock': quantity, 'version': 1}},
+                session=session
+            ).matched_count:
+                return
+            product = db.products.find_one({'_id': product_id}, {'stock_shards': 1}, session=session)
+            if product is None:
+                return
+            shards = product.get('stock_shards')
+            shard_id = StockShards.shard_id(product_id, random.randrange(shards)) if shards else None
+        # Still moving, the next transition drains the shard wherever it ends up
+        if shard_id is not None:
+            shards_collection.update_one(
+                {'_id': shard_id},
+                {'$setOnInsert': {'product_id': product_id, 'shard': int(shard_id.rsplit(':', 1)[1])},
+                 '$inc': {'stock': quantity}},
+                upsert=True,
+                session=session
+            )
+
+    @staticmethod
+    def _set_snapshot(product_id, total):
+        """Store total as the product's stock snapshot, unless a transition is moving its stock"""
+        db.products.update_one(
+            {'_id': product_id, 'stock_shards': {'$exists': True}, 'stock_shards_lock': {'$exists': False}},
+            {'$set': {'stock': total}}
+        )
+
+    @staticmethod
+    def _drain(product_id, first_shard=0):
+        """Zero the shards of a product from first_shard on, returns the stock they held"""
+        total = 0
+        query = {'product_id': product_id, 'shard': {'$gte': first_shard}}
+        for shard in list(shards_collection.find(query, {'_id': 1})):
+            previous = shards_collection.find_one_and_update(
+                {'_id': shard['_id']}, {'$set': {'stock': 0}}, return_document=ReturnDocument.BEFORE
+            )
+            total += previous['stock'] if previous else 0
+        return total
+
+    @staticmethod
+    def _remove(product_id, first_shard=0):
+        """Delete the shards of a product from first_shard on, returns the stock they held
+
+        Only empty shards are deleted; stock released into one after it was
+        drained is drained again on the next round.
+        """
+        query = {'product_id': product_id, 'shard': {'$gte': first_shard}}
+        total = 0
+        while True:
+            shards_collection.delete_many({**query, 'stock': 0})
+            left = StockShards._drain(product_id, first_shard)
+            total += left
+            if not left and not shards_collection.count_documents(query, limit=1):
+                return total
+
+    @staticmethod
+    def _fill(product_id, shards, total):
+        """Add total to a product's shards, evenly, creating missing ones"""
+        shards_collection.bulk_write([
+            UpdateOne(
+                {'_id': StockShards.shard_id(product_id, index)},
+                {'$setOnInsert': {'product_id': product_id, 'shard': index}, '$inc': {'stock': share}},
+                upsert=True
+            )
+            for index, share in enumerate(StockShards.split(total, shards))
+        ], ordered=False)
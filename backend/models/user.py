@@ -1,7 +1,8 @@
 from bson import ObjectId
 from datetime import datetime
-import bcrypt
 from database.connection import db
+from models.statistics import Statistics
+from utils.passwords import password_hasher, PasswordPoolSaturated
 
 class User:
     def __init__(self, name, email, password, role='buyer'):
@@ -12,12 +13,12 @@ class User:
         self.created_at = datetime.utcnow()
     
     def _hash_password(self, password):
-        """Hash password using bcrypt"""
-        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+        """Hash password using bcrypt on the password pool"""
+        return password_hasher.hash(password)
     
     def check_password(self, password):
         """Check if provided password matches hash"""
-        return bcrypt.checkpw(password.encode('utf-8'), self.password_hash)
+        return password_hasher.verify(password, self.password_hash)
     
     def save(self):
         """Save user to database"""
@@ -29,6 +30,7 @@ class User:
             'created_at': self.created_at
         }
         result = db.users.insert_one(user_data)
+        Statistics.increment({f'users_by_role.{self.role}': 1})
         return result.inserted_id
     
     @staticmethod
@@ -36,6 +38,24 @@ class User:
         """Find user by email"""
         return db.users.find_one({'email': email})
     
+    @staticmethod
+    def verify_password(user, password):
+        """Check password for a stored user, upgrading the hash if the bcrypt cost changed"""
+        if not password_hasher.verify(password, user['password_hash']):
+            return False
+        
+        if password_hasher.needs_rehash(user['password_hash']):
+            try:
+                new_hash = password_hasher.hash(password)
+            except PasswordPoolSaturated:
+                # Upgrade on a later login rather than failing this one
+                return True
+            db.users.update_one(
+                {'_id': user['_id'], 'password_hash': user['password_hash']},
+                {'$set': {'password_hash': new_hash}}
+            )
+        return True
+    
     @staticmethod
     def find_by_id(user_id):
         """Find user by ID"""
@@ -56,8 +76,11 @@ class User:
     
     @staticmethod
     def delete_user(user_id):
-        """Delete user"""
-        return db.users.delete_one({'_id': ObjectId(user_id)})
+        """Delete user, returns the deleted user"""
+        user = db.users.find_one_and_delete({'_id': ObjectId(user_id)}, {'role': 1})
+        if user:
+            Statistics.increment({f'users_by_role.{user["role"]}': -1})
+        return user
     
     def to_dict(self):
         """Convert user to dictionary"""
@@ -0,0 +1,159 @@
+import threading
+import time
+from realtime.emitter import emitter
+
+# How often callers waiting for their batch check whether it was written
+WAIT_POLL_INTERVAL = 0.002
+
+class WriteBehindError(Exception):
+    """Raised to callers waiting on a batch whose write failed"""
+
+class _Batch:
+    def __init__(self):
+        self.items = []
+        self.done = threading.Event()
+        self.error = None
+
+class WriteBehindWriter:
+    """Buffers items in process and hands them to write_batch in batches.
+
+    A batch is written when it reaches batch_size items or flush_interval
+    seconds after the previous flush, whichever comes first, from a daemon
+    thread. With wait_for_flush callers block until their batch is written
+    (concurrent callers share one write), otherwise write() returns
+    immediately and a failed batch is kept for the next flush. close()
+    writes whatever is left.
+    """
+    def __init__(self, name, write_batch, batch_size=500, flush_interval=0.1,
+                 wait_for_flush=False, max_buffer=100000):
+        self.name = name
+        self.write_batch = write_batch
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.wait_for_flush = wait_for_flush
+        self.max_buffer = max_buffer
+        self._batch = _Batch()
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+        self.flushes = 0
+        self.items_written = 0
+        self.failed_flushes = 0
+        self.dropped = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    def write(self, items):
+        """Queue items, waiting for them to be written when wait_for_flush is set"""
+        if not items:
+            return
+        if self._closed:
+            # Late writes during shutdown go straight through
+            self.write_batch(list(items))
+            return
+
+        with self._condition:
+            batch = self._batch
+            batch.items.extend(items)
+            full = len(batch.items) >= self.batch_size
+            overflowing = len(batch.items) >= self.max_buffer
+            # Waiting callers are flushed right away, callers arriving during
+            # that write are grouped into the next batch
+            if full or self.wait_for_flush:
+                self._condition.notify()
+        self._ensure_started()
+
+        # Back pressure: a writer far behind is drained by its callers
+        if overflowing:
+            self.flush()
+        if self.wait_for_flush:
+            # Polled with the server's sleep: Event.wait would block the eventlet
+            # hub, which is not monkey patched, and every request on the node
+            while not batch.done.is_set():
+                emitter.sleep(WAIT_POLL_INTERVAL)
+            if batch.error is not None:
+                raise WriteBehindError(f'{self.name} write failed: {batch.error}')
+
+    def flush(self):
+        """Write the buffered items now, returns how many were written"""
+        with self._flush_lock:
+            with self._condition:
+                batch, self._batch = self._batch, _Batch()
+            if not batch.items:
+                batch.done.set()
+                return 0
+
+            started = time.perf_counter()
+            try:
+                self.write_batch(batch.items)
+            except Exception as e:
+                self.failed_flushes += 1
+                print(f'{self.name} flush error: {e}')
+                if self.wait_for_flush:
+                    batch.error = e
+                else:
+                    self._requeue(batch.items)
+                batch.done.set()
+                return 0
+
+            elapsed = (time.perf_counter() - started) * 1000
+            self.flushes += 1
+            self.items_written += len(batch.items)
+            self.last_flush_ms = elapsed
+            self.max_flush_ms = max(self.max_flush_ms, elapsed)
+            self._total_flush_ms += elapsed
+            batch.done.set()
+            return len(batch.items)
+
+    def close(self):
+        """Stop the flush thread and write the remaining items"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=max(1.0, self.flush_interval * 10))
+        self.flush()
+
+    def stats(self):
+        """Queue depth and flush metrics"""
+        with self._condition:
+            queue_depth = len(self._batch.items)
+        return {
+            'name': self.name,
+            'wait_for_flush': self.wait_for_flush,
+            'queue_depth': queue_depth,
+            'flushes': self.flushes,
+            'items_written': self.items_written,
+            'failed_flushes': self.failed_flushes,
+            'dropped': self.dropped,
+            'last_flush_ms': round(self.last_flush_ms, 3),
+            'avg_flush_ms': round(self._total_flush_ms / self.flushes, 3) if self.flushes else 0.0,
+            'max_flush_ms': round(self.max_flush_ms, 3)
+        }
+
+    def _requeue(self, items):
+        with self._condition:
+            room = max(0, self.max_buffer - len(self._batch.items))
+            if room < len(items):
+                self.dropped += len(items) - room
+            self._batch.items[:0] = items[:room]
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._condition:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name=f'{self.name}-writer', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                idle = len(self._batch.items) < self.batch_size and not (self.wait_for_flush and self._batch.items)
+                if not self._closed and idle:
+                    self._condition.wait(self.flush_interval)
+                closed = self._closed
+            if closed:
+                return
+            self.flush()
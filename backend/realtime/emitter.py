@@ -0,0 +1,29 @@
+import threading
+import time
+
+def _start_thread(target, *args):
+    thread = threading.Thread(target=target, args=args, daemon=True)
+    thread.start()
+    return thread
+
+class Emitter:
+    """Routes emits from request handlers to whichever Socket.IO server is serving"""
+    def __init__(self):
+        self._emit = None
+        self.start_background_task = _start_thread
+        self.sleep = time.sleep
+
+    def bind(self, emit, start_background_task=None, sleep=None):
+        """Set the function called as emit(event, data, room=None), and the
+        server's background task primitives when it has its own (eventlet)"""
+        self._emit = emit
+        if start_background_task is not None:
+            self.start_background_task = start_background_task
+        if sleep is not None:
+            self.sleep = sleep
+
+    def emit(self, event, data, room=None):
+        if self._emit is not None:
+            self._emit(event, data, room=room)
+
+emitter = Emitter()
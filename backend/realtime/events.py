@@ -0,0 +1,62 @@
+# Socket.IO event handlers shared by the eventlet and ASGI serving modes.
+# Each handler receives a client adapter exposing sid, join_room, leave_room
+# and emit, so the same logic runs on Flask-SocketIO and python-socketio.
+
+from realtime.stock_updates import stock_updates
+
+# Store connected users for real-time updates
+connected_users = {}
+
+# Upper bound on products subscribed per subscribe call
+MAX_PRODUCT_SUBSCRIPTIONS = 500
+
+def handle_connect(client, data=None):
+    try:
+        print(f'Client connected: {client.sid}')
+        client.emit('connection_response', {'status': 'Connected to server'})
+    except Exception as e:
+        print(f'Connection error: {e}')
+        return False
+
+def handle_disconnect(client, data=None):
+    print(f'Client disconnected: {client.sid}')
+    stock_updates.forget(client.sid)
+    # Remove user from connected users
+    if client.sid in connected_users:
+        del connected_users[client.sid]
+
+def handle_join_user_room(client, data=None):
+    """Join user to their personal room for targeted notifications"""
+    user_id = (data or {}).get('user_id')
+    if user_id:
+        client.join_room(f"user_{user_id}")
+        connected_users[client.sid] = user_id
+        print(f'User {user_id} joined their room')
+
+def handle_join_sellers_room(client, data=None):
+    """Join sellers to a common room for inventory updates"""
+    client.join_room('sellers')
+    print('User joined sellers room')
+
+def _product_ids(data):
+    product_ids = (data or {}).get('product_ids') or []
+    if not isinstance(product_ids, list):
+        return []
+    return [str(product_id) for product_id in product_ids[:MAX_PRODUCT_SUBSCRIPTIONS] if product_id]
+
+def handle_subscribe_products(client, data=None):
+    """Subscribe the client to the stock changes of the products it is viewing"""
+    stock_updates.subscribe(client.sid, _product_ids(data))
+
+def handle_unsubscribe_products(client, data=None):
+    """Unsubscribe the client from products no longer in view"""
+    stock_updates.unsubscribe(client.sid, _product_ids(data))
+
+EVENT_HANDLERS = {
+    'connect': handle_connect,
+    'disconnect': handle_disconnect,
+    'join_user_room': handle_join_user_room,
+    'join_sellers_room': handle_join_sellers_room,
+    'subscribe_products': handle_subscribe_products,
+    'unsubscribe_products': handle_unsubscribe_products
+}
@@ -0,0 +1,199 @@
+"""Socket.IO message queue adapters for fanning emits out across nodes.
+
+Each node's Socket.IO server only knows its own clients, so an emit made on
+one node has to be relayed to the others. SOCKETIO_MESSAGE_QUEUE selects the
+relay:
+
+- empty: no relay, single node
+- local: in-process bus, for tests and benchmarks running several servers
+- mongo or mongo://<collection>: a capped collection in the application
+  database, tailed by every node, needs no extra services
+- redis://, kafka://, amqp:// and other URLs: python-socketio's own managers
+
+Transports deliver messages to a queue.Queue filled from a native thread.
+The managers block on it from a server background task, through eventlet's
+native thread pool under eventlet and a worker thread under asyncio, so
+the hub or event loop is never blocked waiting for the next message.
+
+Every manager built here also splits relayed stock_updates batches per
+client on the receiving node, see realtime/stock_updates.py.
+"""
+import asyncio
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+import socketio
+from socketio.async_pubsub_manager import AsyncPubSubManager
+from pymongo import CursorType, ReadPreference
+from pymongo.errors import CollectionInvalid, PyMongoError
+
+from realtime.stock_updates import AsyncStockUpdateManager, StockUpdateManager
+
+SOCKETIO_MESSAGE_QUEUE = os.getenv('SOCKETIO_MESSAGE_QUEUE', '')
+MONGO_QUEUE_COLLECTION = 'socketio_messages'
+MONGO_QUEUE_SIZE = int(os.getenv('SOCKETIO_QUEUE_SIZE_MB', 16)) * 1024 * 1024
+
+class LocalTransport:
+    """In-process bus, every subscriber receives every published message"""
+    def __init__(self):
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def publish(self, channel, payload):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscribed_channel, messages in subscribers:
+            if subscribed_channel == channel:
+                messages.put(payload)
+
+    def subscribe(self, channel):
+        messages = queue.Queue()
+        with self._lock:
+            self._subscribers.append((channel, messages))
+        return messages
+
+local_transport = LocalTransport()
+
+class MongoTransport:
+    """Capped collection tailed by every node.
+
+    Each subscriber keeps one tailable cursor open in $natural order, the
+    order the server wrote the messages in; ObjectIds are generated by each
+    node and do not order messages across nodes. A seed document keeps the
+    collection from being empty, on which a tailable cursor dies at once.
+    """
+    def __init__(self, db, collection_name=MONGO_QUEUE_COLLECTION, size=MONGO_QUEUE_SIZE, retry_delay=0.5):
+        self.db = db
+        self.collection_name = collection_name
+        self.size = size
+        self.retry_delay = retry_delay
+        self._ready = False
+
+    @property
+    def collection(self):
+        if not self._ready:
+            self._ensure_collection()
+        return self.db[self.collection_name]
+
+    def publish(self, channel, payload):
+        self.collection.insert_one({
+            'channel': channel,
+            'payload': payload,
+            'created_at': datetime.utcnow()
+        })
+
+    def subscribe(self, channel):
+        messages = queue.Queue()
+        thread = threading.Thread(target=self._tail, args=(channel, messages), daemon=True)
+        thread.start()
+        return messages
+
+    def _ensure_collection(self):
+        if self.collection_name not in self.db.list_collection_names():
+            try:
+                self.db.create_collection(self.collection_name, capped=True, size=self.size)
+            except CollectionInvalid:
+                # Created concurrently by another node
+                pass
+        collection = self.db[self.collection_name]
+        if collection.find_one({}, {'_id': 1}) is None:
+            collection.insert_one({'channel': None, 'created_at': datetime.utcnow()})
+        self._ready = True
+
+    def _tail(self, channel, messages):
+        # Tail the primary, a lagging secondary would delay every relayed emit
+        collection = self.collection.with_options(read_preference=ReadPreference.PRIMARY)
+        # Only relay messages published after this node subscribed
+        latest = collection.find_one({}, {'_id': 1}, sort=[('$natural', -1)])
+        last_id = latest['_id'] if latest else None
+        while True:
+            try:
+                # Resume after the last message seen, from the newest one if it was overwritten
+                if last_id is not None and collection.find_one({'_id': last_id}, {'_id': 1}) is None:
+                    print('Socket.IO message queue: position lost, relayed emits may have been missed')
+                    latest = collection.find_one({}, {'_id': 1}, sort=[('$natural', -1)])
+                    last_id = latest['_id'] if latest else None
+                skipping = last_id is not None
+                cursor = collection.find({}, cursor_type=CursorType.TAILABLE_AWAIT, sort=[('$natural', 1)])
+                while cursor.alive:
+                    for document in cursor:
+                        if skipping:
+                            skipping = document['_id'] != last_id
+                            continue
+                        last_id = document['_id']
+                        if document.get('channel') == channel:
+                            messages.put(document['payload'])
+                # The cursor died, its position was overwritten by the capped collection
+                time.sleep(self.retry_delay)
+            except PyMongoError as e:
+                print(f'Socket.IO message queue error: {e}')
+                time.sleep(self.retry_delay)
+
+class QueueManager(socketio.PubSubManager, StockUpdateManager):
+    """Socket.IO client manager relaying through a LocalTransport or MongoTransport"""
+    name = 'queue'
+
+    def __init__(self, transport, channel='socketio', write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.transport = transport
+
+    def _publish(self, data):
+        self.transport.publish(self.channel, self.json.dumps(data))
+
+    def _listen(self):
+        messages = self.transport.subscribe(self.channel)
+        get = messages.get
+        if self.server.async_mode == 'eventlet':
+            # Block in a native thread, the hub is not monkey patched
+            from eventlet import tpool
+            get = lambda: tpool.execute(messages.get)
+        while True:
+            yield get()
+
+class AsyncQueueManager(AsyncPubSubManager, AsyncStockUpdateManager):
+    """asyncio counterpart of QueueManager for the ASGI server"""
+    name = 'queue'
+
+    def __init__(self, transport, channel='socketio', write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.transport = transport
+
+    async def _publish(self, data):
+        await asyncio.to_thread(self.transport.publish, self.channel, self.json.dumps(data))
+
+    async def _listen(self):
+        messages = self.transport.subscribe(self.channel)
+        while True:
+            yield await asyncio.to_thread(messages.get)
+
+def create_client_manager(url=SOCKETIO_MESSAGE_QUEUE, asynchronous=False, channel='socketio'):
+    """Build the Socket.IO client manager for a message queue URL, a local one for a single node"""
+    if not url:
+        return AsyncStockUpdateManager() if asynchronous else StockUpdateManager()
+
+    if url in ('local', 'mongo') or url.startswith('mongo://'):
+        if url == 'local':
+            transport = local_transport
+        else:
+            from database.connection import db
+            collection_name = url.split('://', 1)[1] if '://' in url else ''
+            transport = MongoTransport(db, collection_name or MONGO_QUEUE_COLLECTION)
+        manager_class = AsyncQueueManager if asynchronous else QueueManager
+        return manager_class(transport, channel=channel)
+
+    # External brokers, same URL conventions as Flask-SocketIO's message_queue
+    if url.startswith(('redis://', 'rediss://')):
+        manager_class = socketio.AsyncRedisManager if asynchronous else socketio.RedisManager
+    elif url.startswith('kafka'):
+        if asynchronous:
+            raise ValueError('Kafka message queues are not supported in asgi mode')
+        manager_class = socketio.KafkaManager
+    else:
+        manager_class = socketio.AsyncAioPikaManager if asynchronous else socketio.KombuManager
+    # Fan stock batches out to the subscribers on the receiving end
+    stock_manager_class = AsyncStockUpdateManager if asynchronous else StockUpdateManager
+    manager_class = type(manager_class.__name__, (manager_class, stock_manager_class), {})
+    return manager_class(url, channel=channel)
@@ -0,0 +1,147 @@
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime
+
+import socketio
+
+from realtime.emitter import emitter
+
+STOCK_UPDATE_FLUSH_MS = int(os.getenv('STOCK_UPDATE_FLUSH_MS', 250))
+# Address of the batch relayed to every node, no client is ever in it
+STOCK_UPDATES_ROOM = 'stock_updates'
+
+class StockUpdateBatcher:
+    """Coalesces stock changes and sends them as stock_updates events once per flush.
+
+    Only the latest stock of each product is kept between flushes. A flush
+    relays the whole batch once to every node, and each node sends each of
+    its own clients a single event carrying the subscribed products that
+    changed, however many of them there are.
+    """
+    def __init__(self, emitter, interval_ms=STOCK_UPDATE_FLUSH_MS):
+        self.emitter = emitter
+        self.interval = interval_ms / 1000.0
+        self._pending = {}
+        # Subscriptions of this node's clients, by sid and by product
+        self._subscriptions = defaultdict(set)
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+        self._started = False
+        self.flushes = 0
+        self.emits = 0
+        self.updates_received = 0
+        self.updates_sent = 0
+
+    def subscribe(self, sid, product_ids):
+        """Send the client the stock changes of these products"""
+        with self._lock:
+            for product_id in product_ids:
+                self._subscriptions[sid].add(product_id)
+                self._subscribers[product_id].add(sid)
+
+    def unsubscribe(self, sid, product_ids):
+        """Stop sending the client the stock changes of these products"""
+        with self._lock:
+            for product_id in product_ids:
+                self._drop(sid, product_id)
+
+    def forget(self, sid):
+        """Drop every subscription of a disconnected client"""
+        with self._lock:
+            for product_id in list(self._subscriptions.get(sid, ())):
+                self._drop(sid, product_id)
+
+    def add(self, product_id, new_stock, product_name):
+        """Queue a stock change for the next flush"""
+        product_id = str(product_id)
+        with self._lock:
+            self._pending[product_id] = {
+                'product_id': product_id,
+                'new_stock': new_stock,
+                'product_name': product_name,
+                'timestamp': datetime.utcnow().isoformat()
+            }
+            self.updates_received += 1
+            start = not self._started
+            self._started = True
+        if start:
+            self.emitter.start_background_task(self._run)
+
+    def flush(self):
+        """Relay pending updates to every node now, returns how many were sent"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        self.emitter.emit('stock_updates', {'updates': list(pending.values())}, room=STOCK_UPDATES_ROOM)
+        with self._lock:
+            self.flushes += 1
+            self.updates_sent += len(pending)
+        return len(pending)
+
+    def batches(self, updates):
+        """Split a relayed batch into the updates each local client subscribed to, by sid"""
+        by_sid = defaultdict(list)
+        with self._lock:
+            for update in updates:
+                for sid in self._subscribers.get(update['product_id'], ()):
+                    by_sid[sid].append(update)
+            self.emits += len(by_sid)
+        return by_sid
+
+    def stats(self):
+        with self._lock:
+            return {
+                'interval_ms': int(self.interval * 1000),
+                'pending': len(self._pending),
+                'subscribed_clients': len(self._subscriptions),
+                'flushes': self.flushes,
+                'emits': self.emits,
+                'updates_received': self.updates_received,
+                'updates_sent': self.updates_sent
+            }
+
+    def _drop(self, sid, product_id):
+        sids = self._subscribers.get(product_id)
+        if sids is not None:
+            sids.discard(sid)
+            if not sids:
+                del self._subscribers[product_id]
+        product_ids = self._subscriptions.get(sid)
+        if product_ids is not None:
+            product_ids.discard(product_id)
+            if not product_ids:
+                del self._subscriptions[sid]
+
+    def _run(self):
+        while True:
+            self.emitter.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f'Stock update flush error: {e}')
+
+stock_updates = StockUpdateBatcher(emitter)
+
+class StockUpdateManager(socketio.Manager):
+    """Client manager sending a relayed stock batch to this node's subscribers, one event per sid.
+
+    Listed after a pub/sub manager in the bases, it runs on the receiving
+    end of the message queue, so every node fans the batch out to its own
+    clients.
+    """
+    def emit(self, event, data, namespace, room=None, skip_sid=None, callback=None, to=None, **kwargs):
+        if (to or room) != STOCK_UPDATES_ROOM:
+            return super().emit(event, data, namespace, room=room, skip_sid=skip_sid, callback=callback, to=to, **kwargs)
+        for sid, updates in stock_updates.batches(data['updates']).items():
+            super().emit(event, {'updates': updates}, namespace, room=sid)
+
+class AsyncStockUpdateManager(socketio.AsyncManager):
+    """asyncio counterpart of StockUpdateManager for the ASGI server"""
+    async def emit(self, event, data, namespace, room=None, skip_sid=None, callback=None, to=None, **kwargs):
+        if (to or room) != STOCK_UPDATES_ROOM:
+            return await super().emit(event, data, namespace, room=room, skip_sid=skip_sid, callback=callback, to=to, **kwargs)
+        for sid, updates in stock_updates.batches(data['updates']).items():
+            await super().emit(event, {'updates': updates}, namespace, room=sid)
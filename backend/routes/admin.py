@@ -1,12 +1,56 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from models.user import User
 from models.product import Product
-from models.order import Order
-from models.inventory_log import InventoryLog
+from models.order import Order, order_transactions
+from models.inventory_log import InventoryLog, log_writer
+from models.statistics import Statistics
+from models.search import search_index
+from models.stock_shards import StockShards
+from models.idempotency import idempotency_keys
 from utils.decorators import role_required
-from bson import json_util
-import json
+from utils.serialization import json_response
+from utils.streaming import ndjson_response, csv_response
+from utils.passwords import password_hasher
+from utils.metrics import profiler
+from realtime.stock_updates import stock_updates
+from datetime import datetime, timedelta, timezone
+
+ORDER_EXPORT_FIELDS = ['_id', 'buyer_id', 'seller_ids', 'status', 'total_amount', 'timestamp', 'product_list']
+INVENTORY_EXPORT_FIELDS = ['_id', 'product_id', 'change_type', 'old_stock', 'new_stock', 'reason', 'timestamp']
+
+def _parse_time(value, name):
+    """Parse an ISO 8601 query parameter to a naive UTC datetime"""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError as e:
+        raise ValueError(f'Invalid {name}, expected an ISO 8601 datetime') from e
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def _export_args():
+    """Read the shared export parameters: format, start/end or days, after_id and limit"""
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in ('ndjson', 'csv'):
+        raise ValueError('Invalid format, expected ndjson or csv')
+    
+    start = request.args.get('start')
+    end = request.args.get('end')
+    days = request.args.get('days')
+    return {
+        'format': export_format,
+        'start': _parse_time(start, 'start') if start else (
+            datetime.utcnow() - timedelta(days=int(days)) if days else None
+        ),
+        'end': _parse_time(end, 'end') if end else None,
+        'after_id': request.args.get('after_id'),
+        'limit': max(0, int(request.args.get('limit', 0)))
+    }
+
+def _list_arg(name):
+    value = request.args.get(name)
+    return [item.strip() for item in value.split(',') if item.strip()] if value else None
 
 def create_admin_blueprint():
     admin_bp = Blueprint('admin', __name__)
@@ -17,9 +61,7 @@ def create_admin_blueprint():
     def get_all_users():
         try:
             users = User.get_all_users()
-            users_json = json.loads(json_util.dumps(users))
-            
-            return jsonify({'users': users_json}), 200
+            return json_response({'users': users})
             
         except Exception as e:
             return jsonify({'error': str(e)}), 500
@@ -30,9 +72,7 @@ def create_admin_blueprint():
     def get_all_products():
         try:
             products = Product.get_all_products()
-            products_json = json.loads(json_util.dumps(products))
-            
-            return jsonify({'products': products_json}), 200
+            return json_response({'products': products})
             
         except Exception as e:
             return jsonify({'error': str(e)}), 500
@@ -45,47 +85,93 @@ def create_admin_blueprint():
             # Get recent orders (last 30 days by default)
             days = int(request.args.get('days', 30))
             orders = Order.get_recent_orders(days)
-            orders_json = json.loads(json_util.dumps(orders))
-            
-            return jsonify({'orders': orders_json}), 200
+            return json_response({'orders': orders})
             
         except Exception as e:
             return jsonify({'error': str(e)}), 500
     
-    @admin_bp.route('/dashboard', methods=['GET'])
+    @admin_bp.route('/export/orders', methods=['GET'])
     @jwt_required()
     @role_required(['admin'])
-    def get_dashboard_stats():
+    def export_orders():
         try:
-            # Get various statistics for admin dashboard
-            stats = {}
+            try:
+                args = _export_args()
+                orders = Order.export_cursor(
+                    start=args['start'],
+                    end=args['end'],
+                    statuses=_list_arg('status'),
+                    after_id=args['after_id'],
+                    limit=args['limit']
+                )
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
             
-            # User statistics
-            all_users = User.get_all_users()
-            stats['total_users'] = len(all_users)
-            stats['users_by_role'] = {}
-            for user in all_users:
-                role = user['role']
-                stats['users_by_role'][role] = stats['users_by_role'].get(role, 0) + 1
+            # Streamed from the cursor, resume with after_id=<last _id received>
+            if args['format'] == 'csv':
+                return csv_response(orders, ORDER_EXPORT_FIELDS, filename='orders.csv')
+            return ndjson_response(orders, filename='orders.ndjson')
             
-            # Product statistics
-            all_products = Product.get_all_products()
-            stats['total_products'] = len(all_products)
-            stats['low_stock_products'] = len(Product.get_low_stock_products())
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+    
+    @admin_bp.route('/export/inventory-logs', methods=['GET'])
+    @jwt_required()
+    @role_required(['admin'])
+    def export_inventory_logs():
+        try:
+            try:
+                args = _export_args()
+                logs = InventoryLog.export_cursor(
+                    start=args['start'],
+                    end=args['end'],
+                    change_types=_list_arg('change_type'),
+                    product_id=request.args.get('product_id'),
+                    after_id=args['after_id'],
+                    limit=args['limit']
+                )
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
             
-            # Order statistics
-            order_stats = Order.get_order_statistics()
-            stats['order_statistics'] = json.loads(json_util.dumps(order_stats))
+            if args['format'] == 'csv':
+                return csv_response(logs, INVENTORY_EXPORT_FIELDS, filename='inventory_logs.csv')
+            return ndjson_response(logs, filename='inventory_logs.ndjson')
             
-            # Inventory logs summary
-            inventory_stats = InventoryLog.get_stock_changes_summary()
-            stats['inventory_statistics'] = json.loads(json_util.dumps(inventory_stats))
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+    
+    @admin_bp.route('/dashboard', methods=['GET'])
+    @jwt_required()
+    @role_required(['admin'])
+    def get_dashboard_stats():
+        try:
+            # Served from incrementally maintained counters
+            stats = Statistics.get_dashboard()
             
-            return jsonify({'dashboard': stats}), 200
+            return json_response({'dashboard': stats})
             
         except Exception as e:
             return jsonify({'error': str(e)}), 500
     
+    @admin_bp.route('/profiles', methods=['GET'])
+    @jwt_required()
+    @role_required(['admin'])
+    def get_profiles():
+        # Requests profiled through the X-Profile header or by sampling, newest first
+        return jsonify({'profiles': profiler.list()}), 200
+    
+    @admin_bp.route('/profiles/<profile_id>', methods=['GET'])
+    @jwt_required()
+    @role_required(['admin'])
+    def get_profile(profile_id):
+        profile = profiler.get(profile_id)
+        if not profile:
+            return jsonify({'error': 'Profile not found'}), 404
+        
+        if request.args.get('format') == 'text':
+            return Response(profile['report'], mimetype='text/plain')
+        return jsonify({'profile': profile}), 200
+    
     @admin_bp.route('/users/<user_id>', methods=['DELETE'])
     @jwt_required()
     @role_required(['admin'])
@@ -132,13 +218,58 @@ def create_admin_blueprint():
         except Exception as e:
             return jsonify({'error': str(e)}), 500
     
+    @admin_bp.route('/products/<product_id>/stock-shards', methods=['GET'])
+    @jwt_required()
+    @role_required(['admin'])
+    def get_stock_shards(product_id):
+        try:
+            product = Product.find_by_id(product_id)
+            if not product:
+                return jsonify({'error': 'Product not found'}), 404
+            
+            return json_response({
+                'product_id': product_id,
+                'stock': product['stock'],
+                'stock_shards': product.get('stock_shards', 0),
+                'shards': StockShards.stats(product_id)
+            })
+            
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+    
+    @admin_bp.route('/products/<product_id>/stock-shards', methods=['PUT'])
+    @jwt_required()
+    @role_required(['admin'])
+    def set_stock_shards(product_id):
+        try:
+            data = request.get_json(silent=True) or {}
+            shards = data.get('shards')
+            if not isinstance(shards, int) or shards < 0:
+                return jsonify({'error': 'shards must be a non-negative integer, 0 disables sharding'}), 400
+            
+            if not Product.find_by_id(product_id):
+                return jsonify({'error': 'Product not found'}), 404
+            
+            try:
+                moved = Product.set_stock_shards(product_id, shards)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            
+            return jsonify({
+                'message': f'Stock split over {shards} shards' if shards else 'Stock sharding disabled',
+                'stock': moved or 0
+            }), 200
+            
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+    
     @admin_bp.route('/system-health', methods=['GET'])
     @jwt_required()
     @role_required(['admin'])
     def get_system_health():
         try:
             # Basic system health metrics
-            from database.connection import db
+            from database.connection import db, analytics_db, pool_metrics
             
             # Test database connection
             db.admin.command('ping')
@@ -147,15 +278,23 @@ def create_admin_blueprint():
             health_data = {
                 'database_status': 'connected',
                 'collections': {
-                    'users': db.users.count_documents({}),
-                    'products': db.products.count_documents({}),
-                    'orders': db.orders.count_documents({}),
-                    'inventory_logs': db.inventory_logs.count_documents({})
+                    'users': analytics_db.users.count_documents({}),
+                    'products': analytics_db.products.count_documents({}),
+                    'orders': analytics_db.orders.count_documents({}),
+                    'inventory_logs': analytics_db.inventory_logs.count_documents({})
                 },
-                'timestamp': json.loads(json_util.dumps({'timestamp': datetime.utcnow()}))
+                'caches': Product.cache_stats(),
+                'password_pool': password_hasher.stats(),
+                'stock_updates': stock_updates.stats(),
+                'inventory_log_writer': log_writer.stats(),
+                'search_index': search_index.stats(),
+                'order_transactions': order_transactions.stats(),
+                'idempotency_keys': idempotency_keys.stats(),
+                'connection_pools': [pool.stats() for pool in pool_metrics.values()],
+                'timestamp': datetime.utcnow()
             }
             
-            return jsonify({'health': health_data}), 200
+            return json_response({'health': health_data})
             
         except Exception as e:
             return jsonify({
@@ -1,7 +1,13 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
 from models.user import User
-import bcrypt
+from utils.passwords import PasswordPoolSaturated
+
+def busy_response(error):
+    """503 for requests rejected by a saturated password pool"""
+    response = jsonify({'error': error.message})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 503
 
 def create_auth_blueprint():
     auth_bp = Blueprint('auth', __name__)
@@ -51,6 +57,8 @@ def create_auth_blueprint():
                 }
             }), 201
             
+        except PasswordPoolSaturated as e:
+            return busy_response(e)
         except Exception as e:
             return jsonify({'error': str(e)}), 500
     
@@ -68,7 +76,7 @@ def create_auth_blueprint():
                 return jsonify({'error': 'Invalid credentials'}), 401
             
             # Check password
-            if not bcrypt.checkpw(data['password'].encode('utf-8'), user['password_hash']):
+            if not User.verify_password(user, data['password']):
                 return jsonify({'error': 'Invalid credentials'}), 401
             
             # Create access token
@@ -88,6 +96,8 @@ def create_auth_blueprint():
                 }
             }), 200
             
+        except PasswordPoolSaturated as e:
+            return busy_response(e)
         except Exception as e:
             return jsonify({'error': str(e)}), 500
     
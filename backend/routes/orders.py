@@ -1,11 +1,75 @@
 from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
-from models.order import Order
-from models.product import Product
+from models.order import Order, DEFAULT_PAGE_SIZE
+from models.product import Product, StockReservationError
 from models.inventory_log import InventoryLog
-from utils.decorators import role_required
-from bson import json_util, ObjectId
-import json
+from database.transactions import transactions_enabled
+from database.sessions import causal_session
+from utils.decorators import role_required, idempotent
+from utils.serialization import json_response
+from bson import ObjectId
+from collections import defaultdict
+import os
+
+# Orders accepted by one batch checkout request
+MAX_BATCH_ORDERS = int(os.getenv('MAX_BATCH_ORDERS', 100))
+
+def _validate_line_items(items):
+    """Return the error message for an invalid line item list, None when valid"""
+    if not items or not isinstance(items, list):
+        return 'Products list is required'
+    
+    for item in items:
+        if not isinstance(item, dict) or not all(key in item for key in ['product_id', 'quantity']):
+            return 'Each product must have product_id and quantity'
+        
+        if not isinstance(item['quantity'], int) or item['quantity'] <= 0:
+            return 'Quantity must be a positive integer'
+        
+        if not ObjectId.is_valid(item['product_id']):
+            return 'Invalid product_id'
+    return None
+
+def _reservation_error(e):
+    error = {'error': str(e)}
+    if e.available_stock is not None:
+        error['product_id'] = e.product_id
+        error['available_stock'] = e.available_stock
+    return error
+
+def _log_purchases(orders):
+    """Log the inventory changes of placed (order_id, reservations) pairs in one batch"""
+    InventoryLog.save_many([
+        log
+        for order_id, reservations in orders
+        for log in InventoryLog.for_purchase(order_id, reservations)
+    ])
+
+def _emit_stock_changes(reservations):
+    """Broadcast the stock left and alert sellers of products running low, once per product"""
+    lowest = {}
+    for reservation in reservations:
+        product_id = reservation['product']['_id']
+        if product_id not in lowest or reservation['new_stock'] < lowest[product_id]['new_stock']:
+            lowest[product_id] = reservation
+    
+    for reservation in lowest.values():
+        product = reservation['product']
+        new_stock = reservation['new_stock']
+        
+        # Emit real-time stock update
+        if hasattr(current_app, 'emit_stock_update'):
+            current_app.emit_stock_update(product['_id'], new_stock, product['name'])
+        
+        # Check for low stock alert
+        if new_stock <= 5:
+            if hasattr(current_app, 'emit_low_stock_alert'):
+                current_app.emit_low_stock_alert(
+                    str(product['seller_id']), 
+                    str(product['_id']), 
+                    product['name'], 
+                    new_stock
+                )
 
 def create_orders_blueprint():
     orders_bp = Blueprint('orders', __name__)
@@ -13,109 +77,158 @@ def create_orders_blueprint():
     @orders_bp.route('/', methods=['POST'])
     @jwt_required()
     @role_required(['buyer'])
+    @idempotent
     def create_order():
         try:
             user_id = get_jwt_identity()
             data = request.get_json()
             
-            if not data.get('products') or not isinstance(data['products'], list):
-                return jsonify({'error': 'Products list is required'}), 400
-            
-            # Validate and process products
-            product_list = []
-            total_amount = 0
-            sellers_to_notify = set()
+            # Validate line items
+            error = _validate_line_items(data.get('products'))
+            if error:
+                return jsonify({'error': error}), 400
             
-            for item in data['products']:
-                if not all(key in item for key in ['product_id', 'quantity']):
-                    return jsonify({'error': 'Each product must have product_id and quantity'}), 400
-                
-                product = Product.find_by_id(item['product_id'])
-                if not product:
-                    return jsonify({'error': f'Product {item["product_id"]} not found'}), 404
-                
-                if product['stock'] < item['quantity']:
-                    return jsonify({
-                        'error': f'Insufficient stock for {product["name"]}. Available: {product["stock"]}',
-                        'product_id': item['product_id'],
-                        'available_stock': product['stock']
-                    }), 409
+            if transactions_enabled():
+                # Stock, order and inventory logs commit or abort together
+                try:
+                    order_id, order, reservations = Order.place(user_id, data['products'])
+                except StockReservationError as e:
+                    return jsonify(_reservation_error(e)), e.status_code
+            else:
+                # Reserve stock for every line item in one bulk write
+                try:
+                    reservations = Product.reserve_stock(data['products'])
+                except StockReservationError as e:
+                    return jsonify(_reservation_error(e)), e.status_code
                 
-                # Calculate item total
-                item_total = product['price'] * item['quantity']
-                total_amount += item_total
+                # Create order, giving the stock back if it cannot be stored
+                order = Order.from_reservations(user_id, data['products'], reservations)
                 
-                product_list.append({
-                    'product_id': ObjectId(item['product_id']),
-                    'quantity': item['quantity'],
-                    'price': product['price']
-                })
+                try:
+                    with causal_session(user_id) as session:
+                        order_id = order.save(session)
+                except Exception:
+                    Product.release_stock(reservations)
+                    raise
                 
-                sellers_to_notify.add(str(product['seller_id']))
-            
-            # Create order
-            order = Order(
-                buyer_id=user_id,
-                product_list=product_list,
-                total_amount=total_amount
-            )
-            
-            order_id = order.save()
-            
-            # Update product stocks and create inventory logs
-            for item in data['products']:
-                product = Product.find_by_id(item['product_id'])
-                old_stock = product['stock']
-                new_stock = old_stock - item['quantity']
-                
-                # Update stock
-                Product.update_stock(item['product_id'], new_stock)
-                
-                # Log inventory change
-                inventory_log = InventoryLog(
-                    product_id=item['product_id'],
-                    change_type='purchase',
-                    old_stock=old_stock,
-                    new_stock=new_stock,
-                    reason=f'Order {order_id}'
-                )
-                inventory_log.save()
-                
-                # Emit real-time stock update
-                if hasattr(current_app, 'emit_stock_update'):
-                    current_app.emit_stock_update(item['product_id'], new_stock, product['name'])
-                
-                # Check for low stock alert
-                if new_stock <= 5:
-                    if hasattr(current_app, 'emit_low_stock_alert'):
-                        current_app.emit_low_stock_alert(
-                            str(product['seller_id']), 
-                            item['product_id'], 
-                            product['name'], 
-                            new_stock
-                        )
+                _log_purchases([(order_id, reservations)])
+            
+            _emit_stock_changes(reservations)
             
             # Notify sellers about new orders
             order_data = {
                 'order_id': str(order_id),
                 'timestamp': order.timestamp.isoformat(),
-                'total_amount': total_amount,
-                'product_count': len(product_list)
+                'total_amount': order.total_amount,
+                'product_count': len(order.product_list)
             }
             
-            for seller_id in sellers_to_notify:
+            for seller_id in order.seller_ids:
                 if hasattr(current_app, 'emit_order_notification'):
-                    current_app.emit_order_notification(seller_id, order_data)
+                    current_app.emit_order_notification(str(seller_id), order_data)
             
             return jsonify({
                 'message': 'Order placed successfully',
                 'order_id': str(order_id),
-                'total_amount': total_amount
+                'total_amount': order.total_amount
             }), 201
             
         except Exception as e:
             return jsonify({'error': str(e)}), 500
     
+    @orders_bp.route('/batch', methods=['POST'])
+    @jwt_required()
+    @role_required(['buyer'])
+    @idempotent
+    def create_orders_batch():
+        try:
+            user_id = get_jwt_identity()
+            data = request.get_json(silent=True) or {}
+            orders = data.get('orders')
+            
+            if not orders or not isinstance(orders, list):
+                return jsonify({'error': 'Orders list is required'}), 400
+            if len(orders) > MAX_BATCH_ORDERS:
+                return jsonify({'error': f'At most {MAX_BATCH_ORDERS} orders per batch'}), 400
+            
+            # One result per order, in request order
+            results = []
+            valid = []
+            for index, order in enumerate(orders):
+                result = {'index': index}
+                if isinstance(order, dict) and order.get('reference') is not None:
+                    result['reference'] = order['reference']
+                results.append(result)
+                
+                error = _validate_line_items(order.get('products') if isinstance(order, dict) else None)
+                if error:
+                    result.update({'status': 400, 'error': error})
+                else:
+                    valid.append(index)
+            
+            # Every product is read once and stock is committed with grouped bulk writes
+            reserved = Product.reserve_stock_batch([orders[index]['products'] for index in valid])
+            placed = []
+            for index, reservations in zip(valid, reserved):
+                if isinstance(reservations, StockReservationError):
+                    results[index].update({'status': reservations.status_code, **_reservation_error(reservations)})
+                else:
+                    placed.append((index, Order.from_reservations(user_id, orders[index]['products'], reservations), reservations))
+            
+            # Store the orders, giving back the stock of any that cannot be stored
+            try:
+                with causal_session(user_id) as session:
+                    order_ids = Order.save_many([order for _, order, _ in placed], session)
+            except Exception:
+                Product.release_stock([reservation for _, _, reservations in placed for reservation in reservations])
+                raise
+            
+            unsaved = [reservations for (_, _, reservations), order_id in zip(placed, order_ids) if order_id is None]
+            if unsaved:
+                Product.release_stock([reservation for reservations in unsaved for reservation in reservations])
+            
+            saved = []
+            for (index, order, reservations), order_id in zip(placed, order_ids):
+                if order_id is None:
+                    results[index].update({'status': 500, 'error': 'Order could not be stored'})
+                    continue
+                results[index].update({'status': 201, 'order_id': str(order_id), 'total_amount': order.total_amount})
+                saved.append((order_id, order, reservations))
+            
+            _log_purchases([(order_id, reservations) for order_id, _, reservations in saved])
+            _emit_stock_changes([reservation for _, _, reservations in saved for reservation in reservations])
+            
+            # One consolidated notification per seller for the whole batch
+            notifications = defaultdict(lambda: {'order_ids': [], 'total_amount': 0.0, 'product_count': 0})
+            for order_id, order, _ in saved:
+                for seller_id in order.seller_ids:
+                    notification = notifications[str(seller_id)]
+                    notification['order_ids'].append(str(order_id))
+                    notification['total_amount'] += order.total_amount
+                    notification['product_count'] += len(order.product_list)
+            
+            for seller_id, notification in notifications.items():
+                if hasattr(current_app, 'emit_order_notification'):
+                    current_app.emit_order_notification(seller_id, {
+                        'order_id': notification['order_ids'][0],
+                        'order_ids': notification['order_ids'],
+                        'order_count': len(notification['order_ids']),
+                        'timestamp': saved[0][1].timestamp.isoformat(),
+                        'total_amount': notification['total_amount'],
+                        'product_count': notification['product_count']
+                    })
+            
+            return jsonify({
+                'message': f'Placed {len(saved)} of {len(orders)} orders',
+                'placed': len(saved),
+                'failed': len(orders) - len(saved),
+                'total_amount': sum(order.total_amount for _, order, _ in saved),
+                'results': results
+            }), 201 if saved else 400
+            
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+    
     @orders_bp.route('/my-orders', methods=['GET'])
     @jwt_required()
     @role_required(['buyer'])
@@ -124,8 +237,7 @@ def create_orders_blueprint():
             user_id = get_jwt_identity()
             orders = Order.find_by_buyer(user_id)
             
-            orders_json = json.loads(json_util.dumps(orders))
-            return jsonify({'orders': orders_json}), 200
+            return json_response({'orders': orders})
             
         except Exception as e:
             return jsonify({'error': str(e)}), 500
@@ -136,10 +248,17 @@ def create_orders_blueprint():
     def get_seller_orders():
         try:
             user_id = get_jwt_identity()
-            orders = Order.find_by_seller(user_id)
             
-            orders_json = json.loads(json_util.dumps(orders))
-            return jsonify({'orders': orders_json}), 200
+            try:
+                orders, next_cursor = Order.find_by_seller(
+                    user_id,
+                    cursor=request.args.get('cursor'),
+                    limit=int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+                )
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            
+            return json_response({'orders': orders, 'next_cursor': next_cursor})
             
         except Exception as e:
             return jsonify({'error': str(e)}), 500
@@ -173,9 +292,7 @@ def create_orders_blueprint():
     def get_order_statistics():
         try:
             stats = Order.get_order_statistics()
-            stats_json = json.loads(json_util.dumps(stats))
-            
-            return jsonify({'statistics': stats_json}), 200
+            return json_response({'statistics': stats})
             
         except Exception as e:
             return jsonify({'error': str(e)}), 500
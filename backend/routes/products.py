@@ -1,27 +1,21 @@
 from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
-from models.product import Product
+from models.product import Product, DEFAULT_PAGE_SIZE
 from models.inventory_log import InventoryLog
+from models.search import SearchUnavailableError
 from utils.decorators import role_required
-from bson import json_util
-import json
-from functools import wraps
-import asyncio
+from utils.serialization import json_response, requested_wire_format, requested_media_type
+from utils.http_cache import compute_etag, document_versions, not_modified, cacheable
+from utils.streaming import NDJSON_MIMETYPE, CSV_MIMETYPE, iter_ndjson_rows, iter_csv_rows, chunked, ndjson_response
+
+# Rows validated and written per insert_many during bulk imports
+BULK_CHUNK_SIZE = 1000
+# Row errors listed in a bulk import report, the rest are only counted
+MAX_REPORTED_ERRORS = 1000
 
 def create_products_blueprint():
     products_bp = Blueprint('products', __name__)
     
-    def async_route(f):
-        @wraps(f)
-        def wrapped(*args, **kwargs):
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                return loop.run_until_complete(f(*args, **kwargs))
-            finally:
-                loop.close()
-        return wrapped
-    
     @products_bp.route('/', methods=['GET'])
     def get_products():
         try:
@@ -34,15 +28,82 @@ def create_products_blueprint():
                 'in_stock': request.args.get('in_stock') == 'true'
             }
             
-            products = Product.get_all_products(filters)
-            products_json = json.loads(json_util.dumps(products))
+            # Pagination, sorting and projection
+            fields = request.args.get('fields')
+            try:
+                products, next_cursor = Product.get_products_page(
+                    filters,
+                    sort=request.args.get('sort', '-created_at'),
+                    cursor=request.args.get('cursor'),
+                    limit=int(request.args.get('limit', DEFAULT_PAGE_SIZE)),
+                    fields=[field.strip() for field in fields.split(',') if field.strip()] if fields else None
+                )
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
             
-            return jsonify({'products': products_json}), 200
+            # Validated from the cached page, a match skips serialization
+            etag = compute_etag('products', requested_media_type(), sorted(request.args.items(multi=True)),
+                                document_versions(products), next_cursor)
+            return not_modified(etag) or cacheable(
+                json_response({'products': products, 'next_cursor': next_cursor}), etag
+            )
             
         except Exception as e:
             current_app.logger.error(f"Error in get_products: {str(e)}")
             return jsonify({'error': 'Internal server error'}), 500
     
+    @products_bp.route('/search', methods=['GET'])
+    def search_products():
+        try:
+            filters = {
+                'category': request.args.get('category'),
+                'min_price': request.args.get('min_price'),
+                'max_price': request.args.get('max_price'),
+                'in_stock': request.args.get('in_stock') == 'true'
+            }
+            
+            # Ranked hits, facet counts and the next page cursor in one call
+            try:
+                result = Product.search(
+                    request.args.get('q', ''),
+                    filters,
+                    cursor=request.args.get('cursor'),
+                    limit=int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+                )
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            
+            return json_response(result)
+            
+        except SearchUnavailableError as e:
+            return jsonify({'error': str(e)}), 503
+        except Exception as e:
+            current_app.logger.error(f"Error in search_products: {str(e)}")
+            return jsonify({'error': 'Internal server error'}), 500
+    
+    @products_bp.route('/suggest', methods=['GET'])
+    def suggest_products():
+        try:
+            query = request.args.get('q', '')
+            if not query.strip():
+                return jsonify({'suggestions': []}), 200
+            
+            try:
+                suggestions = Product.suggest(
+                    query,
+                    limit=int(request.args.get('limit', 10)),
+                    category=request.args.get('category')
+                )
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            
+            return json_response({'suggestions': suggestions})
+            
+        except SearchUnavailableError as e:
+            return jsonify({'error': str(e)}), 503
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+    
     @products_bp.route('/<product_id>', methods=['GET'])
     def get_product(product_id):
         try:
@@ -50,8 +111,9 @@ def create_products_blueprint():
             if not product:
                 return jsonify({'error': 'Product not found'}), 404
             
-            product_json = json.loads(json_util.dumps(product))
-            return jsonify({'product': product_json}), 200
+            etag = compute_etag('product', requested_media_type(), requested_wire_format(),
+                                document_versions([product]))
+            return not_modified(etag) or cacheable(json_response({'product': product}), etag)
             
         except Exception as e:
             return jsonify({'error': str(e)}), 500
@@ -99,6 +161,85 @@ def create_products_blueprint():
         except Exception as e:
             return jsonify({'error': str(e)}), 500
     
+    @products_bp.route('/bulk', methods=['POST'])
+    @jwt_required()
+    @role_required(['seller', 'admin'])
+    def bulk_import_products():
+        try:
+            user_id = get_jwt_identity()
+            
+            # Rows are parsed from the request stream, the body is never held in memory
+            if request.mimetype == CSV_MIMETYPE:
+                rows = iter_csv_rows(request.stream)
+            elif request.mimetype in (NDJSON_MIMETYPE, 'application/jsonl'):
+                rows = iter_ndjson_rows(request.stream)
+            else:
+                return jsonify({'error': f'Content-Type must be {NDJSON_MIMETYPE} or {CSV_MIMETYPE}'}), 415
+            
+            inserted, failed, errors = 0, 0, []
+            
+            for chunk in chunked(rows, BULK_CHUNK_SIZE):
+                # Validate the chunk, keeping the source row of each valid product
+                products, row_numbers, chunk_errors = [], [], []
+                for row_number, document, error in chunk:
+                    if error is None:
+                        try:
+                            products.append(Product.from_dict(user_id, document))
+                            row_numbers.append(row_number)
+                            continue
+                        except ValueError as e:
+                            error = str(e)
+                    chunk_errors.append((row_number, error))
+                
+                # Insert products and their initial inventory logs in one batch each
+                product_ids, insert_errors = Product.save_many(products)
+                chunk_errors.extend((row_numbers[index], message) for index, message in insert_errors.items())
+                InventoryLog.save_many([
+                    InventoryLog(
+                        product_id=product_id,
+                        change_type='restock',
+                        old_stock=0,
+                        new_stock=product.stock,
+                        reason='Initial stock'
+                    )
+                    for product, product_id in zip(products, product_ids) if product_id is not None
+                ])
+                
+                inserted += len(products) - len(insert_errors)
+                failed += len(chunk_errors)
+                for row_number, error in sorted(chunk_errors):
+                    if len(errors) < MAX_REPORTED_ERRORS:
+                        errors.append({'row': row_number, 'error': error})
+            
+            if not inserted and not failed:
+                return jsonify({'error': 'No products in request'}), 400
+            
+            return jsonify({
+                'message': f'Imported {inserted} products',
+                'inserted': inserted,
+                'failed': failed,
+                'errors': errors
+            }), 201 if inserted else 400
+            
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+    
+    @products_bp.route('/export', methods=['GET'])
+    @jwt_required()
+    @role_required(['seller', 'admin'])
+    def export_products():
+        try:
+            # Sellers export their own catalog, admins everything or one seller
+            if get_jwt().get('role') == 'admin':
+                seller_id = request.args.get('seller_id')
+            else:
+                seller_id = get_jwt_identity()
+            
+            return ndjson_response(Product.export_cursor(seller_id), filename='products.ndjson')
+            
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+    
     @products_bp.route('/<product_id>', methods=['PUT'])
     @jwt_required()
     @role_required(['seller', 'admin'])
@@ -192,8 +333,7 @@ def create_products_blueprint():
             user_id = get_jwt_identity()
             products = Product.find_by_seller(user_id)
             
-            products_json = json.loads(json_util.dumps(products))
-            return jsonify({'products': products_json}), 200
+            return json_response({'products': products})
             
         except Exception as e:
             return jsonify({'error': str(e)}), 500
@@ -202,7 +342,8 @@ def create_products_blueprint():
     def get_categories():
         try:
             categories = Product.get_categories()
-            return jsonify({'categories': categories}), 200
+            etag = compute_etag('categories', categories)
+            return not_modified(etag) or cacheable(jsonify({'categories': categories}), etag)
             
         except Exception as e:
             return jsonify({'error': str(e)}), 500
@@ -213,10 +354,14 @@ def create_products_blueprint():
     def get_top_selling():
         try:
             limit = int(request.args.get('limit', 5))
-            products = Product.get_top_selling_products(limit)
+            days = request.args.get('days')
+            products = Product.get_top_selling_products(
+                limit,
+                seller_id=request.args.get('seller_id'),
+                days=int(days) if days else None
+            )
             
-            products_json = json.loads(json_util.dumps(products))
-            return jsonify({'products': products_json}), 200
+            return json_response({'products': products})
             
         except Exception as e:
             return jsonify({'error': str(e)}), 500
@@ -0,0 +1,24 @@
+"""One-off migration that denormalizes seller ids onto existing orders.
+
+Orders placed before seller_ids was stored are invisible to
+GET /api/orders/seller-orders until this has run. It is safe to re-run and
+only touches orders without seller_ids. From the backend directory:
+
+    python -m scripts.backfill_order_seller_ids
+"""
+import argparse
+
+from models.order import Order
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--batch-size', type=int, default=500)
+    args = parser.parse_args()
+    
+    updated = Order.backfill_seller_ids(args.batch_size)
+    print(f'Backfilled seller_ids on {updated} orders')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,18 @@
+"""Rebuild the inventory history buckets and daily rollups from inventory_logs.
+
+Run once after deploying the bucketed history to fold in existing logs.
+Only raw logs still within INVENTORY_LOG_TTL_DAYS can be folded in, so run
+it before the TTL index first expires old events. From the backend directory:
+
+    python -m scripts.rebuild_inventory_history
+"""
+from models.inventory_log import InventoryLog
+
+
+def main():
+    InventoryLog.rebuild_history()
+    print('Rebuilt inventory_history and inventory_daily')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,17 @@
+"""Rebuild the product sales counters from the orders collection.
+
+Run once after deploying the incremental counters, or whenever they are
+suspected to have drifted. From the backend directory:
+
+    python -m scripts.rebuild_product_sales
+"""
+from models.product_sales import ProductSales
+
+
+def main():
+    ProductSales.rebuild()
+    print('Rebuilt product_sales and product_sales_daily')
+
+
+if __name__ == '__main__':
+    main()
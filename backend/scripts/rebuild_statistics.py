@@ -0,0 +1,17 @@
+"""Recompute the admin dashboard counters from the source collections.
+
+The counters seed themselves on first use; run this if they are suspected
+to have drifted. From the backend directory:
+
+    python -m scripts.rebuild_statistics
+"""
+from models.statistics import Statistics
+
+
+def main():
+    Statistics.rebuild()
+    print('Rebuilt dashboard statistics')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+import gzip
+import os
+import time
+from utils.metrics import record_serialization
+
+try:
+    import brotli
+except ImportError:
+    # Brotli is optional, gzip is always available
+    brotli = None
+
+# 'on' compresses in the app, 'off' leaves it to nginx
+RESPONSE_COMPRESSION = os.getenv('RESPONSE_COMPRESSION', 'on')
+# Smaller bodies are sent as they are, compression would not pay for itself
+COMPRESSION_MIN_BYTES = int(os.getenv('COMPRESSION_MIN_BYTES', 1024))
+GZIP_LEVEL = int(os.getenv('GZIP_LEVEL', 5))
+BROTLI_QUALITY = int(os.getenv('BROTLI_QUALITY', 4))
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json', 'application/msgpack', 'text/plain', 'text/csv', 'text/html'
+}
+
+def _accepted_encodings(accept_encoding):
+    """Encodings of an Accept-Encoding header mapped to their q-values"""
+    accepted = {}
+    for item in (accept_encoding or '').split(','):
+        name, _, params = item.strip().partition(';')
+        if not name:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    return accepted
+
+def choose_encoding(accept_encoding):
+    """Best content coding the client accepts: br, then gzip, or None"""
+    accepted = _accepted_encodings(accept_encoding)
+    for encoding in (('br',) if brotli is not None else ()) + ('gzip',):
+        if accepted.get(encoding, accepted.get('*', 0.0)) > 0:
+            return encoding
+    return None
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+def maybe_compress(body, mimetype, accept_encoding):
+    """Return (body, encoding) with body compressed when worthwhile and accepted"""
+    if RESPONSE_COMPRESSION == 'off' or len(body) < COMPRESSION_MIN_BYTES or mimetype not in COMPRESSIBLE_MIMETYPES:
+        return body, None
+    encoding = choose_encoding(accept_encoding)
+    if encoding is None:
+        return body, None
+    started = time.perf_counter()
+    body = compress(body, encoding)
+    record_serialization(time.perf_counter() - started)
+    return body, encoding
+
+def init_compression(app):
+    """Compress buffered responses according to Accept-Encoding.
+
+    Streamed responses (exports) are left alone. Compressed representations
+    get their own strong ETag, suffixed with the content coding.
+    """
+    from flask import request
+
+    @app.after_request
+    def _compress_response(response):
+        if (response.direct_passthrough or response.is_streamed or response.status_code < 200
+                or response.status_code in (204, 304) or 'Content-Encoding' in response.headers):
+            return response
+        if response.mimetype in COMPRESSIBLE_MIMETYPES:
+            response.vary.add('Accept-Encoding')
+        body, encoding = maybe_compress(response.get_data(), response.mimetype,
+                                        request.headers.get('Accept-Encoding'))
+        if encoding is None:
+            return response
+
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(f'{etag}-{encoding}', weak)
+        return response
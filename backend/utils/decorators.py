@@ -1,6 +1,8 @@
+import hashlib
 from functools import wraps
-from flask import jsonify
-from flask_jwt_extended import get_jwt
+from flask import Response, jsonify, make_response, request
+from flask_jwt_extended import get_jwt, get_jwt_identity
+from models.idempotency import idempotency_keys, IdempotencyError, MAX_KEY_LENGTH
 
 def role_required(allowed_roles):
     """Decorator to check if user has required role"""
@@ -15,4 +17,34 @@ def role_required(allowed_roles):
             
             return f(*args, **kwargs)
         return decorated_function
-    return decorator
\ No newline at end of file
+    return decorator
+
+def idempotent(f):
+    """Decorator running a request once per Idempotency-Key header and user, repeats get the stored response"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return f(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({'error': f'Idempotency-Key must not exceed {MAX_KEY_LENGTH} characters'}), 400
+        
+        # A key may only be reused for the very same request
+        fingerprint = hashlib.sha256(
+            request.method.encode('utf-8') + request.path.encode('utf-8') + request.get_data()
+        ).hexdigest()
+        
+        def handler():
+            response = make_response(f(*args, **kwargs))
+            return {'status_code': response.status_code, 'body': response.get_data(), 'mimetype': response.mimetype}
+        
+        try:
+            result, replayed = idempotency_keys.run(get_jwt_identity(), key, fingerprint, handler)
+        except IdempotencyError as e:
+            return jsonify({'error': str(e)}), e.status_code
+        
+        response = Response(result['body'], status=result['status_code'], mimetype=result['mimetype'])
+        if replayed:
+            response.headers['Idempotent-Replayed'] = 'true'
+        return response
+    return decorated_function
@@ -0,0 +1,56 @@
+import hashlib
+import os
+from flask import Response, request
+
+# Lifetime of public catalog responses in shared caches (nginx micro-cache), 0 only revalidates
+CATALOG_MAX_AGE = int(os.getenv('CATALOG_HTTP_MAX_AGE', 1))
+
+def compute_etag(*parts):
+    """Strong validator for a response identified by parts, without the quotes"""
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()[:32]
+
+def document_versions(documents):
+    """(id, version) of each document, the version being bumped by every write"""
+    # Orders of sharded stock do not touch the product document, its stock is part of the validator
+    return [
+        (str(document.get('_id')), document.get('version', 0), document.get('stock') if document.get('stock_shards') else None)
+        for document in documents
+    ]
+
+# Compressed representations carry the identity ETag suffixed with their content coding
+ENCODING_SUFFIXES = ('-gzip', '-br')
+
+def etag_matches(if_none_match, etag):
+    """The tag of an If-None-Match header value matching etag, or None (weak comparison, as RFC 9110 requires)"""
+    if not if_none_match:
+        return None
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate == '*':
+            return etag
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        candidate = candidate.strip('"')
+        if candidate == etag or any(candidate == etag + suffix for suffix in ENCODING_SUFFIXES):
+            return candidate
+    return None
+
+def cache_headers(etag, max_age=CATALOG_MAX_AGE):
+    """Validator and freshness headers of a public catalog response"""
+    return {
+        'ETag': f'"{etag}"',
+        'Cache-Control': f'public, max-age={max_age}'
+    }
+
+def not_modified(etag):
+    """304 response for the current request if the client already holds etag, otherwise None"""
+    matched = etag_matches(request.headers.get('If-None-Match'), etag)
+    if matched is None:
+        return None
+    # Echo the tag of the representation the client holds
+    return Response(status=304, headers=cache_headers(matched))
+
+def cacheable(response, etag):
+    """Attach the validator and freshness headers to a public catalog response"""
+    response.headers.update(cache_headers(etag))
+    return response
@@ -0,0 +1,405 @@
+import contextvars
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+
+from pymongo import monitoring
+
+# Requests running the same command on the same collection this many times are
+# counted as repeated queries (likely N+1 patterns)
+REPEATED_QUERY_THRESHOLD = int(os.getenv('METRICS_REPEATED_QUERY_THRESHOLD', 5))
+# Fraction of requests profiled without being asked to, 0 disables sampling
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+PROFILE_HISTORY = int(os.getenv('PROFILE_HISTORY', 50))
+# Bearer token required to scrape /api/metrics, which stays closed while it is unset
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+PROFILE_HEADER = 'X-Profile'
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COMMAND_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+class Histogram:
+    """Cumulative Prometheus histogram per label set"""
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series['counts'][i] += 1
+                break
+        series['sum'] += value
+        series['count'] += 1
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class MetricsRegistry:
+    """Process-wide counters and histograms rendered in the Prometheus text format"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = OrderedDict()
+        self._collectors = []
+
+    def _metric(self, name, kind, help_text, label_names, buckets=None):
+        metric = self._metrics.get(name)
+        if metric is None:
+            values = Histogram(buckets) if kind == 'histogram' else defaultdict(float)
+            metric = self._metrics[name] = (kind, help_text, label_names, values)
+        return metric
+
+    def counter(self, name, help_text, label_names=()):
+        self._metric(name, 'counter', help_text, label_names)
+
+    def histogram(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        self._metric(name, 'histogram', help_text, label_names, buckets)
+
+    def inc(self, name, labels=(), amount=1):
+        with self._lock:
+            self._metrics[name][3][labels] += amount
+
+    def observe(self, name, labels, value):
+        with self._lock:
+            self._metrics[name][3].observe(labels, value)
+
+    def register_gauges(self, prefix, collect):
+        """Export the numeric values of the dict returned by collect() as gauges named prefix_key"""
+        self._collectors.append((prefix, collect))
+
+    def render(self):
+        """Current values in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name, (kind, help_text, label_names, values) in self._metrics.items():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                if kind == 'counter':
+                    for labels, value in values.items():
+                        lines.append(f'{name}{_format_labels(label_names, labels)} {_format_value(value)}')
+                    continue
+                for labels, series in values.series.items():
+                    cumulative = 0
+                    for bound, count in zip(values.buckets, series['counts']):
+                        cumulative += count
+                        le = _format_labels(label_names, labels, ('le', _format_value(float(bound))))
+                        lines.append(f'{name}_bucket{le} {cumulative}')
+                    lines.append(f'{name}_bucket{_format_labels(label_names, labels, ("le", "+Inf"))} {series["count"]}')
+                    lines.append(f'{name}_sum{_format_labels(label_names, labels)} {_format_value(series["sum"])}')
+                    lines.append(f'{name}_count{_format_labels(label_names, labels)} {series["count"]}')
+
+        for prefix, collect in self._collectors:
+            try:
+                values = collect()
+            except Exception as e:
+                print(f'Metrics collector {prefix} error: {e}')
+                continue
+            for key, value in values.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines.append(f'# TYPE {prefix}_{key} gauge')
+                    lines.append(f'{prefix}_{key} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+metrics = MetricsRegistry()
+metrics.histogram('http_request_duration_seconds', 'Request latency by route', ('method', 'route', 'status'))
+metrics.histogram('http_request_mongo_commands', 'MongoDB commands issued per request', ('method', 'route'),
+                  buckets=COMMAND_COUNT_BUCKETS)
+metrics.counter('http_request_db_seconds_total', 'Time requests spent waiting on MongoDB', ('method', 'route'))
+metrics.counter('http_request_serialization_seconds_total', 'Time requests spent encoding responses',
+                ('method', 'route'))
+metrics.counter('http_request_repeated_queries_total',
+                'Requests that ran the same command on the same collection repeatedly',
+                ('method', 'route', 'command', 'collection'))
+metrics.histogram('mongodb_command_duration_seconds', 'MongoDB command latency', ('command', 'collection'))
+metrics.counter('mongodb_command_failures_total', 'Failed MongoDB commands', ('command', 'collection'))
+metrics.counter('profiles_captured_total', 'Profiled requests', ('trigger',))
+metrics.histogram('mongodb_pool_wait_seconds', 'Time spent waiting for a pooled connection', ('profile',))
+metrics.counter('mongodb_pool_checkout_failures_total', 'Connection check-outs that failed', ('profile', 'reason'))
+
+class RequestStats:
+    """What one request spent on MongoDB and serialization"""
+    __slots__ = ('db_seconds', 'serialization_seconds', 'commands')
+
+    def __init__(self):
+        self.db_seconds = 0.0
+        self.serialization_seconds = 0.0
+        self.commands = defaultdict(int)
+
+# Set for the duration of an instrumented request, in its thread or task
+_current = contextvars.ContextVar('request_stats', default=None)
+
+def start_request():
+    stats = RequestStats()
+    return stats, _current.set(stats)
+
+def finish_request(token, stats, method, route, status, seconds):
+    """Record a finished request's latency, command counts and time split"""
+    _current.reset(token)
+    labels = (method, route)
+    metrics.observe('http_request_duration_seconds', (method, route, str(status)), seconds)
+    metrics.observe('http_request_mongo_commands', labels, sum(stats.commands.values()))
+    metrics.inc('http_request_db_seconds_total', labels, stats.db_seconds)
+    metrics.inc('http_request_serialization_seconds_total', labels, stats.serialization_seconds)
+    for (command, collection), count in stats.commands.items():
+        if count >= REPEATED_QUERY_THRESHOLD:
+            metrics.inc('http_request_repeated_queries_total', (method, route, command, collection))
+
+def record_serialization(seconds):
+    """Attribute encoding time to the current request"""
+    stats = _current.get()
+    if stats is not None:
+        stats.serialization_seconds += seconds
+
+def _collection(event):
+    # getMore names the cursor first and the collection under 'collection'
+    target = event.command.get('collection') if event.command_name == 'getMore' else event.command.get(event.command_name)
+    return target if isinstance(target, str) else ''
+
+class CommandMetrics(monitoring.CommandListener):
+    """Times every MongoDB command and charges it to the request that issued it"""
+    def __init__(self):
+        self._collections = {}
+
+    def started(self, event):
+        # The command document is only available here
+        self._collections[(event.request_id, event.connection_id)] = _collection(event)
+
+    def _finished(self, event, failed):
+        collection = self._collections.pop((event.request_id, event.connection_id), '')
+        seconds = event.duration_micros / 1e6
+        labels = (event.command_name, collection)
+        metrics.observe('mongodb_command_duration_seconds', labels, seconds)
+        if failed:
+            metrics.inc('mongodb_command_failures_total', labels)
+        stats = _current.get()
+        if stats is not None:
+            stats.db_seconds += seconds
+            stats.commands[labels] += 1
+
+    def succeeded(self, event):
+        self._finished(event, False)
+
+    def failed(self, event):
+        self._finished(event, True)
+
+command_metrics = CommandMetrics()
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """Times connection check-outs from the pools of one workload profile
+
+    Events are published on the thread checking the connection out, so the
+    wait is measured between its started and checked out events.
+    """
+    def __init__(self, profile):
+        self.profile = profile
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.checked_out = 0
+        self.open_connections = 0
+        self.checkouts = 0
+        self.failures = 0
+        self.max_wait_ms = 0.0
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def _waited(self):
+        started = getattr(self._local, 'started', None)
+        self._local.started = None
+        seconds = time.perf_counter() - started if started is not None else 0.0
+        metrics.observe('mongodb_pool_wait_seconds', (self.profile,), seconds)
+        return seconds
+
+    def connection_checked_out(self, event):
+        seconds = self._waited()
+        with self._lock:
+            self.checked_out += 1
+            self.checkouts += 1
+            self.max_wait_ms = max(self.max_wait_ms, seconds * 1000)
+
+    def connection_check_out_failed(self, event):
+        self._waited()
+        metrics.inc('mongodb_pool_checkout_failures_total', (self.profile, event.reason))
+        with self._lock:
+            self.failures += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open_connections += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open_connections -= 1
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def stats(self):
+        """Get connection and check-out counters of the profile's pools"""
+        with self._lock:
+            return {
+                'profile': self.profile,
+                'checked_out': self.checked_out,
+                'open_connections': self.open_connections,
+                'checkouts': self.checkouts,
+                'failures': self.failures,
+                'max_wait_ms': round(self.max_wait_ms, 3)
+            }
+
+class Profiler:
+    """cProfile captures of single requests, kept in a bounded history.
+
+    Only one request is profiled at a time, concurrent candidates are skipped.
+    """
+    def __init__(self, sample_rate=PROFILE_SAMPLE_RATE, history=PROFILE_HISTORY):
+        self.sample_rate = sample_rate
+        self._profiles = OrderedDict()
+        self._history = history
+        self._busy = threading.Lock()
+        self._lock = threading.Lock()
+
+    def should_sample(self):
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def start(self):
+        """Return a running profile, or None when another request is being profiled"""
+        if not self._busy.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except Exception:
+            self._busy.release()
+            return None
+        return profile
+
+    def stop(self, profile, method, path, status, seconds, trigger, limit=60):
+        """Store the report of a finished profile, returns its id"""
+        profile.disable()
+        self._busy.release()
+        output = io.StringIO()
+        pstats.Stats(profile, stream=output).sort_stats('cumulative').print_stats(limit)
+        profile_id = uuid.uuid4().hex[:16]
+        with self._lock:
+            self._profiles[profile_id] = {
+                'id': profile_id,
+                'method': method,
+                'path': path,
+                'status': status,
+                'duration_ms': round(seconds * 1000, 3),
+                'trigger': trigger,
+                'timestamp': time.time(),
+                'report': output.getvalue()
+            }
+            while len(self._profiles) > self._history:
+                self._profiles.popitem(last=False)
+        metrics.inc('profiles_captured_total', (trigger,))
+        return profile_id
+
+    def abandon(self, profile):
+        """Discard a profile whose request failed before it could be stored"""
+        profile.disable()
+        self._busy.release()
+
+    def list(self):
+        """Captured profiles, newest first, without their reports"""
+        with self._lock:
+            return [
+                {key: value for key, value in profile.items() if key != 'report'}
+                for profile in reversed(self._profiles.values())
+            ]
+
+    def get(self, profile_id):
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+profiler = Profiler()
+
+def metrics_authorized(authorization):
+    """Whether an Authorization header may scrape the metrics, never while METRICS_TOKEN is unset"""
+    return bool(METRICS_TOKEN) and hmac.compare_digest(authorization or '', f'Bearer {METRICS_TOKEN}')
+
+def _admin_requested_profile():
+    from flask import request
+    from flask_jwt_extended import get_jwt, verify_jwt_in_request
+    if request.headers.get(PROFILE_HEADER, '').lower() not in ('1', 'true'):
+        return False
+    try:
+        verify_jwt_in_request(optional=True)
+        return get_jwt().get('role') == 'admin'
+    except Exception:
+        return False
+
+def instrument_flask(app):
+    """Record latency, MongoDB usage and serialization time of every Flask request,
+    and profile requests on demand (X-Profile header from an admin) or by sampling"""
+    from flask import g, request
+
+    @app.before_request
+    def _start_request_metrics():
+        g.metrics_started = time.perf_counter()
+        g.metrics_stats, g.metrics_token = start_request()
+        trigger = 'header' if _admin_requested_profile() else 'sample' if profiler.should_sample() else None
+        g.profile = profiler.start() if trigger else None
+        g.profile_trigger = trigger
+
+    @app.after_request
+    def _finish_request_metrics(response):
+        if getattr(g, 'metrics_token', None) is None:
+            return response
+        seconds = time.perf_counter() - g.metrics_started
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        if g.profile is not None:
+            profile_id = profiler.stop(g.profile, request.method, request.full_path.rstrip('?'),
+                                       response.status_code, seconds, g.profile_trigger)
+            g.profile = None
+            if g.profile_trigger == 'header':
+                response.headers['X-Profile-Id'] = profile_id
+        finish_request(g.metrics_token, g.metrics_stats, request.method, route, response.status_code, seconds)
+        g.metrics_token = None
+        return response
+
+    @app.teardown_request
+    def _abandon_request_metrics(error=None):
+        # after_request is skipped when a handler raises
+        if getattr(g, 'profile', None) is not None:
+            profiler.abandon(g.profile)
+            g.profile = None
+        if getattr(g, 'metrics_token', None) is not None:
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            finish_request(g.metrics_token, g.metrics_stats, request.method, route, 500,
+                           time.perf_counter() - g.metrics_started)
+            g.metrics_token = None
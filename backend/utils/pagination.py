@@ -0,0 +1,35 @@
+import base64
+from bson import json_util
+
+def encode_cursor(sort, value, last_id):
+    """Encode the position after the last returned document as an opaque token"""
+    payload = json_util.dumps({'s': sort, 'k': value, 'id': last_id})
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor, sort):
+    """Decode a cursor token, returning the (value, _id) it points after"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json_util.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if payload['s'] != sort:
+            raise ValueError('Cursor does not match the requested sort')
+        return payload['k'], payload['id']
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError('Invalid cursor') from e
+
+def keyset_filter(key, direction, value, last_id):
+    """Build the query matching documents strictly after (value, last_id)"""
+    operator = '$gt' if direction == 1 else '$lt'
+    return {'$or': [
+        {key: {operator: value}},
+        {key: value, '_id': {operator: last_id}}
+    ]}
+
+def time_range_filter(field, start=None, end=None):
+    """Build the query matching documents with start <= field < end, either bound optional"""
+    bounds = {}
+    if start is not None:
+        bounds['$gte'] = start
+    if end is not None:
+        bounds['$lt'] = end
+    return {field: bounds} if bounds else {}
\ No newline at end of file
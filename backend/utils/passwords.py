@@ -0,0 +1,103 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import bcrypt
+
+# bcrypt cost factor, each increment doubles the time of a hash
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 12))
+# Native threads hashing at once, and requests allowed to wait for one
+PASSWORD_POOL_WORKERS = int(os.getenv('PASSWORD_POOL_WORKERS', min(4, os.cpu_count() or 1)))
+PASSWORD_POOL_QUEUE = int(os.getenv('PASSWORD_POOL_QUEUE', 64))
+
+class PasswordPoolSaturated(Exception):
+    """Raised when the password pool queue is full"""
+    def __init__(self, message='Authentication service is busy, please retry'):
+        super().__init__(message)
+        self.message = message
+        self.retry_after = 1
+
+class PasswordHasher:
+    """Bounded worker pool for bcrypt hashing and verification.
+
+    bcrypt takes hundreds of milliseconds at the default cost and would block
+    the eventlet hub, so hashes run on native threads: eventlet's tpool in
+    eventlet mode, a ThreadPoolExecutor otherwise. Requests beyond the
+    workers plus the queue depth fail fast with PasswordPoolSaturated.
+    """
+    def __init__(self, rounds=BCRYPT_ROUNDS, workers=PASSWORD_POOL_WORKERS, queue_depth=PASSWORD_POOL_QUEUE, use_tpool=None):
+        self.rounds = rounds
+        self.workers = workers
+        self.queue_depth = queue_depth
+        if use_tpool is None:
+            use_tpool = os.getenv('SERVER_MODE', 'eventlet') == 'eventlet'
+        self.use_tpool = use_tpool
+        self._executor = None
+        self._worker_slots = None
+        self._admission = threading.BoundedSemaphore(workers + queue_depth)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._completed = 0
+        self._rejected = 0
+
+    def hash(self, password):
+        """Hash password at the configured cost"""
+        return self._run(bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt(self.rounds))
+
+    def verify(self, password, password_hash):
+        """Check if provided password matches hash"""
+        return self._run(bcrypt.checkpw, password.encode('utf-8'), bytes(password_hash))
+
+    def needs_rehash(self, password_hash):
+        """Check if hash was made with a different cost than configured"""
+        try:
+            return int(bytes(password_hash).split(b'$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    def stats(self):
+        """Get pool occupancy and counters"""
+        with self._lock:
+            return {
+                'rounds': self.rounds,
+                'workers': self.workers,
+                'queue_depth': self.queue_depth,
+                'in_flight': self._in_flight,
+                'completed': self._completed,
+                'rejected': self._rejected
+            }
+
+    def _run(self, func, *args):
+        # Admission never blocks, the caller gets a 503 instead of waiting in line
+        if not self._admission.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise PasswordPoolSaturated()
+        with self._lock:
+            self._in_flight += 1
+        try:
+            if self.use_tpool:
+                return self._run_tpool(func, *args)
+            return self._get_executor().submit(func, *args).result()
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                self._completed += 1
+            self._admission.release()
+
+    def _run_tpool(self, func, *args):
+        from eventlet import tpool
+        from eventlet.semaphore import Semaphore
+        if self._worker_slots is None:
+            self._worker_slots = Semaphore(self.workers)
+        # Green semaphore so waiting for a worker yields to the hub
+        with self._worker_slots:
+            return tpool.execute(func, *args)
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='bcrypt')
+        return self._executor
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,113 @@
+import json
+import time
+from datetime import datetime, date, timezone
+from uuid import UUID
+from bson import ObjectId, Decimal128
+from flask import Response, request
+from utils.metrics import record_serialization
+
+try:
+    import msgpack
+except ImportError:
+    # MessagePack responses are optional, clients fall back to JSON
+    msgpack = None
+
+JSON_MIMETYPE = 'application/json'
+MSGPACK_MIMETYPE = 'application/msgpack'
+
+def _utc_isoformat(value):
+    """Format a datetime as an ISO 8601 UTC string with millisecond precision"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.isoformat(timespec='milliseconds') + 'Z'
+
+def _compact_default(value):
+    """Encode BSON types as plain JSON strings"""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return _utc_isoformat(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal128):
+        return str(value)
+    if isinstance(value, UUID):
+        return str(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+def _extended_default(value):
+    """Encode BSON types using the relaxed MongoDB Extended JSON wrappers"""
+    if isinstance(value, ObjectId):
+        return {'$oid': str(value)}
+    if isinstance(value, datetime):
+        return {'$date': _utc_isoformat(value)}
+    if isinstance(value, Decimal128):
+        return {'$numberDecimal': str(value)}
+    return _compact_default(value)
+
+def plain_value(value):
+    """Convert a BSON scalar to the value it has in compact JSON"""
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return _compact_default(value)
+
+# One encoder per wire format; encode() runs in the C accelerated encoder
+_encoders = {
+    'compact': json.JSONEncoder(default=_compact_default, separators=(',', ':'), ensure_ascii=False),
+    'extended': json.JSONEncoder(default=_extended_default, separators=(',', ':'), ensure_ascii=False)
+}
+
+def dumps(payload, wire_format='compact'):
+    """Serialize documents containing BSON types to JSON in a single pass"""
+    return _encoders[wire_format].encode(payload)
+
+def requested_wire_format():
+    """Return the wire format requested by the client, compact unless ?wire=extended"""
+    return 'extended' if request.args.get('wire') == 'extended' else 'compact'
+
+def requested_media_type():
+    """MessagePack when the client prefers it with Accept and msgpack is installed, otherwise JSON"""
+    if msgpack is None:
+        return JSON_MIMETYPE
+    best = request.accept_mimetypes.best_match([JSON_MIMETYPE, MSGPACK_MIMETYPE, 'application/x-msgpack'])
+    return JSON_MIMETYPE if best in (None, JSON_MIMETYPE) else MSGPACK_MIMETYPE
+
+def to_columnar(documents):
+    """Lay out a list of documents as one array per field, None where a document lacks the field"""
+    columns = {}
+    for index, document in enumerate(documents):
+        for field, value in document.items():
+            column = columns.get(field)
+            if column is None:
+                column = columns[field] = [None] * index
+            column.append(value)
+        for column in columns.values():
+            if len(column) == index:
+                column.append(None)
+    return {'count': len(documents), 'columns': columns}
+
+def _is_document_list(value):
+    return isinstance(value, list) and bool(value) and all(isinstance(item, dict) for item in value)
+
+def json_response(payload, status=200):
+    """Build a response directly from MongoDB documents.
+
+    JSON by default, MessagePack with Accept: application/msgpack, and list
+    values are sent column by column with ?layout=columnar.
+    """
+    started = time.perf_counter()
+    if request.args.get('layout') == 'columnar' and isinstance(payload, dict):
+        payload = {key: to_columnar(value) if _is_document_list(value) else value for key, value in payload.items()}
+    
+    mimetype = requested_media_type()
+    if mimetype == MSGPACK_MIMETYPE:
+        # BSON types are sent as the strings the compact JSON format uses
+        body = msgpack.packb(payload, default=_compact_default, datetime=False)
+    else:
+        body = dumps(payload, requested_wire_format()).encode('utf-8')
+    record_serialization(time.perf_counter() - started)
+    
+    response = Response(body, status=status, mimetype=mimetype)
+    if msgpack is not None:
+        response.vary.add('Accept')
+    return response
@@ -0,0 +1,82 @@
+import csv
+import io
+import json
+from itertools import islice
+from flask import Response, stream_with_context
+from utils.serialization import dumps, plain_value, requested_wire_format
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+CSV_MIMETYPE = 'text/csv'
+
+def iter_ndjson_rows(stream):
+    """Yield (row_number, document, error) for each non-empty line of an NDJSON byte stream"""
+    for row_number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            document = json.loads(line)
+        except ValueError as e:
+            yield row_number, None, f'Invalid JSON: {e}'
+            continue
+        if not isinstance(document, dict):
+            yield row_number, None, 'Each line must be a JSON object'
+            continue
+        yield row_number, document, None
+
+def iter_csv_rows(stream):
+    """Yield (row_number, document, error) for each record of a CSV byte stream with a header row"""
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    for row_number, row in enumerate(reader, start=2):
+        if None in row:
+            yield row_number, None, 'Row has more columns than the header'
+            continue
+        yield row_number, {key: value for key, value in row.items() if value not in (None, '')}, None
+
+def chunked(iterable, size):
+    """Split an iterable into lists of at most size items"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def ndjson_response(documents, filename=None):
+    """Stream documents as NDJSON, one encoded line at a time"""
+    wire_format = requested_wire_format()
+
+    def generate():
+        for document in documents:
+            yield dumps(document, wire_format) + '\n'
+
+    response = Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+    if filename:
+        response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
+def _csv_cell(value):
+    if isinstance(value, (dict, list)):
+        return dumps(value)
+    value = plain_value(value)
+    return '' if value is None else value
+
+def csv_response(documents, fields, filename=None):
+    """Stream documents as CSV with the given columns, nested values as compact JSON"""
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(fields)
+        for document in documents:
+            writer.writerow([_csv_cell(document.get(field)) for field in fields])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        # Header only when there are no documents
+        if buffer.tell():
+            yield buffer.getvalue()
+
+    response = Response(stream_with_context(generate()), mimetype=CSV_MIMETYPE)
+    if filename:
+        response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
@@ -9,20 +9,20 @@ import { useNotifications } from '../contexts/NotificationContext';
 ChartJS.register(ArcElement, Tooltip, Legend, CategoryScale, LinearScale, BarElement, Title);
 
 interface User {
-  _id: { $oid: string };
+  _id: string;
   name: string;
   email: string;
   role: string;
-  created_at: { $date: string };
+  created_at: string;
 }
 
 interface Product {
-  _id: { $oid: string };
+  _id: string;
   name: string;
   category: string;
   price: number;
   stock: number;
-  seller_id: { $oid: string };
+  seller_id: string;
 }
 
 interface DashboardStats {
@@ -390,7 +390,7 @@ const AdminDashboard: React.FC<AdminDashboardProps> = ({ socket }) => {
               </thead>
               <tbody className="bg-white divide-y divide-gray-200">
                 {users.map((user) => (
-                  <tr key={user._id.$oid} className="hover:bg-gray-50">
+                  <tr key={user._id} className="hover:bg-gray-50">
                     <td className="px-6 py-4 whitespace-nowrap">
                       <div>
                         <div className="text-sm font-medium text-gray-900">{user.name}</div>
@@ -403,11 +403,11 @@ const AdminDashboard: React.FC<AdminDashboardProps> = ({ socket }) => {
                       </span>
                     </td>
                     <td className="px-6 py-4 whitespace-nowrap text-sm text-gray-500">
-                      {formatDate(user.created_at.$date)}
+                      {formatDate(user.created_at)}
                     </td>
                     <td className="px-6 py-4 whitespace-nowrap text-sm font-medium">
                       <button
-                        onClick={() => deleteUser(user._id.$oid)}
+                        onClick={() => deleteUser(user._id)}
                         className="text-red-600 hover:text-red-900 p-1 rounded-md hover:bg-red-50 transition-colors"
                       >
                         <Trash2 className="h-4 w-4" />
@@ -447,7 +447,7 @@ const AdminDashboard: React.FC<AdminDashboardProps> = ({ socket }) => {
               </thead>
               <tbody className="bg-white divide-y divide-gray-200">
                 {products.map((product) => (
-                  <tr key={product._id.$oid} className="hover:bg-gray-50">
+                  <tr key={product._id} className="hover:bg-gray-50">
                     <td className="px-6 py-4 whitespace-nowrap">
                       <div className="text-sm font-medium text-gray-900">{product.name}</div>
                     </td>
@@ -470,7 +470,7 @@ const AdminDashboard: React.FC<AdminDashboardProps> = ({ socket }) => {
                     </td>
                     <td className="px-6 py-4 whitespace-nowrap text-sm font-medium">
                       <button
-                        onClick={() => disableProduct(product._id.$oid)}
+                        onClick={() => disableProduct(product._id)}
                         className="text-red-600 hover:text-red-900 p-1 rounded-md hover:bg-red-50 transition-colors"
                       >
                         <Ban className="h-4 w-4" />
@@ -4,15 +4,15 @@ import { Socket } from 'socket.io-client';
 import { useAuth } from '../contexts/AuthContext';
 
 interface Order {
-  _id: { $oid: string };
+  _id: string;
   product_list: Array<{
-    product_id: { $oid: string };
+    product_id: string;
     quantity: number;
     price: number;
   }>;
   total_amount: number;
   status: 'placed' | 'completed' | 'cancelled';
-  timestamp: { $date: string };
+  timestamp: string;
 }
 
 interface BuyerDashboardProps {
@@ -105,17 +105,17 @@ const BuyerDashboard: React.FC<BuyerDashboardProps> = ({ socket }) => {
       ) : (
         <div className="space-y-4">
           {orders.map((order) => (
-            <div key={order._id.$oid} className="bg-white rounded-lg shadow-md">
+            <div key={order._id} className="bg-white rounded-lg shadow-md">
               <div className="p-6">
                 <div className="flex justify-between items-start mb-4">
                   <div className="flex items-center space-x-3">
                     {getStatusIcon(order.status)}
                     <div>
                       <h3 className="text-lg font-semibold text-gray-900">
-                        Order #{order._id.$oid.slice(-8)}
+                        Order #{order._id.slice(-8)}
                       </h3>
                       <p className="text-sm text-gray-500">
-                        {formatDate(order.timestamp.$date)}
+                        {formatDate(order.timestamp)}
                       </p>
                     </div>
                   </div>
@@ -136,7 +136,7 @@ const BuyerDashboard: React.FC<BuyerDashboardProps> = ({ socket }) => {
                     {order.product_list.map((item, index) => (
                       <div key={index} className="flex justify-between items-center text-sm">
                         <span className="text-gray-600">
-                          Product ID: {item.product_id.$oid.slice(-8)}
+                          Product ID: {item.product_id.slice(-8)}
                         </span>
                         <span className="text-gray-600">
                           Quantity: {item.quantity} × ${item.price.toFixed(2)}
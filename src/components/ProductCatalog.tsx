@@ -1,17 +1,35 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { Search, Filter, Plus, Minus, ShoppingCart, AlertTriangle } from 'lucide-react';
 import { Socket } from 'socket.io-client';
 import { useAuth } from '../contexts/AuthContext';
 import { useNotifications } from '../contexts/NotificationContext';
 
 interface Product {
-  _id: { $oid: string };
+  _id: string;
   name: string;
   description: string;
   price: number;
   stock: number;
   category: string;
-  seller_id: { $oid: string };
+  seller_id: string;
+}
+
+interface Suggestion {
+  _id: string;
+  name: string;
+  category: string;
+}
+
+interface Facets {
+  category: { [category: string]: number };
+  price: { [bucket: string]: number };
+}
+
+interface StockUpdate {
+  product_id: string;
+  new_stock: number;
+  product_name: string;
+  timestamp: string;
 }
 
 interface ProductCatalogProps {
@@ -20,7 +38,9 @@ interface ProductCatalogProps {
 
 const ProductCatalog: React.FC<ProductCatalogProps> = ({ socket }) => {
   const [products, setProducts] = useState<Product[]>([]);
-  const [filteredProducts, setFilteredProducts] = useState<Product[]>([]);
+  const [suggestions, setSuggestions] = useState<Suggestion[]>([]);
+  const [facets, setFacets] = useState<Facets | null>(null);
+  const [searchQuery, setSearchQuery] = useState('');
   const [cart, setCart] = useState<{ [key: string]: number }>({});
   const [categories, setCategories] = useState<string[]>([]);
   const [filters, setFilters] = useState({
@@ -30,52 +50,118 @@ const ProductCatalog: React.FC<ProductCatalogProps> = ({ socket }) => {
     maxPrice: '',
     inStock: false
   });
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const [isLoading, setIsLoading] = useState(false);
   const [isPlacingOrder, setIsPlacingOrder] = useState(false);
   
+  const productsRef = useRef<Product[]>([]);
+  // Reused when a checkout is retried so the server places the order only once
+  const orderKeyRef = useRef<string | null>(null);
+  const productIdKey = products.map(product => product._id).join(',');
+  
   const { token, user } = useAuth();
   const { addNotification } = useNotifications();
 
   useEffect(() => {
-    fetchProducts();
     fetchCategories();
   }, []);
 
   useEffect(() => {
-    // Listen for real-time stock updates
+    // A different cart is a different order
+    orderKeyRef.current = null;
+  }, [cart]);
+
+  useEffect(() => {
+    // Search and suggest once typing pauses instead of on every keystroke
+    const timer = setTimeout(() => {
+      setSearchQuery(filters.search.trim());
+      fetchSuggestions(filters.search.trim());
+    }, 250);
+    return () => clearTimeout(timer);
+  }, [filters.search]);
+
+  useEffect(() => {
+    fetchProducts();
+  }, [searchQuery, filters.category, filters.minPrice, filters.maxPrice, filters.inStock]);
+
+  useEffect(() => {
+    // Listen for batched real-time stock updates of the products in view
     if (socket) {
-      socket.on('stock_update', (data) => {
-        setProducts(prev => prev.map(product => 
-          product._id.$oid === data.product_id 
-            ? { ...product, stock: data.new_stock }
-            : product
-        ));
-        
-        addNotification({
-          type: 'info',
-          title: 'Stock Update',
-          message: `${data.product_name} stock updated to ${data.new_stock}`
-        });
+      socket.on('stock_updates', (data: { updates: StockUpdate[] }) => {
+        const latest = new Map(data.updates.map(update => [update.product_id, update]));
+        const loadedIds = new Set(productsRef.current.map(product => product._id));
+        const visible = data.updates.filter(update => loadedIds.has(update.product_id));
+
+        setProducts(prev => prev.map(product => {
+          const update = latest.get(product._id);
+          return update ? { ...product, stock: update.new_stock } : product;
+        }));
+
+        if (visible.length === 1) {
+          addNotification({
+            type: 'info',
+            title: 'Stock Update',
+            message: `${visible[0].product_name} stock updated to ${visible[0].new_stock}`
+          });
+        } else if (visible.length > 1) {
+          addNotification({
+            type: 'info',
+            title: 'Stock Update',
+            message: `Stock updated for ${visible.length} products`
+          });
+        }
       });
 
       return () => {
-        socket.off('stock_update');
+        socket.off('stock_updates');
       };
     }
   }, [socket, addNotification]);
 
   useEffect(() => {
-    applyFilters();
-  }, [products, filters]);
+    // Subscribe to the stock changes of the loaded products, again after reconnects
+    if (!socket || !productIdKey) return;
+
+    const productIds = productIdKey.split(',');
+    const subscribe = () => socket.emit('subscribe_products', { product_ids: productIds });
+
+    subscribe();
+    socket.on('connect', subscribe);
+
+    return () => {
+      socket.off('connect', subscribe);
+      socket.emit('unsubscribe_products', { product_ids: productIds });
+    };
+  }, [socket, productIdKey]);
+
+  useEffect(() => {
+    productsRef.current = products;
+  }, [products]);
 
-  const fetchProducts = async () => {
+  const fetchProducts = async (cursor: string | null = null) => {
     try {
       setIsLoading(true);
-      const response = await fetch('http://localhost/api/products/');
+      const params = new URLSearchParams();
+      if (filters.category) params.set('category', filters.category);
+      if (filters.minPrice) params.set('min_price', filters.minPrice);
+      if (filters.maxPrice) params.set('max_price', filters.maxPrice);
+      if (filters.inStock) params.set('in_stock', 'true');
+      if (cursor) params.set('cursor', cursor);
+
+      // Searches are ranked by the search index, which also returns facet counts
+      let url = `http://localhost/api/products/?${params.toString()}`;
+      if (searchQuery) {
+        params.set('q', searchQuery);
+        url = `http://localhost/api/products/search?${params.toString()}`;
+      }
+
+      const response = await fetch(url);
       const data = await response.json();
       
       if (response.ok) {
-        setProducts(data.products);
+        setProducts(prev => cursor ? [...prev, ...data.products] : data.products);
+        setNextCursor(data.next_cursor);
+        setFacets(data.facets || null);
       }
     } catch (error) {
       console.error('Error fetching products:', error);
@@ -97,33 +183,23 @@ const ProductCatalog: React.FC<ProductCatalogProps> = ({ socket }) => {
     }
   };
 
-  const applyFilters = () => {
-    let filtered = products;
-
-    if (filters.search) {
-      filtered = filtered.filter(product =>
-        product.name.toLowerCase().includes(filters.search.toLowerCase()) ||
-        product.description.toLowerCase().includes(filters.search.toLowerCase())
-      );
-    }
-
-    if (filters.category) {
-      filtered = filtered.filter(product => product.category === filters.category);
-    }
-
-    if (filters.minPrice) {
-      filtered = filtered.filter(product => product.price >= parseFloat(filters.minPrice));
+  const fetchSuggestions = async (query: string) => {
+    if (!query) {
+      setSuggestions([]);
+      return;
     }
 
-    if (filters.maxPrice) {
-      filtered = filtered.filter(product => product.price <= parseFloat(filters.maxPrice));
-    }
+    try {
+      const params = new URLSearchParams({ q: query, limit: '8' });
+      const response = await fetch(`http://localhost/api/products/suggest?${params.toString()}`);
+      const data = await response.json();
 
-    if (filters.inStock) {
-      filtered = filtered.filter(product => product.stock > 0);
+      if (response.ok) {
+        setSuggestions(data.suggestions);
+      }
+    } catch (error) {
+      console.error('Error fetching suggestions:', error);
     }
-
-    setFilteredProducts(filtered);
   };
 
   const updateCart = (productId: string, quantity: number) => {
@@ -140,7 +216,7 @@ const ProductCatalog: React.FC<ProductCatalogProps> = ({ socket }) => {
 
   const getCartTotal = () => {
     return Object.entries(cart).reduce((total, [productId, quantity]) => {
-      const product = products.find(p => p._id.$oid === productId);
+      const product = products.find(p => p._id === productId);
       return total + (product ? product.price * quantity : 0);
     }, 0);
   };
@@ -175,12 +251,14 @@ const ProductCatalog: React.FC<ProductCatalogProps> = ({ socket }) => {
         product_id: productId,
         quantity
       }));
+      orderKeyRef.current ??= crypto.randomUUID();
 
       const response = await fetch('http://localhost/api/orders/', {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
-          'Authorization': `Bearer ${token}`
+          'Authorization': `Bearer ${token}`,
+          'Idempotency-Key': orderKeyRef.current
         },
         body: JSON.stringify({ products: orderProducts })
       });
@@ -229,10 +307,16 @@ const ProductCatalog: React.FC<ProductCatalogProps> = ({ socket }) => {
             <input
               type="text"
               placeholder="Search products..."
+              list="product-suggestions"
               value={filters.search}
               onChange={(e) => setFilters(prev => ({ ...prev, search: e.target.value }))}
               className="pl-10 w-full px-3 py-2 border border-gray-300 rounded-md focus:outline-none focus:ring-2 focus:ring-blue-500"
             />
+            <datalist id="product-suggestions">
+              {suggestions.map(suggestion => (
+                <option key={suggestion._id} value={suggestion.name}>{suggestion.category}</option>
+              ))}
+            </datalist>
           </div>
           
           <select
@@ -242,7 +326,9 @@ const ProductCatalog: React.FC<ProductCatalogProps> = ({ socket }) => {
           >
             <option value="">All Categories</option>
             {categories.map(category => (
-              <option key={category} value={category}>{category}</option>
+              <option key={category} value={category}>
+                {facets ? `${category} (${facets.category[category] || 0})` : category}
+              </option>
             ))}
           </select>
           
@@ -305,8 +391,8 @@ const ProductCatalog: React.FC<ProductCatalogProps> = ({ socket }) => {
         </div>
       ) : (
         <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 xl:grid-cols-4 gap-6">
-          {filteredProducts.map((product) => (
-            <div key={product._id.$oid} className="bg-white rounded-lg shadow-md hover:shadow-lg transition-shadow">
+          {products.map((product) => (
+            <div key={product._id} className="bg-white rounded-lg shadow-md hover:shadow-lg transition-shadow">
               <div className="p-6">
                 <div className="flex justify-between items-start mb-2">
                   <h3 className="text-lg font-semibold text-gray-900 truncate">
@@ -339,16 +425,16 @@ const ProductCatalog: React.FC<ProductCatalogProps> = ({ socket }) => {
                   <div className="flex items-center justify-between">
                     <div className="flex items-center space-x-2">
                       <button
-                        onClick={() => updateCart(product._id.$oid, Math.max(0, (cart[product._id.$oid] || 0) - 1))}
+                        onClick={() => updateCart(product._id, Math.max(0, (cart[product._id] || 0) - 1))}
                         className="p-1 rounded-md bg-gray-100 hover:bg-gray-200 transition-colors"
                       >
                         <Minus className="h-4 w-4" />
                       </button>
                       <span className="w-8 text-center font-medium">
-                        {cart[product._id.$oid] || 0}
+                        {cart[product._id] || 0}
                       </span>
                       <button
-                        onClick={() => updateCart(product._id.$oid, Math.min(product.stock, (cart[product._id.$oid] || 0) + 1))}
+                        onClick={() => updateCart(product._id, Math.min(product.stock, (cart[product._id] || 0) + 1))}
                         className="p-1 rounded-md bg-gray-100 hover:bg-gray-200 transition-colors"
                       >
                         <Plus className="h-4 w-4" />
@@ -371,7 +457,18 @@ const ProductCatalog: React.FC<ProductCatalogProps> = ({ socket }) => {
         </div>
       )}
 
-      {filteredProducts.length === 0 && !isLoading && (
+      {nextCursor && !isLoading && (
+        <div className="flex justify-center mt-8">
+          <button
+            onClick={() => fetchProducts(nextCursor)}
+            className="bg-white border border-gray-300 hover:bg-gray-50 text-gray-700 px-4 py-2 rounded-md font-medium transition-colors"
+          >
+            Load More
+          </button>
+        </div>
+      )}
+
+      {products.length === 0 && !isLoading && (
         <div className="text-center py-12">
           <p className="text-gray-500 text-lg">No products found matching your criteria.</p>
         </div>
@@ -5,13 +5,13 @@ import { useAuth } from '../contexts/AuthContext';
 import { useNotifications } from '../contexts/NotificationContext';
 
 interface Product {
-  _id: { $oid: string };
+  _id: string;
   name: string;
   description: string;
   price: number;
   stock: number;
   category: string;
-  created_at: { $date: string };
+  created_at: string;
 }
 
 interface SellerDashboardProps {
@@ -53,7 +53,9 @@ const SellerDashboard: React.FC<SellerDashboardProps> = ({ socket }) => {
         addNotification({
           type: 'success',
           title: 'New Order!',
-          message: `You have a new order worth $${data.total_amount.toFixed(2)}`
+          message: data.order_count > 1
+            ? `You have ${data.order_count} new orders worth $${data.total_amount.toFixed(2)}`
+            : `You have a new order worth $${data.total_amount.toFixed(2)}`
         });
         fetchProducts(); // Refresh to update stock levels
       });
@@ -91,7 +93,7 @@ const SellerDashboard: React.FC<SellerDashboardProps> = ({ socket }) => {
     
     try {
       const url = editingProduct 
-        ? `http://localhost/api/products/${editingProduct._id.$oid}`
+        ? `http://localhost/api/products/${editingProduct._id}`
         : 'http://localhost/api/products/';
       
       const method = editingProduct ? 'PUT' : 'POST';
@@ -397,7 +399,7 @@ const SellerDashboard: React.FC<SellerDashboardProps> = ({ socket }) => {
               </thead>
               <tbody className="bg-white divide-y divide-gray-200">
                 {products.map((product) => (
-                  <tr key={product._id.$oid} className="hover:bg-gray-50">
+                  <tr key={product._id} className="hover:bg-gray-50">
                     <td className="px-6 py-4 whitespace-nowrap">
                       <div>
                         <div className="text-sm font-medium text-gray-900">
@@ -434,7 +436,7 @@ const SellerDashboard: React.FC<SellerDashboardProps> = ({ socket }) => {
                           <Edit className="h-4 w-4" />
                         </button>
                         <button
-                          onClick={() => handleDelete(product._id.$oid)}
+                          onClick={() => handleDelete(product._id)}
                           className="text-red-600 hover:text-red-900 p-1 rounded-md hover:bg-red-50 transition-colors"
                         >
                           <Trash2 className="h-4 w-4" />